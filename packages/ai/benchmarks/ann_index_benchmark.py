@@ -0,0 +1,80 @@
+"""Latency / recall benchmark for the per-project IVF index.
+
+Builds an index over synthetic clustered embeddings in a scratch directory,
+then reports build time, cold load (mmap) time, median and p99 top-k search
+latency, and recall@k against exact search with ``SimilarityMatrix``.
+
+Run from packages/ai:
+
+    python -m benchmarks.ann_index_benchmark --chunks 100000 --dimensions 1536
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+import numpy as np
+
+from services.ann_index import IVFIndex
+from services.vector_search import SimilarityMatrix
+
+def synthetic_embeddings(n: int, dimensions: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    noise = rng.standard_normal((n, dimensions)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.6 * noise
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--nlist", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.chunks, args.dimensions)
+    ids = [uuid.uuid4() for _ in range(args.chunks)]
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    path = tempfile.mkdtemp(prefix="ann-benchmark-")
+    try:
+        index = IVFIndex(path)
+        start = time.perf_counter()
+        with index.write_lock(reload=False):
+            index.rebuild(ids, vectors, args.nlist, 10)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = IVFIndex(path)
+        index.load()
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"{args.chunks} chunks x {args.dimensions} dims, {len(index.centroids)} lists: "
+              f"build {build_seconds:.1f}s, load {load_ms:.2f}ms")
+
+        exact = SimilarityMatrix(vectors)
+        truth = [set(exact.search(q, args.top_k)[0].tolist()) for q in queries]
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+        print(f"{'nprobe':>8}{'median ms':>12}{'p99 ms':>10}{f'recall@{args.top_k}':>12}")
+        for nprobe in args.nprobe:
+            for q in queries[:10]:
+                index.search(q, args.top_k, nprobe)  # warm the page cache
+
+            latencies, recall = [], 0.0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                hits = index.search(q, args.top_k, nprobe)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recall += len(expected & {position[chunk_id] for chunk_id, _ in hits}) / args.top_k
+
+            print(f"{nprobe:>8}{np.median(latencies):>12.3f}{np.percentile(latencies, 99):>10.3f}"
+                  f"{recall / len(queries):>12.3f}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
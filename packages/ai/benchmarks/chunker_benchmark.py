@@ -0,0 +1,76 @@
+"""Throughput benchmark for the streaming token-aware chunker.
+
+Builds a synthetic multi-MB corpus of paragraphs and sentences, feeds it to
+``TokenChunker`` page by page (as the ingest path does), and reports MB/s,
+chunks/s and the chunk size distribution. Runs each size twice to show
+that throughput stays flat as the corpus grows (linear time).
+
+Run from packages/ai:
+
+    python -m benchmarks.chunker_benchmark --megabytes 2 8
+"""
+import argparse
+import random
+import statistics
+import time
+
+from config.settings import Settings
+from services.chunker import TokenChunker
+from services.document_processor import clean_text
+
+_WORDS = (
+    "community housing program funding residents services annual budget "
+    "outcomes families support grant youth training health partners "
+    "evaluation capacity staff volunteers outreach equity rural urban"
+).split()
+
+def build_corpus(target_bytes: int, page_bytes: int = 3000, seed: int = 0):
+    """Return a list of page texts totalling roughly target_bytes"""
+    rng = random.Random(seed)
+    pages, page, size = [], [], 0
+    while size < target_bytes:
+        paragraph = " ".join(
+            " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 30))).capitalize() + "."
+            for _ in range(rng.randint(2, 8))
+        )
+        page.append(paragraph)
+        size += len(paragraph) + 2
+        if sum(len(p) for p in page) >= page_bytes:
+            pages.append("\n\n".join(page))
+            page = []
+    if page:
+        pages.append("\n\n".join(page))
+    return pages
+
+def run(pages, chunk_tokens: int, overlap_tokens: int, model: str):
+    chunker = TokenChunker(chunk_tokens, overlap_tokens, model)
+    start = time.perf_counter()
+    chunks = list(chunker.chunk_text((i + 1, clean_text(page)) for i, page in enumerate(pages)))
+    return time.perf_counter() - start, chunks
+
+def main():
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[2, 8])
+    parser.add_argument("--chunk-tokens", type=int, default=settings.chunk_size)
+    parser.add_argument("--overlap-tokens", type=int, default=settings.chunk_overlap)
+    args = parser.parse_args()
+
+    encoding = TokenChunker(args.chunk_tokens, args.overlap_tokens, settings.embedding_model).encoding
+    print(f"encoding: {getattr(encoding, 'name', type(encoding).__name__)}; "
+          f"chunk={args.chunk_tokens} tokens, overlap={args.overlap_tokens} tokens")
+    print(f"{'corpus MB':>10}{'seconds':>10}{'MB/s':>10}{'chunks':>10}{'chunks/s':>12}{'median tok':>12}{'max tok':>10}")
+
+    for megabytes in args.megabytes:
+        pages = build_corpus(int(megabytes * 1024 * 1024))
+        corpus_mb = sum(len(p.encode()) for p in pages) / 1024 / 1024
+        elapsed, chunks = min(
+            (run(pages, args.chunk_tokens, args.overlap_tokens, settings.embedding_model) for _ in range(2)),
+            key=lambda result: result[0]
+        )
+        token_counts = [chunk["metadata"]["token_count"] for chunk in chunks]
+        print(f"{corpus_mb:>10.1f}{elapsed:>10.2f}{corpus_mb / elapsed:>10.2f}{len(chunks):>10}"
+              f"{len(chunks) / elapsed:>12.0f}{statistics.median(token_counts):>12.0f}{max(token_counts):>10}")
+
+if __name__ == "__main__":
+    main()
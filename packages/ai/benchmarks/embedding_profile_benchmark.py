@@ -0,0 +1,141 @@
+"""Recall / memory / latency of compact embedding profiles vs. the float32 baseline.
+
+Every profile is compared against exact float32 search at full dimension
+(the current storage) and reports bytes per vector, total vector memory,
+median query latency and recall@k:
+
+- float32 / halfvec / int8 exact scans, with and without full-precision
+  rescoring of the top ``k * overfetch`` candidates
+- shortened embeddings (the text-embedding-3 ``dimensions`` parameter,
+  i.e. a truncated, re-normalized prefix), with and without rescoring
+- the IVF index in float32 and int8 + rescore
+
+Pass real embeddings (e.g. exported from document_chunks with
+``np.save``) via --embeddings for decisions; the synthetic default only
+imitates the decaying per-dimension variance of real embeddings. NumPy has
+no float16 BLAS, so halfvec latency is measured on an upcast copy and is not
+representative of pgvector's native halfvec distance (see
+benchmarks.vector_query_explain for that).
+
+Run from packages/ai:
+
+    python -m benchmarks.embedding_profile_benchmark --chunks 50000 --dims 512 256
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+import numpy as np
+
+from services.ann_index import IVFIndex
+from services.vector_search import normalize_rows, top_k_rows, int8_scales, quantize_int8
+
+def synthetic_embeddings(n: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    decay = (1.0 / np.sqrt(1.0 + np.arange(dimensions) / 32.0)).astype(np.float32)
+    centers = rng.standard_normal((max(n // 250, 8), dimensions)).astype(np.float32) * decay
+    noise = rng.standard_normal((n, dimensions)).astype(np.float32) * decay
+    return centers[rng.integers(0, len(centers), n)] + 0.7 * noise
+
+def timed_search(search, queries):
+    latencies, results = [], []
+    search(queries[0])  # warm up
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), results
+
+def recall(results, truth, k: int) -> float:
+    return float(np.mean([len(set(np.asarray(r)[:k].tolist()) & t) / k for r, t in zip(results, truth)]))
+
+def exact(scan, q, k):
+    best, _ = top_k_rows((scan @ q)[None, :], k)
+    return best[0]
+
+def rescored(scan, q_scan, full, q, k, candidates):
+    shortlist, _ = top_k_rows((scan @ q_scan)[None, :], candidates)
+    rows = np.sort(shortlist[0])
+    best, _ = top_k_rows((full[rows] @ q)[None, :], k)
+    return rows[best[0]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embeddings", help=".npy file of float32 embeddings (rows)")
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--overfetch", type=int, default=4)
+    parser.add_argument("--dims", type=int, nargs="*", default=[512, 256])
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--skip-ivf", action="store_true")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        data = np.load(args.embeddings).astype(np.float32)
+    else:
+        data = synthetic_embeddings(args.chunks + args.queries, args.dimensions)
+    corpus = normalize_rows(data[:-args.queries])
+    queries = normalize_rows(data[-args.queries:])
+    n, d = corpus.shape
+    k, candidates = args.top_k, args.top_k * args.overfetch
+
+    truth = [set(exact(corpus, q, k).tolist()) for q in queries]
+    rows = []
+
+    def profile(name, bytes_per_vector, search):
+        latency, results = timed_search(search, queries)
+        rows.append((name, bytes_per_vector, bytes_per_vector * n / 1024 / 1024, latency, recall(results, truth, k)))
+
+    profile(f"float32 d={d} (baseline)", 4 * d, lambda q: exact(corpus, q, k))
+
+    half = corpus.astype(np.float16)
+    half_scan = half.astype(np.float32)
+    profile(f"halfvec d={d}", 2 * d, lambda q: exact(half_scan, q, k))
+    profile(f"halfvec d={d} + rescore", 2 * d, lambda q: rescored(half_scan, q, corpus, q, k, candidates))
+
+    scales = int8_scales(corpus)
+    codes = quantize_int8(corpus, scales)
+    profile(f"int8 d={d}", d, lambda q: exact(codes, q * scales, k))
+    profile(f"int8 d={d} + rescore", d, lambda q: rescored(codes, q * scales, corpus, q, k, candidates))
+
+    for dims in args.dims:
+        if dims >= d:
+            continue
+        short = normalize_rows(corpus[:, :dims])
+        profile(f"float32 d={dims}", 4 * dims, lambda q: exact(short, q[:dims], k))
+        profile(f"float32 d={dims} + rescore at d={d}", 4 * dims,
+                lambda q: rescored(short, q[:dims], corpus, q, k, candidates))
+        short_scales = int8_scales(short)
+        short_codes = quantize_int8(short, short_scales)
+        profile(f"int8 d={dims} + rescore at d={d}", dims,
+                lambda q: rescored(short_codes, q[:dims] * short_scales, corpus, q, k, candidates))
+
+    if not args.skip_ivf:
+        ids = [uuid.uuid4() for _ in range(n)]
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        for quantization in (None, "int8"):
+            path = tempfile.mkdtemp(prefix="profile-benchmark-")
+            try:
+                index = IVFIndex(path, quantization)
+                with index.write_lock(reload=False):
+                    index.rebuild(ids, corpus, 0, 10)
+                rescore = candidates if quantization else 0
+
+                def search(q):
+                    return [position[chunk_id] for chunk_id, _ in index.search(q, k, args.nprobe, rescore)]
+
+                label = "IVF int8 + rescore" if quantization else "IVF float32"
+                profile(f"{label} nprobe={args.nprobe}", d if quantization else 4 * d, search)
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+    print(f"{n} vectors x {d} dims, {len(queries)} queries, recall@{k} vs exact float32\n")
+    print(f"{'profile':<40}{'bytes/vec':>10}{'memory MB':>11}{'median ms':>11}{f'recall@{k}':>11}")
+    for name, bytes_per_vector, memory, latency, hit_rate in rows:
+        print(f"{name:<40}{bytes_per_vector:>10}{memory:>11.1f}{latency:>11.3f}{hit_rate:>11.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Micro-benchmark: JSON text vs. binary pgvector codec for embeddings.
+
+Compares client-side encode/decode cost and bytes on the wire for the old
+``json.dumps(embedding)`` / ``'[...]'`` text path against the binary codec in
+``services.vector_codec``. Server-side parse cost is not measured here, but
+follows the same shape: the text path makes Postgres run ``float4in`` on every
+dimension, the binary path is a byte-swap.
+
+Run from packages/ai:
+
+    python -m benchmarks.vector_codec_benchmark --count 2000 --dim 1536
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from services.vector_codec import encode_vector, decode_vector, encode_halfvec, decode_halfvec
+
+def _time_per_item(fn, items, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    arrays = rng.standard_normal((args.count, args.dim)).astype(np.float32)
+    # OpenAI returns embeddings as Python float lists
+    lists = [row.tolist() for row in arrays]
+
+    json_payloads = [json.dumps(v) for v in lists]
+    vector_payloads = [encode_vector(v) for v in lists]
+    halfvec_payloads = [encode_halfvec(v) for v in lists]
+
+    rows = [
+        ("json text",
+         _time_per_item(json.dumps, lists, args.repeat),
+         _time_per_item(json.loads, json_payloads, args.repeat),
+         sum(len(p.encode()) for p in json_payloads) / args.count),
+        ("vector binary (list in)",
+         _time_per_item(encode_vector, lists, args.repeat),
+         _time_per_item(decode_vector, vector_payloads, args.repeat),
+         sum(len(p) for p in vector_payloads) / args.count),
+        ("vector binary (ndarray in)",
+         _time_per_item(encode_vector, arrays, args.repeat),
+         _time_per_item(decode_vector, vector_payloads, args.repeat),
+         sum(len(p) for p in vector_payloads) / args.count),
+        ("halfvec binary (ndarray in)",
+         _time_per_item(encode_halfvec, arrays, args.repeat),
+         _time_per_item(decode_halfvec, halfvec_payloads, args.repeat),
+         sum(len(p) for p in halfvec_payloads) / args.count),
+    ]
+
+    print(f"{args.count} embeddings x {args.dim} dims (best of {args.repeat})")
+    print(f"{'path':<30}{'encode us':>12}{'decode us':>12}{'bytes/vec':>12}")
+    for name, encode_us, decode_us, size in rows:
+        print(f"{name:<30}{encode_us:>12.1f}{decode_us:>12.1f}{size:>12.0f}")
+
+if __name__ == "__main__":
+    main()
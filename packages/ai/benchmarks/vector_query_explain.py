@@ -0,0 +1,140 @@
+"""EXPLAIN ANALYZE comparison of the legacy and index-friendly similarity queries.
+
+Runs both forms of the ``document_chunks`` similarity search against a live
+database and prints, for each, the plan nodes and indexes used, rows
+scanned, buffers touched and execution time. The legacy form filters on
+``1 - (embedding <=> q) > threshold``, which computes the distance for
+every row of the project; the new form is an ``ORDER BY distance LIMIT``
+that the HNSW index can drive, with the threshold applied afterwards.
+
+The query vector is taken from an existing chunk of the project (so the
+search has real neighbours). Run from packages/ai with the usual DB_* /
+DATABASE_URL environment:
+
+    python -m benchmarks.vector_query_explain --project-id <uuid> --runs 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import asyncpg
+
+from config.settings import Settings
+from services.vector_codec import register_vector_codecs
+
+LEGACY_QUERY = """
+    SELECT id, content, metadata, 1 - (embedding <=> $1::vector) as similarity
+    FROM document_chunks
+    WHERE project_id = $2
+    AND 1 - (embedding <=> $1::vector) > $3
+    ORDER BY embedding <=> $1::vector
+    LIMIT $4
+"""
+
+INDEXED_QUERY = """
+    WITH nearest AS (
+        SELECT id, content, metadata, embedding <=> $1::vector AS distance
+        FROM document_chunks
+        WHERE project_id = $2
+        ORDER BY embedding <=> $1::vector
+        LIMIT $4 * $5
+    )
+    SELECT id, content, metadata, 1 - distance as similarity
+    FROM nearest
+    WHERE 1 - distance > $3
+    ORDER BY distance
+    LIMIT $4
+"""
+
+def _walk(node, found):
+    found["nodes"].append(node["Node Type"])
+    if "Index Name" in node:
+        found["indexes"].add(node["Index Name"])
+    if node["Node Type"] in ("Seq Scan", "Index Scan", "Bitmap Heap Scan", "Index Only Scan"):
+        found["rows_scanned"] += node.get("Actual Rows", 0) * node.get("Actual Loops", 1)
+        found["rows_removed"] += node.get("Rows Removed by Filter", 0)
+    found["shared_buffers"] = max(
+        found["shared_buffers"],
+        node.get("Shared Hit Blocks", 0) + node.get("Shared Read Blocks", 0)
+    )
+    for child in node.get("Plans", []):
+        _walk(child, found)
+    return found
+
+async def explain(conn, query: str, args, search_settings):
+    async with conn.transaction():
+        for name, value in search_settings.items():
+            await conn.execute("SELECT set_config($1, $2, true)", name, str(value))
+        result = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", *args)
+    plan = json.loads(result)[0] if isinstance(result, str) else result[0]
+    found = _walk(plan["Plan"], {"nodes": [], "indexes": set(), "rows_scanned": 0, "rows_removed": 0, "shared_buffers": 0})
+    found["execution_ms"] = plan["Execution Time"]
+    found["rows_returned"] = plan["Plan"].get("Actual Rows", 0)
+    return found
+
+def report(label: str, runs):
+    last = runs[-1]
+    print(f"\n{label}")
+    print(f"  plan:            {' -> '.join(dict.fromkeys(last['nodes']))}")
+    print(f"  indexes:         {', '.join(sorted(last['indexes'])) or '(none)'}")
+    print(f"  rows scanned:    {last['rows_scanned']} (removed by filter: {last['rows_removed']})")
+    print(f"  rows returned:   {last['rows_returned']}")
+    print(f"  shared buffers:  {last['shared_buffers']}")
+    print(f"  execution ms:    median {statistics.median(r['execution_ms'] for r in runs):.2f}, "
+          f"min {min(r['execution_ms'] for r in runs):.2f}")
+
+async def main():
+    settings = Settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--project-id", help="defaults to the project with the most chunks")
+    parser.add_argument("--threshold", type=float, default=settings.similarity_threshold)
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=settings.pgvector_ef_search)
+    parser.add_argument("--iterative-scan", default=settings.pgvector_iterative_scan)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(
+        host=settings.db_host, port=settings.db_port, user=settings.db_user,
+        password=settings.db_password, database=settings.db_name
+    )
+    try:
+        await register_vector_codecs(conn)
+        project_id = args.project_id or await conn.fetchval(
+            "SELECT project_id FROM document_chunks GROUP BY project_id ORDER BY COUNT(*) DESC LIMIT 1"
+        )
+        if project_id is None:
+            raise SystemExit("document_chunks is empty; ingest some documents first")
+
+        total = await conn.fetchval("SELECT COUNT(*) FROM document_chunks")
+        in_project = await conn.fetchval("SELECT COUNT(*) FROM document_chunks WHERE project_id = $1", project_id)
+        query_embedding = await conn.fetchval(
+            "SELECT embedding FROM document_chunks WHERE project_id = $1 ORDER BY random() LIMIT 1", project_id
+        )
+        print(f"project {project_id}: {in_project} of {total} chunks")
+
+        candidates = args.max_results * settings.retrieval_overfetch
+        indexed_settings = {"hnsw.ef_search": max(args.ef_search, candidates), "plan_cache_mode": "force_custom_plan"}
+        if args.iterative_scan not in ("", "off"):
+            indexed_settings["hnsw.iterative_scan"] = args.iterative_scan
+
+        legacy, indexed = [], []
+        for _ in range(args.runs):
+            legacy.append(await explain(
+                conn, LEGACY_QUERY,
+                (query_embedding, project_id, args.threshold, args.max_results), {}
+            ))
+            indexed.append(await explain(
+                conn, INDEXED_QUERY,
+                (query_embedding, project_id, args.threshold, args.max_results, settings.retrieval_overfetch),
+                indexed_settings
+            ))
+
+        report("legacy: threshold in WHERE", legacy)
+        report(f"indexed: ORDER BY distance LIMIT {candidates}, threshold afterwards "
+               f"(ef_search={indexed_settings['hnsw.ef_search']})", indexed)
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
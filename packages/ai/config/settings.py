@@ -1,8 +1,16 @@
 import os
+import tempfile
 from typing import List, Optional
 from pydantic import BaseModel
 from urllib.parse import urlparse
 
+# Native output size of the supported OpenAI embedding models
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
 class Settings(BaseModel):
     # Database - support both individual components and full URL
     database_url: str = os.getenv("DATABASE_URL", "")
@@ -11,7 +19,16 @@ class Settings(BaseModel):
     db_user: str = os.getenv("DB_USER", "postgres")
     db_password: str = os.getenv("DB_PASSWORD", "password")
     db_name: str = os.getenv("DB_NAME", "grant_platform")
-    
+
+    # Database connection pool
+    db_pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    db_pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    db_pool_acquire_timeout: float = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+    db_pool_max_inactive_lifetime: float = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+    db_command_timeout: float = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+    db_statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+    db_statement_cache_lifetime: int = int(os.getenv("DB_STATEMENT_CACHE_LIFETIME", "3600"))
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # Parse DATABASE_URL if provided
@@ -32,29 +49,182 @@ class Settings(BaseModel):
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4")
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+    # Embedding profile. text-embedding-3 models can return shortened
+    # embeddings (0 = the model's native size); document_chunks.embedding
+    # must be declared with the resulting dimension.
+    embedding_dimensions: int = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+    # Search precision: "vector" (float32) or "halfvec" (float16 expression
+    # index) in Postgres, "none" or "int8" codes in the IVF index. With
+    # embedding_rescore the reduced-precision candidates are re-ranked against
+    # the stored float32 embeddings.
+    embedding_index_type: str = os.getenv("EMBEDDING_INDEX_TYPE", "vector")
+    ann_index_quantization: str = os.getenv("ANN_INDEX_QUANTIZATION", "none")
+    embedding_rescore: bool = os.getenv("EMBEDDING_RESCORE", "true").lower() == "true"
+
+    # Embedding batching (OpenAI caps a request at 2048 inputs / 300k tokens
+    # and each input at 8191 tokens)
+    embedding_max_input_tokens: int = int(os.getenv("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+    embedding_batch_max_tokens: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+    embedding_batch_max_inputs: int = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "512"))
+    embedding_max_concurrency: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    # Chunks accumulated from a streaming parse before an embedding batch is started
+    embedding_stream_batch_chunks: int = int(os.getenv("EMBEDDING_STREAM_BATCH_CHUNKS", "64"))
+
+    # Embedding cache (in-process LRU + embedding_cache table)
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    embedding_cache_persistent: bool = os.getenv("EMBEDDING_CACHE_PERSISTENT", "true").lower() == "true"
+    embedding_cache_max_entries: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+    embedding_cache_ttl_seconds: int = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
     
     # Redis (for caching and job queue) - optional
     redis_url: Optional[str] = os.getenv("REDIS_URL")
     
+    # Background jobs: "inline" runs them in the API process; "postgres"
+    # (processing_jobs with SKIP LOCKED) and "redis" hand them to worker.py.
+    # A running job holds a lease it renews every third of the visibility
+    # timeout; failed attempts are retried with exponential backoff.
+    job_queue_backend: str = os.getenv("JOB_QUEUE_BACKEND", "inline")
+    job_queue_redis_prefix: str = os.getenv("JOB_QUEUE_REDIS_PREFIX", "grant-ai:jobs")
+    job_visibility_timeout_seconds: int = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    job_retry_base_seconds: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+    job_retry_max_seconds: float = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+    job_worker_concurrency: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+    job_poll_interval_seconds: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+    # Job progress: published on a NOTIFY channel; processing_jobs.progress
+    # gets at most one checkpoint write per interval per job
+    job_progress_channel: str = os.getenv("JOB_PROGRESS_CHANNEL", "job_progress")
+    job_progress_write_interval_seconds: float = float(os.getenv("JOB_PROGRESS_WRITE_INTERVAL_SECONDS", "5"))
+    job_progress_queue_size: int = int(os.getenv("JOB_PROGRESS_QUEUE_SIZE", "100"))  # buffered events per subscriber
+    job_events_keepalive_seconds: float = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+    
+    # Port for worker.py's Prometheus endpoint (the API serves /metrics; 0 disables)
+    worker_metrics_port: int = int(os.getenv("WORKER_METRICS_PORT", "9101"))
+    
     # File processing
     max_file_size: int = 20 * 1024 * 1024  # 20MB
+    upload_staging_dir: str = os.getenv("UPLOAD_STAGING_DIR", os.path.join(tempfile.gettempdir(), "grant-ai-uploads"))
+    upload_read_chunk_size: int = 1024 * 1024  # 1MB
+    processed_file_preview_chars: int = 2000
+
+    # Document parsing runs in a process pool so CPU-bound PDF/pandas work
+    # never blocks the event loop (0 workers = default thread pool)
+    parser_workers: int = int(os.getenv("PARSER_WORKERS", str(min(4, os.cpu_count() or 1))))
+    parser_max_tasks_per_child: int = int(os.getenv("PARSER_MAX_TASKS_PER_CHILD", "50"))
+    parser_timeout_seconds: float = float(os.getenv("PARSER_TIMEOUT_SECONDS", "120"))
+    pdf_page_batch_size: int = int(os.getenv("PDF_PAGE_BATCH_SIZE", "8"))
     supported_file_types: List[str] = [
         "application/pdf",
         "text/csv", 
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     ]
     
-    # Chunking settings
-    chunk_size: int = 1000
-    chunk_overlap: int = 200
+    # Chunking settings (tokens of the embedding model's encoding)
+    chunk_size: int = int(os.getenv("CHUNK_SIZE_TOKENS", "256"))
+    chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+    
+    # Retrieval backend: "pgvector" (SQL nearest-neighbour search) or "ivf"
+    # (per-project in-process index under ann_index_dir). Either one falls
+    # back to the other when it is unavailable, if the IVF index is enabled.
+    retrieval_backend: str = os.getenv("RETRIEVAL_BACKEND", "pgvector")
+    # pgvector search: candidates fetched per requested result (the threshold
+    # is applied to these), HNSW / ivfflat defaults, and the pgvector >= 0.8
+    # iterative scan mode that keeps filtered searches from coming back short
+    # (e.g. "relaxed_order"; leave empty before pgvector 0.8, which rejects it)
+    retrieval_overfetch: int = int(os.getenv("RETRIEVAL_OVERFETCH", "4"))
+    pgvector_ef_search: int = int(os.getenv("PGVECTOR_EF_SEARCH", "100"))
+    pgvector_probes: int = int(os.getenv("PGVECTOR_PROBES", "10"))
+    pgvector_iterative_scan: str = os.getenv("PGVECTOR_ITERATIVE_SCAN", "")
+    # Projects with at most this many chunks are searched exactly (no HNSW),
+    # since a global index filtered by project returns them short; 0 = never
+    pgvector_exact_search_max_chunks: int = int(os.getenv("PGVECTOR_EXACT_SEARCH_MAX_CHUNKS", "10000"))
+    ann_index_enabled: bool = os.getenv("ANN_INDEX_ENABLED", "false").lower() == "true"
+    ann_index_dir: str = os.getenv("ANN_INDEX_DIR", os.path.join("data", "ann_index"))
+    ann_nlist: int = int(os.getenv("ANN_NLIST", "0"))  # 0 = 2 * sqrt(chunk count)
+    ann_nprobe: int = int(os.getenv("ANN_NPROBE", "8"))
+    ann_train_iterations: int = int(os.getenv("ANN_TRAIN_ITERATIONS", "10"))
+    ann_delta_max: int = int(os.getenv("ANN_DELTA_MAX", "2048"))
+    ann_delta_ratio: float = float(os.getenv("ANN_DELTA_RATIO", "0.1"))
+    
+    # /query response cache (in-process, keyed by projects.corpus_version).
+    # Each process re-reads a project's version at most once per version TTL,
+    # which bounds how long it serves answers from before a re-ingest
+    query_cache_enabled: bool = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    query_cache_max_entries: int = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))
+    query_cache_ttl_seconds: int = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+    query_cache_version_ttl_seconds: float = float(os.getenv("QUERY_CACHE_VERSION_TTL_SECONDS", "5"))
+    
+    # Semantic answer cache: reuse an answer when a question's embedding is
+    # within this cosine distance of a cached one and retrieval returned the
+    # same chunks
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    semantic_cache_max_distance: float = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.1"))
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))  # per project
+    semantic_cache_max_projects: int = int(os.getenv("SEMANTIC_CACHE_MAX_PROJECTS", "256"))
+    semantic_cache_ttl_seconds: int = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+    
+    # Section regeneration context: chunks retrieved for the section's query
+    # and the cache of assembled context bundles per (project, section,
+    # corpus version)
+    section_context_max_chunks: int = int(os.getenv("SECTION_CONTEXT_MAX_CHUNKS", "20"))
+    section_context_similarity_threshold: float = float(os.getenv("SECTION_CONTEXT_SIMILARITY_THRESHOLD", "0.2"))
+    section_context_cache_enabled: bool = os.getenv("SECTION_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+    section_context_cache_max_entries: int = int(os.getenv("SECTION_CONTEXT_CACHE_MAX_ENTRIES", "500"))
+    section_context_cache_ttl_seconds: int = int(os.getenv("SECTION_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    
+    # Draft generation: concurrent OpenAI calls per draft and the time limit
+    # for each generation step
+    draft_max_concurrency: int = int(os.getenv("DRAFT_MAX_CONCURRENCY", "4"))
+    draft_node_timeout_seconds: float = float(os.getenv("DRAFT_NODE_TIMEOUT_SECONDS", "90"))
+    
+    # Completion cache for the deterministic, low-temperature structured
+    # calls (in-process LRU + llm_completion_cache table); opt-in. A call
+    # site's TTL of 0 disables caching for it.
+    completion_cache_enabled: bool = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+    completion_cache_persistent: bool = os.getenv("COMPLETION_CACHE_PERSISTENT", "true").lower() == "true"
+    completion_cache_max_entries: int = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "500"))
+    completion_cache_eligibility_ttl_seconds: int = int(os.getenv("COMPLETION_CACHE_ELIGIBILITY_TTL_SECONDS", "86400"))
+    completion_cache_kpi_ttl_seconds: int = int(os.getenv("COMPLETION_CACHE_KPI_TTL_SECONDS", "86400"))
+    completion_cache_analysis_ttl_seconds: int = int(os.getenv("COMPLETION_CACHE_ANALYSIS_TTL_SECONDS", "604800"))
+    
+    # Prompt context packing: token budget for retrieved chunks (0 = per-model
+    # default) and the fraction of a chunk's word shingles already in the
+    # context above which it is dropped as a near-duplicate
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+    context_duplicate_threshold: float = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
     
     # RAG settings
     similarity_threshold: float = 0.7
     max_context_chunks: int = 10
     
-    # Rate limiting
-    requests_per_minute: int = 60
+    # Rate limiting: a token bucket per (user, endpoint) on the OpenAI-backed
+    # endpoints, refilled at requests_per_minute and holding up to
+    # rate_limit_burst requests. "memory" keeps buckets and quota counters
+    # per process, "redis" shares them between workers (needs REDIS_URL).
+    rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    rate_limit_backend: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    requests_per_minute: int = int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "60"))
+    rate_limit_burst: int = int(os.getenv("RATE_LIMIT_BURST", "10"))
+    rate_limit_max_buckets: int = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+    rate_limit_redis_prefix: str = os.getenv("RATE_LIMIT_REDIS_PREFIX", "grant-ai:ratelimit")
+    
+    # Monthly regeneration quota per user; with the memory backend each
+    # process re-reads a user's count from Postgres after this many seconds
+    regeneration_monthly_limit: int = int(os.getenv("REGENERATION_MONTHLY_LIMIT", "10"))
+    regeneration_quota_sync_seconds: int = int(os.getenv("REGENERATION_QUOTA_SYNC_SECONDS", "300"))
     
     # Compliance defaults
     default_page_limit: int = 50
     default_word_limit: int = 5000
+
+    @property
+    def supports_embedding_dimensions(self) -> bool:
+        return self.embedding_model.startswith("text-embedding-3")
+
+    @property
+    def embedding_vector_dimensions(self) -> int:
+        """Dimension of the stored embeddings for the configured profile"""
+        if self.embedding_dimensions and self.supports_embedding_dimensions:
+            return self.embedding_dimensions
+        return EMBEDDING_MODEL_DIMENSIONS.get(self.embedding_model, 1536)
@@ -1,18 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import asyncio
-import asyncpg
 import os
 import json
 import logging
-from datetime import datetime
+import math
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
 
 from services.rag_service import RAGService
 from services.embedding_service import EmbeddingService
+from services.embedding_cache import CacheStats, EmbeddingCache
 from services.document_processor import DocumentProcessor
 from services.draft_generator import DraftGenerator
+from services.database import DatabasePool
+from services.chunk_writer import ChunkBulkWriter
+from services.retrieval import RetrievalService
+from services.query_cache import QueryResultCache
+from services.semantic_cache import SemanticAnswerCache
+from services.section_context import SectionContextCache
+from services.metrics import INGEST_CHUNKS, INGEST_CHUNKS_PER_FILE, INGEST_STAGE_SECONDS, StageTimer, sample_job_queue_depth
+from services.rate_limiter import RateLimiter, RateLimitExceeded
+from services.regeneration_quota import RegenerationQuota, QuotaExceeded
+from services.job_queue import create_job_queue
+from services.job_progress import JobProgressBroker, TERMINAL_STATUSES
+from services.upload_staging import UploadStaging, StagedUpload, UploadTooLargeError
 from services.agent_orchestrator import get_orchestrator
 from models.requests import IngestRequest, DraftRequest, RegenerateRequest, QueryRequest
 from models.responses import IngestResponse, DraftResponse, QueryResponse
@@ -43,21 +60,49 @@ rag_service = RAGService()
 embedding_service = EmbeddingService()
 document_processor = DocumentProcessor()
 draft_generator = DraftGenerator()
+db_pool = DatabasePool()
+upload_staging = UploadStaging()
+retrieval_service = RetrievalService()
+query_cache = QueryResultCache()
+semantic_cache = SemanticAnswerCache()
+section_context = SectionContextCache(embedding_service, retrieval_service)
+rate_limiter = RateLimiter()
+regeneration_quota = RegenerationQuota(db_pool)
+job_progress = JobProgressBroker(db_pool)
+job_queue = create_job_queue(db_pool, job_progress)
+job_queue_starter: Optional[asyncio.Task] = None
 
-# Database connection
-async def get_db_connection():
-    return await asyncpg.connect(
-        host=settings.db_host,
-        port=settings.db_port,
-        user=settings.db_user,
-        password=settings.db_password,
-        database=settings.db_name
-    )
+async def _start_job_queue():
+    """Start the job queue once the database is reachable, retrying with backoff"""
+    delay = 1.0
+    while True:
+        try:
+            await db_pool.initialize()
+            break
+        except Exception as e:
+            logger.warning(f"Database unavailable, starting the job queue in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+    await job_queue.start()
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
+    global job_queue_starter
     logger.info("Starting Grant Writing AI Service...")
+    # The pool connects on first use if it can't now, so services are bound
+    # regardless and recover once the database is reachable
+    embedding_service.cache.bind_pool(db_pool)
+    retrieval_service.bind_pool(db_pool)
+    section_context.bind_pool(db_pool)
+    query_cache.bind_pool(db_pool)
+    rag_service.completions.bind_pool(db_pool)
+    draft_generator.completions.bind_pool(db_pool)
+    try:
+        await db_pool.initialize()
+    except Exception as e:
+        logger.warning(f"Database pool initialization failed: {e}")
+    job_queue_starter = asyncio.create_task(_start_job_queue())
     try:
         await rag_service.initialize()
         logger.info("RAG service initialized")
@@ -69,6 +114,14 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Grant Writing AI Service...")
+    if job_queue_starter is not None:
+        job_queue_starter.cancel()
+    await job_queue.stop()
+    await job_progress.close()
+    await rate_limiter.close()
+    await regeneration_quota.close()
+    document_processor.shutdown()
+    await db_pool.close()
 
 @app.get("/")
 async def root():
@@ -98,13 +151,34 @@ async def detailed_health_check():
             "rag": rag_service.is_ready(),
             "embedding": embedding_service.is_ready(),
             "document_processor": document_processor.is_ready(),
-            "draft_generator": draft_generator.is_ready()
+            "draft_generator": draft_generator.is_ready(),
+            "database": db_pool.is_ready(),
+            "ann_index": retrieval_service.ann_index.is_ready()
+        },
+        "retrieval_backend": settings.retrieval_backend,
+        "job_queue": job_queue.stats(),
+        "job_progress": job_progress.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "regeneration_quota": regeneration_quota.stats(),
+        "database_pool": db_pool.stats(),
+        "embedding_cache": embedding_service.cache.stats.as_dict(),
+        "query_cache": query_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "section_context_cache": section_context.stats(),
+        "completion_cache": {
+            **rag_service.completions.stats_by_call_site(),
+            **draft_generator.completions.stats_by_call_site()
         }
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics for this process (workers export their own, see worker.py)"""
+    await sample_job_queue_depth(db_pool)
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 @app.post("/ingest", response_model=IngestResponse)
 async def ingest_documents(
-    background_tasks: BackgroundTasks,
     job_id: str = Form(...),
     project_id: str = Form(...),
     user_id: str = Form(...),
@@ -117,143 +191,223 @@ async def ingest_documents(
     - Generate embeddings
     - Store in vector database
     """
+    await enforce_rate_limit(user_id, "ingest")
     try:
         logger.info(f"Starting document ingestion for job {job_id}")
         
-        # Update job status to processing
-        conn = await get_db_connection()
-        await conn.execute(
-            """
-            UPDATE processing_jobs 
-            SET status = 'processing', 
-                started_at = $1,
-                progress = $2
-            WHERE id = $3
-            """,
-            datetime.utcnow(),
-            json.dumps({"stage": "parsing", "percentage": 10}),
-            job_id
-        )
-        await conn.close()
+        # Spool uploads to disk; the request's upload buffers are gone once we
+        # return (workers read them from the shared staging directory)
+        staged_files = await upload_staging.stage(job_id, files)
         
-        # Start background processing
-        background_tasks.add_task(
-            process_documents_background,
-            job_id, project_id, user_id, files
-        )
+        await job_queue.enqueue(job_id, "ingest", {
+            "project_id": project_id,
+            "user_id": user_id,
+            "files": [file.model_dump() for file in staged_files]
+        })
         
         return IngestResponse(
             job_id=job_id,
-            status="processing",
-            message="Document ingestion started"
+            status="queued",
+            message="Document ingestion queued"
         )
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error starting document ingestion: {str(e)}")
+        upload_staging.cleanup(job_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_documents_background(
+async def run_ingest_job(job_id: str, payload: Dict[str, Any]):
+    await process_documents(
+        job_id, payload["project_id"], payload["user_id"],
+        [StagedUpload(**file) for file in payload["files"]]
+    )
+
+async def process_documents(
     job_id: str, 
     project_id: str, 
     user_id: str, 
-    files: List[UploadFile]
+    files: List[StagedUpload]
 ):
-    """Background task for processing documents"""
-    conn = None
-    try:
-        conn = await get_db_connection()
+    """Ingest job: parse, embed and store the staged files, then draft.
+
+    Ingest is incremental: a file whose bytes are already stored for the
+    project is not parsed again, and a re-uploaded file with the same name
+    replaces the stored one in place, keeping the chunks whose text did not
+    change and only embedding the new ones. A retry therefore skips the
+    files an earlier attempt already stored. Raises on failure so the job
+    queue can retry.
+    """
+    # Stages 1-2: Parse, chunk, embed and store one file at a time so only
+    # a single file's text and chunks are held in memory
+    processed_files = []
+    context_chunks = []
+    cache_stats = CacheStats()
+    ingest_stats = {"files_unchanged": 0, "chunks_kept": 0, "chunks_added": 0, "chunks_removed": 0}
+    stages = StageTimer(INGEST_STAGE_SECONDS)
+    
+    for index, file in enumerate(files):
+        if file.content_type not in settings.supported_file_types:
+            upload_staging.release(file)
+            continue
         
-        # Stage 1: Parse documents
-        await update_job_progress(conn, job_id, "parsing", 20)
+        stored_file = await _find_stored_file(project_id, file)
+        if stored_file is not None and stored_file["content_hash"] == file.content_hash:
+            chunks, chunk_count = await _load_stored_chunks(stored_file["id"], settings.max_context_chunks)
+            processed_files.append(_processed_file_summary(file, chunks, chunk_count))
+            context_chunks.extend(chunks[:settings.max_context_chunks - len(context_chunks)])
+            ingest_stats["files_unchanged"] += 1
+            upload_staging.release(file)
+            continue
         
-        processed_files = []
-        for file in files:
-            content = await file.read()
+        # Chunks of the previous version of this file, by content hash
+        stored_chunks = await _load_stored_chunk_hashes(stored_file["id"]) if stored_file else {}
             
-            # Process based on file type
-            if file.content_type == "application/pdf":
-                text_content = await document_processor.process_pdf(content)
-            elif file.content_type == "text/csv":
-                text_content = await document_processor.process_csv(content)
-            elif file.content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
-                text_content = await document_processor.process_xlsx(content)
-            else:
-                continue
-                
-            processed_files.append({
-                "filename": file.filename,
-                "content": text_content,
-                "file_type": file.content_type
-            })
-        
-        # Stage 2: Generate embeddings
-        await update_job_progress(conn, job_id, "embedding", 40)
-        
-        all_chunks = []
-        for file_data in processed_files:
-            # Store file record
-            file_record = await conn.fetchrow(
-                """
-                INSERT INTO files (project_id, filename, original_filename, file_type, file_size, 
-                                 s3_bucket, s3_key, uploaded_by, processing_status)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'completed')
-                RETURNING id
-                """,
-                project_id, file_data["filename"], file_data["filename"],
-                file_data["file_type"], len(file_data["content"]),
-                "local", f"temp/{job_id}/{file_data['filename']}", user_id
-            )
-            
-            # Chunk the document
-            chunks = await document_processor.chunk_document(file_data["content"])
-            
-            # Generate embeddings for chunks
-            for i, chunk in enumerate(chunks):
-                embedding = await embedding_service.generate_embedding(chunk["content"])
-                
-                await conn.execute(
-                    """
-                    INSERT INTO document_chunks (file_id, project_id, chunk_index, content, metadata, embedding)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                    """,
-                    file_record["id"], project_id, i, chunk["content"],
-                    json.dumps(chunk["metadata"]), json.dumps(embedding)
-                )
-                
-                all_chunks.append(chunk)
-        
-        # Stage 3: Generate draft using Agent Orchestrator
-        await update_job_progress(conn, job_id, "drafting", 60)
-        
-        # Use agent orchestrator for enhanced content generation
-        orchestrator = get_orchestrator(settings.openai_api_key)
-        
-        # Prepare context for agents
-        agent_context = {
-            "project_id": project_id,
-            "document_chunks": all_chunks[:10],  # Limit context size
-            "processed_files": processed_files,
-            "job_id": job_id
-        }
+        await update_job_progress(job_id, "parsing", 20 + 40 * index // len(files), stages)
         
-        # Execute full analysis workflow with multiple specialized agents
-        agent_results = await orchestrator.execute_workflow(
-            workflow_type="full_analysis",
-            context=agent_context
+        # Parse pages from the staged copy on disk and chunk them as they
+        # arrive; embedding starts while later pages are still being parsed
+        pages = document_processor.iter_document_pages(file.path, file.content_type)
+        chunks, embeddings = await embed_chunk_stream(
+            document_processor.chunk_pages(pages), cache_stats,
+            Counter({content_hash: len(rows) for content_hash, rows in stored_chunks.items()})
         )
         
-        # Generate grant data from agent results
-        grant_data = await _process_agent_results(agent_results, all_chunks, conn)
+        await update_job_progress(job_id, "embedding", 20 + 40 * (2 * index + 1) // (2 * len(files)), stages)
         
-        # Stage 4: Compliance check
-        await update_job_progress(conn, job_id, "compliance", 80)
+        # Diff against the stored version: matching chunks are kept (re-indexed
+        # if they moved), the rest are inserted, and leftovers are deleted
+        chunk_ids, new_embeddings, moved = [], [], []
+        corpus_version = None
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                if stored_file is None:
+                    file_id = await conn.fetchval(
+                        """
+                        INSERT INTO files (project_id, filename, original_filename, file_type, file_size, 
+                                         s3_bucket, s3_key, content_hash, uploaded_by, processing_status)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, 'completed')
+                        RETURNING id
+                        """,
+                        project_id, file.filename, file.filename,
+                        file.content_type, file.size,
+                        "local", f"temp/{job_id}/{file.filename}", file.content_hash, user_id
+                    )
+                else:
+                    file_id = stored_file["id"]
+                    await conn.execute(
+                        """
+                        UPDATE files
+                        SET file_type = $1, file_size = $2, s3_key = $3, content_hash = $4,
+                            processing_status = 'completed', processed_at = NOW()
+                        WHERE id = $5
+                        """,
+                        file.content_type, file.size, f"temp/{job_id}/{file.filename}",
+                        file.content_hash, file_id
+                    )
+                
+                writer = ChunkBulkWriter(file_id, project_id)
+                for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+                    matches = stored_chunks.get(chunk["content_hash"])
+                    if matches:
+                        row = matches.pop(0)
+                        if row["chunk_index"] != i or row["metadata"] != chunk["metadata"] or row["content_hash"] is None:
+                            moved.append((row["id"], i, json.dumps(chunk["metadata"]), chunk["content_hash"]))
+                        continue
+                    chunk_ids.append(writer.add(
+                        i, chunk["content"], chunk["metadata"], embedding, content_hash=chunk["content_hash"]
+                    ))
+                    new_embeddings.append(embedding)
+                
+                stale_ids = [row["id"] for rows in stored_chunks.values() for row in rows]
+                if stale_ids:
+                    await conn.execute("DELETE FROM document_chunks WHERE id = ANY($1::uuid[])", stale_ids)
+                if moved:
+                    ids, indexes, metadata, hashes = zip(*moved)
+                    await conn.execute(
+                        """
+                        UPDATE document_chunks AS c
+                        SET chunk_index = m.chunk_index, metadata = m.metadata, content_hash = m.content_hash
+                        FROM unnest($1::uuid[], $2::int[], $3::jsonb[], $4::text[])
+                            AS m(id, chunk_index, metadata, content_hash)
+                        WHERE c.id = m.id
+                        """,
+                        list(ids), list(indexes), list(metadata), list(hashes)
+                    )
+                await writer.flush(conn)
+                if chunk_ids or stale_ids or moved:
+                    # Cached section contexts and query results are keyed by this version
+                    corpus_version = await conn.fetchval(
+                        "UPDATE projects SET corpus_version = corpus_version + 1 WHERE id = $1 RETURNING corpus_version",
+                        project_id
+                    )
         
-        compliance_results = await run_compliance_checks(project_id, grant_data, conn)
-        grant_data["compliance"] = compliance_results
+        if corpus_version is not None:
+            query_cache.set_corpus_version(project_id, corpus_version)
+        await retrieval_service.remove_chunks(project_id, stale_ids)
+        await retrieval_service.index_chunks(project_id, chunk_ids, new_embeddings)
         
-        # Stage 5: Package results
-        await update_job_progress(conn, job_id, "packaging", 90)
+        ingest_stats["chunks_kept"] += len(chunks) - len(chunk_ids)
+        ingest_stats["chunks_added"] += len(chunk_ids)
+        ingest_stats["chunks_removed"] += len(stale_ids)
+        INGEST_CHUNKS_PER_FILE.observe(len(chunks))
+        INGEST_CHUNKS.labels("added").inc(len(chunk_ids))
+        INGEST_CHUNKS.labels("kept").inc(len(chunks) - len(chunk_ids))
+        INGEST_CHUNKS.labels("removed").inc(len(stale_ids))
+        if stored_file is not None:
+            logger.info(
+                f"Re-ingested {file.filename}: {len(chunks) - len(chunk_ids)} chunks kept, "
+                f"{len(chunk_ids)} added, {len(stale_ids)} removed"
+            )
         
+        # Keep only what the drafting stage needs; release the file's buffers
+        processed_files.append(_processed_file_summary(file, chunks, len(chunks)))
+        context_chunks.extend(chunks[:settings.max_context_chunks - len(context_chunks)])
+        del chunks, embeddings, new_embeddings, writer, chunk_ids, stored_chunks
+        upload_staging.release(file)
+    
+    logger.info(f"Embedding cache for job {job_id}: {cache_stats.as_dict()}, ingest: {ingest_stats}")
+    
+    # Stage 3: Generate draft using Agent Orchestrator
+    await update_job_progress(job_id, "drafting", 60, stages)
+    
+    # Use agent orchestrator for enhanced content generation
+    orchestrator = get_orchestrator(settings.openai_api_key)
+    
+    # Prepare context for agents
+    agent_context = {
+        "project_id": project_id,
+        "document_chunks": context_chunks,  # Limit context size
+        "processed_files": processed_files,
+        "job_id": job_id
+    }
+    
+    # Execute full analysis workflow with multiple specialized agents
+    agent_results = await orchestrator.execute_workflow(
+        workflow_type="full_analysis",
+        context=agent_context
+    )
+    
+    # Generate grant data from agent results
+    grant_data = await _process_agent_results(agent_results, context_chunks)
+    
+    # Stage 4: Compliance check
+    await update_job_progress(job_id, "compliance", 80, stages)
+    
+    compliance_results = await run_compliance_checks(project_id, grant_data)
+    grant_data["compliance"] = compliance_results
+    
+    # Stage 5: Package results
+    await update_job_progress(job_id, "packaging", 90, stages)
+    
+    final_progress = {
+        "stage": "completed",
+        "percentage": 100,
+        "embedding_cache": cache_stats.as_dict(),
+        "ingest": ingest_stats
+    }
+    async with db_pool.acquire() as conn:
         # Update project with generated data
         await conn.execute(
             """
@@ -277,45 +431,135 @@ async def process_documents_background(
             WHERE id = $4
             """,
             datetime.utcnow(),
-            json.dumps({"stage": "completed", "percentage": 100}),
+            json.dumps(final_progress),
             json.dumps(grant_data),
             job_id
         )
+    
+    stages.finish()
+    await job_progress.finish(job_id, "completed", final_progress)
+    upload_staging.cleanup(job_id)
+    logger.info(f"Document processing completed for job {job_id}")
+
+async def _find_stored_file(project_id: str, file: StagedUpload):
+    """The project's stored copy of an upload: same bytes if any, else the latest with its name"""
+    async with db_pool.acquire() as conn:
+        return await conn.fetchrow(
+            """
+            SELECT id, content_hash FROM files
+            WHERE project_id = $1 AND processing_status = 'completed'
+              AND (content_hash = $2 OR filename = $3)
+            ORDER BY (content_hash = $2) IS TRUE DESC, uploaded_at DESC
+            LIMIT 1
+            """,
+            project_id, file.content_hash, file.filename
+        )
+
+async def _load_stored_chunk_hashes(file_id) -> Dict[str, List[Dict[str, Any]]]:
+    """A stored file's chunks grouped by content hash, in chunk order (without embeddings)"""
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT id, chunk_index, metadata, content_hash,
+                   CASE WHEN content_hash IS NULL THEN content END AS content
+            FROM document_chunks
+            WHERE file_id = $1
+            ORDER BY chunk_index
+            """,
+            file_id
+        )
+    stored = {}
+    for row in rows:
+        # Chunks stored before hashing was added are hashed from their text
+        content_hash = row["content_hash"] or EmbeddingCache.text_hash(row["content"])
+        stored.setdefault(content_hash, []).append({
+            "id": row["id"],
+            "chunk_index": row["chunk_index"],
+            "metadata": json.loads(row["metadata"]) if isinstance(row["metadata"], str) else row["metadata"],
+            "content_hash": row["content_hash"]
+        })
+    return stored
+
+def _processed_file_summary(file: StagedUpload, chunks: List[Dict[str, Any]], chunk_count: int) -> Dict[str, Any]:
+    return {
+        "filename": file.filename,
+        "content": "\n\n".join(chunk["content"] for chunk in chunks[:3])[:settings.processed_file_preview_chars],
+        "file_type": file.content_type,
+        "chunk_count": chunk_count
+    }
+
+async def _load_stored_chunks(file_id, limit: int):
+    """First chunks of a stored file (as ingest produces them) and its chunk count"""
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT content, metadata FROM document_chunks
+            WHERE file_id = $1
+            ORDER BY chunk_index
+            LIMIT $2
+            """,
+            file_id, limit
+        )
+        count = await conn.fetchval("SELECT COUNT(*) FROM document_chunks WHERE file_id = $1", file_id)
+    chunks = [
+        {
+            "content": row["content"],
+            "metadata": json.loads(row["metadata"]) if isinstance(row["metadata"], str) else row["metadata"]
+        }
+        for row in rows
+    ]
+    return chunks, count
+
+async def embed_chunk_stream(chunk_stream, cache_stats: CacheStats, stored_hashes: Optional[Counter] = None):
+    """Consume a chunk stream, embedding full batches concurrently while it is still producing.
+
+    Returns the chunks (each with a ``content_hash``) and their embeddings in
+    stream order. Chunks already stored, per the ``stored_hashes`` counts, are
+    not embedded; their embedding is None.
+    """
+    stored_hashes = Counter(stored_hashes or ())
+    chunks = []
+    pending = []
+    positions = []
+    tasks = []
+    try:
+        async for chunk in chunk_stream:
+            chunk["content_hash"] = EmbeddingCache.text_hash(chunk["content"])
+            chunks.append(chunk)
+            if stored_hashes[chunk["content_hash"]] > 0:
+                stored_hashes[chunk["content_hash"]] -= 1
+                continue
+            pending.append(chunk["content"])
+            positions.append(len(chunks) - 1)
+            if len(pending) >= settings.embedding_stream_batch_chunks:
+                tasks.append(asyncio.create_task(
+                    embedding_service.generate_embeddings_batched(pending, cache_stats=cache_stats)
+                ))
+                pending = []
         
-        logger.info(f"Document processing completed for job {job_id}")
+        if pending:
+            tasks.append(asyncio.create_task(
+                embedding_service.generate_embeddings_batched(pending, cache_stats=cache_stats)
+            ))
         
-    except Exception as e:
-        logger.error(f"Error processing documents for job {job_id}: {str(e)}")
-        if conn:
-            await conn.execute(
-                """
-                UPDATE processing_jobs 
-                SET status = 'failed', 
-                    completed_at = $1,
-                    error_message = $2
-                WHERE id = $3
-                """,
-                datetime.utcnow(),
-                str(e),
-                job_id
-            )
-    finally:
-        if conn:
-            await conn.close()
-
-async def update_job_progress(conn, job_id: str, stage: str, percentage: int):
-    """Update job progress"""
-    await conn.execute(
-        """
-        UPDATE processing_jobs 
-        SET progress = $1
-        WHERE id = $2
-        """,
-        json.dumps({"stage": stage, "percentage": percentage}),
-        job_id
-    )
+        batches = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    embeddings = [None] * len(chunks)
+    for position, embedding in zip(positions, (embedding for batch in batches for embedding in batch)):
+        embeddings[position] = embedding
+    return chunks, embeddings
 
-async def _process_agent_results(agent_results: Dict, all_chunks: List, conn) -> Dict:
+async def update_job_progress(job_id: str, stage: str, percentage: int, timer: Optional[StageTimer] = None):
+    """Publish job progress to subscribers (the table gets throttled checkpoints)"""
+    if timer is not None:
+        timer.enter(stage)
+    await job_progress.publish(job_id, stage, percentage)
+
+async def _process_agent_results(agent_results: Dict, all_chunks: List) -> Dict:
     """Process agent results into structured grant data"""
     try:
         grant_data = {
@@ -435,7 +679,7 @@ def _generate_default_kpis():
         {"category": "Efficiency", "metric": "Cost per participant", "target": "TBD", "measurement": "Total budget divided by participants served"}
     ]
 
-async def run_compliance_checks(project_id: str, grant_data: Dict, conn) -> Dict:
+async def run_compliance_checks(project_id: str, grant_data: Dict) -> Dict:
     """Run compliance checks on the generated grant data"""
     compliance_results = {
         "pageLimit": {"current": 0, "max": 50},  # Will be calculated based on content
@@ -468,117 +712,116 @@ async def run_compliance_checks(project_id: str, grant_data: Dict, conn) -> Dict
     return compliance_results
 
 @app.post("/regenerate", response_model=DraftResponse)
-async def regenerate_section(request: RegenerateRequest, background_tasks: BackgroundTasks):
+async def regenerate_section(request: RegenerateRequest):
     """Regenerate a specific section of the grant proposal"""
+    await enforce_rate_limit(request.user_id, "regenerate")
     try:
         logger.info(f"Regenerating section {request.section} for project {request.project_id}")
         
-        # Check regeneration quota
-        conn = await get_db_connection()
-        quota_result = await conn.fetchrow(
-            "SELECT * FROM check_regeneration_quota($1::uuid)",
-            request.user_id
-        )
-        
-        if quota_result and quota_result["used"] >= quota_result["limit_val"]:
-            await conn.close()
+        # Reserve one of the month's regenerations; a user with none left is
+        # turned away without querying Postgres
+        try:
+            await regeneration_quota.acquire(request.user_id)
+        except QuotaExceeded as e:
             raise HTTPException(
                 status_code=429, 
-                detail="Regeneration quota exceeded. Please wait until next month."
+                detail="Regeneration quota exceeded. Please wait until next month.",
+                headers={"Retry-After": str(math.ceil((e.resets_at - datetime.now(timezone.utc)).total_seconds()))}
             )
         
-        # Create regeneration job
-        job = await conn.fetchrow(
-            """
-            INSERT INTO processing_jobs (project_id, user_id, job_type, status, input_data)
-            VALUES ($1, $2, 'regenerate', 'processing', $3)
-            RETURNING id
-            """,
-            request.project_id, request.user_id, 
-            json.dumps({"section": request.section, "custom_prompt": request.custom_prompt})
-        )
-        
-        # Log regeneration
-        await conn.execute(
-            """
-            INSERT INTO regeneration_log (user_id, project_id, section, job_id)
-            VALUES ($1, $2, $3, $4)
-            """,
-            request.user_id, request.project_id, request.section, job["id"]
-        )
+        try:
+            job = await _log_regeneration(request)
+        except Exception:
+            await regeneration_quota.release(request.user_id)
+            raise
         
-        await conn.close()
-        
-        # Start background regeneration
-        background_tasks.add_task(
-            regenerate_section_background,
-            job["id"], request
-        )
+        await job_queue.enqueue(job["id"], "regenerate", request.model_dump())
         
         return DraftResponse(
-            job_id=job["id"],
+            job_id=str(job["id"]),
             status="processing",
             content={request.section: "Regenerating..."}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error starting section regeneration: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def regenerate_section_background(job_id: str, request: RegenerateRequest):
-    """Background task for section regeneration"""
-    conn = None
-    try:
-        conn = await get_db_connection()
-        
+async def _log_regeneration(request: RegenerateRequest):
+    """Create the regeneration job and log it (the log insert counts toward the quota)"""
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            # Create regeneration job
+            job = await conn.fetchrow(
+                """
+                INSERT INTO processing_jobs (project_id, user_id, job_type, status, input_data)
+                VALUES ($1, $2, 'regenerate', 'queued', $3)
+                RETURNING id
+                """,
+                request.project_id, request.user_id, 
+                json.dumps({"section": request.section, "custom_prompt": request.custom_prompt})
+            )
+            
+            # Log regeneration
+            await conn.execute(
+                """
+                INSERT INTO regeneration_log (user_id, project_id, section, job_id)
+                VALUES ($1, $2, $3, $4)
+                """,
+                request.user_id, request.project_id, request.section, job["id"]
+            )
+    return job
+
+async def run_regenerate_job(job_id: str, payload: Dict[str, Any]):
+    await regenerate_section_job(job_id, RegenerateRequest(**payload))
+
+async def regenerate_section_job(job_id: str, request: RegenerateRequest):
+    """Regenerate job: rewrite one section; raises on failure so the job queue can retry"""
+    async with db_pool.acquire() as conn:
         # Get project context
         project = await conn.fetchrow(
-            "SELECT * FROM projects WHERE id = $1",
-            request.project_id
-        )
-        
-        if not project:
-            raise Exception("Project not found")
-        
-        # Get relevant document chunks
-        chunks = await conn.fetch(
-            """
-            SELECT content, metadata FROM document_chunks 
-            WHERE project_id = $1 
-            ORDER BY chunk_index 
-            LIMIT 20
-            """,
+            "SELECT grant_data, corpus_version FROM projects WHERE id = $1",
             request.project_id
         )
-        
-        # Use agent orchestrator for section regeneration
-        orchestrator = get_orchestrator(settings.openai_api_key)
-        
-        # Prepare context for agents
-        agent_context = {
-            "project_id": request.project_id,
-            "section_type": request.section,
-            "document_chunks": [{"content": chunk["content"], "metadata": json.loads(chunk["metadata"])} for chunk in chunks],
-            "custom_prompt": request.custom_prompt,
-            "existing_data": json.loads(project["grant_data"]) if project["grant_data"] else {}
-        }
-        
-        # Execute section regeneration workflow
-        agent_results = await orchestrator.execute_workflow(
-            workflow_type="section_regeneration",
-            context=agent_context,
-            section_type=request.section
-        )
-        
-        # Extract the new content from agent results
-        new_content = _extract_section_content(agent_results, request.section)
-        
-        # Update project data
-        current_data = json.loads(project["grant_data"]) if project["grant_data"] else {}
-        if "sections" not in current_data:
-            current_data["sections"] = {}
-        current_data["sections"][request.section] = new_content
-        
+    
+    if not project:
+        raise Exception("Project not found")
+    
+    # Chunks relevant to this section (cached until the project's documents change)
+    document_chunks = await section_context.get(request.project_id, request.section, project["corpus_version"])
+    existing_data = json.loads(project["grant_data"]) if project["grant_data"] else {}
+    
+    # Use agent orchestrator for section regeneration
+    orchestrator = get_orchestrator(settings.openai_api_key)
+    
+    # Prepare context for agents
+    agent_context = {
+        "project_id": request.project_id,
+        "section_type": request.section,
+        "document_chunks": document_chunks,
+        "custom_prompt": request.custom_prompt,
+        "existing_data": existing_data
+    }
+    
+    # Execute section regeneration workflow
+    agent_results = await orchestrator.execute_workflow(
+        workflow_type="section_regeneration",
+        context=agent_context,
+        section_type=request.section
+    )
+    
+    # Extract the new content from agent results
+    new_content = _extract_section_content(agent_results, request.section)
+    
+    # Update project data
+    current_data = existing_data
+    if "sections" not in current_data:
+        current_data["sections"] = {}
+    current_data["sections"][request.section] = new_content
+    
+    async with db_pool.acquire() as conn:
         await conn.execute(
             """
             UPDATE projects 
@@ -598,92 +841,250 @@ async def regenerate_section_background(job_id: str, request: RegenerateRequest)
             UPDATE processing_jobs 
             SET status = 'completed', 
                 completed_at = $1,
-                result = $2
-            WHERE id = $3
+                progress = $2,
+                result = $3
+            WHERE id = $4
             """,
             datetime.utcnow(),
+            json.dumps({"stage": "completed", "percentage": 100}),
             json.dumps({request.section: new_content}),
             job_id
         )
-        
-        logger.info(f"Section regeneration completed for job {job_id}")
-        
-    except Exception as e:
-        logger.error(f"Error regenerating section for job {job_id}: {str(e)}")
-        if conn:
-            await conn.execute(
-                """
-                UPDATE processing_jobs 
-                SET status = 'failed', 
-                    completed_at = $1,
-                    error_message = $2
-                WHERE id = $3
-                """,
-                datetime.utcnow(),
-                str(e),
-                job_id
-            )
-    finally:
-        if conn:
-            await conn.close()
+    
+    await job_progress.finish(job_id, "completed", {"stage": "completed", "percentage": 100})
+    logger.info(f"Section regeneration completed for job {job_id}")
+
+# Job types run by the queue (in this process for the inline backend, in
+# worker.py otherwise); an ingest that fails for good drops its staged uploads
+job_queue.register("ingest", run_ingest_job, on_failure=lambda job_id, payload: upload_staging.cleanup(job_id))
+job_queue.register("regenerate", run_regenerate_job)
+
+async def _retrieve_for_query(request: QueryRequest):
+    """Embed the question and fetch its most similar chunks"""
+    # Generate query embedding
+    query_embedding = await embedding_service.generate_embedding(request.query)
+    
+    # Search similar chunks (pgvector or the project's ANN index)
+    similar_chunks = await retrieval_service.search(
+        request.project_id,
+        query_embedding,
+        request.similarity_threshold,
+        request.max_results,
+        ef_search=request.ef_search,
+        probes=request.probes
+    )
+    return query_embedding, similar_chunks
+
+def _format_sources(similar_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "content": chunk["content"][:200] + "...",
+            "similarity": chunk["similarity"],
+            "metadata": chunk["metadata"]
+        }
+        for chunk in similar_chunks[:5]
+    ]
+
+async def _query_cache_key(request: QueryRequest):
+    """Cache key at the project's current corpus version; None (uncached) if it is unknown"""
+    corpus_version = await query_cache.corpus_version(request.project_id)
+    if corpus_version is None:
+        return None
+    return query_cache.key(
+        request.project_id, corpus_version, request.query, request.similarity_threshold,
+        request.max_results, request.ef_search, request.probes
+    )
 
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
     """Query documents using RAG"""
+    # Before anything else, so rejected callers never reach Postgres
+    await enforce_rate_limit(_query_caller(request), "query")
+    cache_key = await _query_cache_key(request)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        return cached.model_copy(update={"query": request.query, "cached": True})
+    
     try:
-        conn = await get_db_connection()
-        
-        # Generate query embedding
-        query_embedding = await embedding_service.generate_embedding(request.query)
-        
-        # Search similar chunks
-        similar_chunks = await conn.fetch(
-            """
-            SELECT content, metadata, 1 - (embedding <=> $1::vector) as similarity
-            FROM document_chunks 
-            WHERE project_id = $2
-            AND 1 - (embedding <=> $1::vector) > $3
-            ORDER BY embedding <=> $1::vector
-            LIMIT $4
-            """,
-            json.dumps(query_embedding),
-            request.project_id,
-            request.similarity_threshold,
-            request.max_results
-        )
+        query_embedding, similar_chunks = await _retrieve_for_query(request)
         
-        await conn.close()
-        
-        # Generate response using RAG
-        response = await rag_service.generate_response(
-            request.query,
-            [
-                {
-                    "content": chunk["content"],
-                    "metadata": json.loads(chunk["metadata"]),
-                    "similarity": float(chunk["similarity"])
-                }
-                for chunk in similar_chunks
-            ]
-        )
+        # Reuse the answer to a near-duplicate question that was given the
+        # same chunks; otherwise generate one using RAG
+        chunk_ids = [chunk["id"] for chunk in similar_chunks]
+        response = semantic_cache.lookup(request.project_id, query_embedding, chunk_ids)
+        semantic_hit = response is not None
+        if not semantic_hit:
+            usage = {}
+            response = await rag_service.generate_response(request.query, similar_chunks, usage=usage)
+            semantic_cache.store(
+                request.project_id, query_embedding, chunk_ids, response, usage.get("total_tokens", 0)
+            )
         
-        return QueryResponse(
+        result = QueryResponse(
             query=request.query,
             response=response,
-            sources=[
-                {
-                    "content": chunk["content"][:200] + "...",
-                    "similarity": float(chunk["similarity"]),
-                    "metadata": json.loads(chunk["metadata"])
-                }
-                for chunk in similar_chunks[:5]
-            ]
+            sources=_format_sources(similar_chunks),
+            cached=semantic_hit
         )
+        query_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
         logger.error(f"Error querying documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def enforce_rate_limit(caller: str, endpoint: str):
+    """429 with Retry-After when the caller's bucket for the endpoint is empty"""
+    try:
+        await rate_limiter.check(caller, endpoint)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please slow down.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+def _query_caller(request: QueryRequest) -> str:
+    # /query carries no authenticated identity, so the project is the only
+    # key a caller can't vary to get a fresh bucket
+    return f"project:{request.project_id}"
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Query documents using RAG, streaming the answer as server-sent events.
+
+    Events: ``sources`` (sent as soon as retrieval finishes), one ``token``
+    per text delta, then ``done``, or ``error`` if generation fails midway.
+    If the client disconnects, the upstream completion stream is closed.
+    """
+    await enforce_rate_limit(_query_caller(request), "query")
+    cache_key = await _query_cache_key(request)
+    cached = query_cache.get(cache_key)
+    
+    if cached is not None:
+        sources, answer, query_embedding, chunk_ids = cached.sources, cached.response, None, None
+    else:
+        # Retrieval errors still surface as a normal HTTP error
+        try:
+            query_embedding, similar_chunks = await _retrieve_for_query(request)
+        except Exception as e:
+            logger.error(f"Error querying documents: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        sources = _format_sources(similar_chunks)
+        chunk_ids = [chunk["id"] for chunk in similar_chunks]
+        answer = semantic_cache.lookup(request.project_id, query_embedding, chunk_ids)
+    
+    async def events():
+        yield _sse_event("sources", {"query": request.query, "sources": sources, "cached": answer is not None})
+        
+        if answer is not None:
+            yield _sse_event("token", {"text": answer})
+            yield _sse_event("done", {"cached": True})
+            return
+        
+        parts = []
+        usage = {}
+        tokens = rag_service.stream_response(request.query, similar_chunks, usage=usage)
+        try:
+            async for text in tokens:
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming query response: {str(e)}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+        finally:
+            # Runs on normal completion, errors and client disconnects
+            # (cancellation) alike, and closes the upstream stream
+            await tokens.aclose()
+        
+        response = "".join(parts).strip()
+        semantic_cache.store(request.project_id, query_embedding, chunk_ids, response, usage.get("total_tokens", 0))
+        query_cache.set(cache_key, QueryResponse(query=request.query, response=response, sources=sources))
+        yield _sse_event("done", {"cached": False})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream a job's progress as server-sent events.
+
+    A ``progress`` event with the stored state is sent first, then one per
+    update as the job publishes it (``status`` is processing, queued while
+    waiting for a retry, completed or failed). The stream ends once the job
+    has completed or failed (or with an ``error`` event if the job row
+    disappears). While no update arrives the stored state is re-read every
+    keepalive interval, so a lost notification can't leave the stream open;
+    comment lines keep idle connections open.
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def fetch_state():
+        async with db_pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT status, progress, error_message FROM processing_jobs WHERE id = $1",
+                job_id
+            )
+        if row is None:
+            return None
+        progress = row["progress"]
+        state = {
+            "job_id": job_id,
+            "status": row["status"],
+            "progress": json.loads(progress) if isinstance(progress, str) else progress
+        }
+        if row["error_message"]:
+            state["error"] = row["error_message"]
+        return state
+    
+    if await fetch_state() is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        async with job_progress.subscribe(job_id) as updates:
+            # Read the state again once subscribed so no update falls in between
+            state = await fetch_state()
+            if state is None:
+                # Deleted since the check above
+                yield _sse_event("error", {"job_id": job_id, "detail": "Job not found"})
+                return
+            yield _sse_event("progress", state)
+            while state["status"] not in TERMINAL_STATUSES:
+                try:
+                    state = await asyncio.wait_for(updates.get(), settings.job_events_keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # Re-read the row in case a notification was lost
+                    # (notify never raises, and the listener can drop)
+                    try:
+                        latest = await fetch_state()
+                    except Exception as e:
+                        logger.warning(f"Could not refresh state of job {job_id}: {str(e)}")
+                        latest = state
+                    if latest is None:
+                        yield _sse_event("error", {"job_id": job_id, "detail": "Job not found"})
+                        return
+                    if latest == state:
+                        yield ": keepalive\n\n"
+                        continue
+                    state = latest
+                yield _sse_event("progress", state)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -25,6 +25,8 @@ class QueryRequest(BaseModel):
     query: str
     similarity_threshold: float = 0.7
     max_results: int = 10
+    ef_search: Optional[int] = None  # HNSW search breadth (defaults to settings)
+    probes: Optional[int] = None  # ivfflat lists probed (defaults to settings)
 
 class ComplianceCheckRequest(BaseModel):
     project_id: str
@@ -18,6 +18,7 @@ class QueryResponse(BaseModel):
     response: str
     sources: List[Dict[str, Any]]
     confidence: Optional[float] = None
+    cached: bool = False  # served from the query result cache
 
 class ComplianceResponse(BaseModel):
     project_id: str
@@ -0,0 +1,680 @@
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+from config.settings import Settings
+from services.vector_search import normalize_rows, top_k_rows, int8_scales, quantize_int8
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+_ASSIGN_BATCH = 4096
+
+def _ids_to_bytes(ids: Sequence[Any]) -> np.ndarray:
+    """Pack UUIDs into an (n, 16) uint8 array (fixed width, so it can be memory-mapped)"""
+    packed = b"".join(uuid.UUID(str(chunk_id)).bytes for chunk_id in ids)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(-1, 16)
+
+def _id_keys(ids: np.ndarray) -> np.ndarray:
+    """View (n, 16) uint8 ids as n opaque 16-byte values, for set operations"""
+    return np.ascontiguousarray(ids).view(np.dtype((np.void, 16))).ravel()
+
+class _Rows:
+    """Lazy selection of rows from a (memory-mapped) array; rows are read on indexing"""
+
+    def __init__(self, data: np.ndarray, rows: np.ndarray):
+        self.data = data
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (len(self.rows),) + self.data.shape[1:]
+
+    def __getitem__(self, key):
+        return self.data[self.rows[key]]
+
+    def __array__(self, dtype=None):
+        rows = self.data[self.rows]
+        return rows if dtype is None else rows.astype(dtype)
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) for every row, computed in bounded batches"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BATCH):
+        batch = np.asarray(vectors[start:start + _ASSIGN_BATCH], dtype=np.float32)
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int, sample_size: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over a random sample of unit-length rows"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.setdiff1d(np.arange(nlist), lists)
+        if len(empty):
+            # Re-seed empty lists so every centroid stays in use
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class _Snapshot:
+    """One published version of an index: the manifest and the arrays it points to.
+
+    Built completely by ``IVFIndex.load`` and then swapped in with a single
+    assignment, so a search running alongside a writer thread sees either
+    the old version or the new one, never a mix.
+    """
+
+    __slots__ = (
+        "manifest", "version", "centroids", "offsets", "vectors", "ids",
+        "delta_vectors", "delta_ids", "codes", "scales", "deleted"
+    )
+
+    def __init__(self, manifest: Dict[str, Any], version: Optional[Tuple[int, int]] = None, **arrays: Optional[np.ndarray]):
+        self.manifest = manifest
+        self.version = version
+        for name in self.__slots__[2:]:
+            setattr(self, name, arrays.get(name))
+
+    @property
+    def count(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def delta_count(self) -> int:
+        return self.manifest["delta_count"]
+
+    @property
+    def deleted_count(self) -> int:
+        return self.manifest.get("deleted_count", 0)
+
+class IVFIndex:
+    """Inverted-file (IVF) index for one project's chunk embeddings.
+
+    Vectors are stored unit-normalized and grouped by nearest centroid, so a
+    search scores the query against the centroids, then only against the rows
+    of the ``nprobe`` closest lists. Everything lives in plain files under the
+    project directory::
+
+        manifest.json            generation, counts, dimensions (replaced atomically)
+        gen-000003/centroids.npy (nlist, d) float32
+        gen-000003/offsets.npy   (nlist + 1,) int64 row offsets of each list
+        gen-000003/vectors.npy   (n, d) float32, sorted by list
+        gen-000003/ids.npy       (n, 16) uint8 chunk UUIDs
+        gen-000003/codes.npy     (n, d) int8 scalar-quantized vectors (int8 only)
+        gen-000003/scales.npy    (d,) float32 per-dimension scales (int8 only)
+        delta-000003.f32 / .ids  rows appended since the generation was built
+        deleted-000003.rows      int64 positions of rows removed since the generation was built
+
+    Generations are immutable and opened with ``mmap_mode="r"``, so loading an
+    index after a restart costs a few ``mmap`` calls. Incremental adds are
+    appended to the delta segment (searched exhaustively) and folded into a
+    new generation by ``compact`` once it grows too large. Removed rows are
+    tombstoned the same way: searches skip them and ``compact`` drops them.
+    Tombstones name row positions (main rows first, then delta rows) rather
+    than chunk ids, so a chunk removed and later re-added under the same id
+    only hides its old row.
+
+    With ``quantization="int8"`` the lists are scanned through the int8 codes
+    (a quarter of the float32 bytes) and the best ``rescore`` candidates are
+    re-ranked against the float32 rows, which are only paged in for those
+    candidates.
+    """
+
+    def __init__(self, path: str, quantization: Optional[str] = None):
+        self.path = path
+        self.quantization = quantization  # used when writing new generations
+        self._snapshot = _Snapshot({
+            "generation": 0, "count": 0, "delta_count": 0, "deleted_count": 0, "dimensions": None
+        })
+
+    # The current version's fields, for writers (they hold the write lock, so
+    # the snapshot only changes under them when they publish) and diagnostics
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        return self._snapshot.manifest
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        return self._snapshot.centroids
+
+    @property
+    def offsets(self) -> Optional[np.ndarray]:
+        return self._snapshot.offsets
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        return self._snapshot.vectors
+
+    @property
+    def ids(self) -> Optional[np.ndarray]:
+        return self._snapshot.ids
+
+    @property
+    def delta_vectors(self) -> Optional[np.ndarray]:
+        return self._snapshot.delta_vectors
+
+    @property
+    def delta_ids(self) -> Optional[np.ndarray]:
+        return self._snapshot.delta_ids
+
+    @property
+    def deleted(self) -> Optional[np.ndarray]:
+        return self._snapshot.deleted
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.count + snapshot.delta_count
+
+    @property
+    def count(self) -> int:
+        return self._snapshot.count
+
+    @property
+    def delta_count(self) -> int:
+        return self._snapshot.delta_count
+
+    @property
+    def deleted_count(self) -> int:
+        return self._snapshot.deleted_count
+
+    def _generation_dir(self, generation: int) -> str:
+        return os.path.join(self.path, f"gen-{generation:06d}")
+
+    def _delta_paths(self, generation: int) -> Tuple[str, str]:
+        base = os.path.join(self.path, f"delta-{generation:06d}")
+        return base + ".f32", base + ".ids"
+
+    def _deleted_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"deleted-{generation:06d}.rows")
+
+    @contextmanager
+    def write_lock(self, reload: bool = True):
+        """Serialize writers across worker processes sharing the index directory"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if reload and self.is_stale():
+                    self.load()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _manifest_version(stat: os.stat_result) -> Tuple[int, int]:
+        # The manifest is replaced, never rewritten, so a new inode marks a new version
+        return stat.st_ino, stat.st_mtime_ns
+
+    def is_stale(self) -> bool:
+        """True when another process has published a newer manifest"""
+        try:
+            return self._manifest_version(os.stat(os.path.join(self.path, MANIFEST_FILE))) != self._snapshot.version
+        except FileNotFoundError:
+            return False
+
+    def load(self):
+        """Map the current generation and delta segment into memory"""
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        version = self._manifest_version(os.stat(manifest_path))
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        centroids = offsets = vectors = ids = codes = scales = None
+        if manifest["count"]:
+            generation_dir = self._generation_dir(manifest["generation"])
+            centroids = np.load(os.path.join(generation_dir, "centroids.npy"))
+            offsets = np.load(os.path.join(generation_dir, "offsets.npy"))
+            vectors = np.load(os.path.join(generation_dir, "vectors.npy"), mmap_mode="r")
+            ids = np.load(os.path.join(generation_dir, "ids.npy"), mmap_mode="r")
+            if manifest.get("quantization") == "int8":
+                codes = np.load(os.path.join(generation_dir, "codes.npy"), mmap_mode="r")
+                scales = np.load(os.path.join(generation_dir, "scales.npy"))
+
+        delta_vectors = delta_ids = None
+        if manifest["delta_count"]:
+            vectors_path, ids_path = self._delta_paths(manifest["generation"])
+            # Only the first delta_count rows are committed; bytes past that
+            # are a torn append and are ignored (and truncated by the next append)
+            delta_vectors = np.memmap(
+                vectors_path, dtype=np.float32, mode="r",
+                shape=(manifest["delta_count"], manifest["dimensions"])
+            )
+            delta_ids = np.memmap(ids_path, dtype=np.uint8, mode="r", shape=(manifest["delta_count"], 16))
+
+        deleted = None
+        if manifest.get("deleted_count"):
+            deleted = np.fromfile(
+                self._deleted_path(manifest["generation"]), dtype=np.int64, count=manifest["deleted_count"]
+            )
+
+        self._snapshot = _Snapshot(
+            manifest, version,
+            centroids=centroids, offsets=offsets, vectors=vectors, ids=ids, codes=codes, scales=scales,
+            delta_vectors=delta_vectors, delta_ids=delta_ids, deleted=deleted
+        )
+
+    def _publish(self, manifest: Dict[str, Any]):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+        self.load()
+
+    def search(self, query: Any, top_k: int, nprobe: int, rescore: int = 0) -> List[Tuple[uuid.UUID, float]]:
+        """Approximate top-k (chunk id, cosine similarity) pairs, best first.
+
+        On an int8 index, ``rescore`` > 0 re-ranks that many of the best
+        quantized candidates at full precision.
+        """
+        # Everything below reads this one version, even if a writer publishes meanwhile
+        snapshot = self._snapshot
+        if not snapshot.count + snapshot.delta_count:
+            return []
+
+        # Tombstoned rows are still in the lists; fetch enough to skip them all
+        wanted = top_k
+        top_k += snapshot.deleted_count
+
+        q = normalize_rows(query)[0]
+        scores, rows = [], []
+
+        if snapshot.count:
+            quantized = snapshot.codes is not None
+            scan, scan_query = (snapshot.codes, q * snapshot.scales) if quantized else (snapshot.vectors, q)
+            list_scores, list_rows = [], []
+            probe, _ = top_k_rows((snapshot.centroids @ q)[None, :], nprobe)
+            for list_id in probe[0]:
+                start, end = snapshot.offsets[list_id], snapshot.offsets[list_id + 1]
+                if start < end:
+                    list_scores.append(scan[start:end] @ scan_query)
+                    list_rows.append(np.arange(start, end))
+
+            if list_scores:
+                main_scores = np.concatenate(list_scores)
+                main_rows = np.concatenate(list_rows)
+                if quantized and rescore:
+                    keep, _ = top_k_rows(main_scores[None, :], max(rescore, top_k))
+                    main_rows = np.sort(main_rows[keep[0]])
+                    main_scores = snapshot.vectors[main_rows] @ q
+                scores.append(main_scores)
+                rows.append(main_rows)
+
+        if snapshot.delta_count:
+            scores.append(snapshot.delta_vectors @ q)
+            # Delta rows are numbered after the main rows
+            rows.append(np.arange(snapshot.count, snapshot.count + snapshot.delta_count))
+
+        if not scores:
+            return []
+
+        all_scores = np.concatenate(scores)
+        all_rows = np.concatenate(rows)
+        best, best_scores = top_k_rows(all_scores[None, :], top_k)
+
+        best_rows = all_rows[best[0]]
+        best_ids = np.array([
+            snapshot.ids[row] if row < snapshot.count else snapshot.delta_ids[row - snapshot.count]
+            for row in best_rows
+        ], dtype=np.uint8).reshape(-1, 16)
+        live = np.ones(len(best_ids), dtype=bool)
+        if snapshot.deleted is not None:
+            live = ~np.isin(best_rows, snapshot.deleted)
+
+        return [
+            (uuid.UUID(bytes=bytes(raw)), float(score))
+            for raw, score in zip(best_ids[live], best_scores[0][live])
+        ][:wanted]
+
+    def append(self, ids: Sequence[Any], embeddings: Any):
+        """Append rows to the delta segment. Call inside ``write_lock``."""
+        vectors = normalize_rows(embeddings)
+        packed_ids = _ids_to_bytes(ids)
+        manifest = dict(self.manifest)
+        if manifest["dimensions"] is None:
+            manifest["dimensions"] = int(vectors.shape[1])
+        elif vectors.shape[1] != manifest["dimensions"]:
+            raise ValueError(
+                f"embedding has {vectors.shape[1]} dimensions, index expects {manifest['dimensions']}"
+            )
+
+        vectors_path, ids_path = self._delta_paths(manifest["generation"])
+        for path, data, row_bytes in (
+            (vectors_path, vectors, manifest["dimensions"] * 4),
+            (ids_path, packed_ids, 16)
+        ):
+            with open(path, "ab") as f:
+                f.truncate(manifest["delta_count"] * row_bytes)
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        manifest["delta_count"] += len(vectors)
+        self._publish(manifest)
+
+    def remove(self, ids: Sequence[Any]):
+        """Tombstone the live rows of the given chunk ids. Call inside ``write_lock``."""
+        keys = _id_keys(_ids_to_bytes(ids))
+        positions = []
+        if self.count:
+            positions.append(np.flatnonzero(np.isin(_id_keys(self.ids), keys)))
+        if self.delta_count:
+            positions.append(np.flatnonzero(np.isin(_id_keys(self.delta_ids), keys)) + self.count)
+        positions = np.concatenate(positions).astype(np.int64) if positions else np.empty(0, dtype=np.int64)
+        if self.deleted is not None:
+            positions = positions[~np.isin(positions, self.deleted)]
+        if not len(positions):
+            return
+
+        manifest = dict(self.manifest)
+        deleted_count = manifest.get("deleted_count", 0)
+
+        with open(self._deleted_path(manifest["generation"]), "ab") as f:
+            f.truncate(deleted_count * 8)
+            f.write(positions.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        manifest["deleted_count"] = deleted_count + len(positions)
+        self._publish(manifest)
+
+    def needs_compaction(self, delta_max: int, delta_ratio: float) -> bool:
+        return self.delta_count + self.deleted_count > max(delta_max, delta_ratio * self.count)
+
+    def rebuild(self, ids: Sequence[Any], embeddings: Any, nlist: int, iterations: int):
+        """Replace the index contents with the given rows. Call inside ``write_lock``."""
+        vectors = normalize_rows(embeddings) if len(ids) else np.empty((0, 0), dtype=np.float32)
+        self._write_generation([(_ids_to_bytes(ids), vectors)], None, nlist, iterations)
+
+    def compact(self, nlist: int, iterations: int):
+        """Fold the delta segment into a new generation and drop tombstoned rows.
+        Call inside ``write_lock``.
+
+        Centroids are reused (only the delta rows are assigned) unless the
+        index has grown to 4x the size it was trained on, in which case they
+        are retrained.
+        """
+        sources, assignments = [], []
+        main_assignments = None
+        if self.count:
+            main_assignments = np.repeat(np.arange(len(self.centroids), dtype=np.int32), np.diff(self.offsets))
+            sources.append(self._live_rows(self.ids, self.vectors, 0, main_assignments))
+        if self.delta_count:
+            sources.append(self._live_rows(self.delta_ids, self.delta_vectors, self.count))
+
+        centroids = self.centroids
+        live_count = sum(len(ids) for ids, _, _ in sources)
+        if centroids is not None and live_count < 4 * self.manifest.get("trained_on", 0):
+            for ids, vectors, rows_assignments in sources:
+                assignments.append(rows_assignments if rows_assignments is not None else assign_lists(vectors, centroids))
+            self._write_generation(
+                [(ids, vectors) for ids, vectors, _ in sources], centroids, nlist, iterations,
+                np.concatenate(assignments) if assignments else np.empty(0, dtype=np.int32)
+            )
+        else:
+            self._write_generation([(ids, vectors) for ids, vectors, _ in sources], None, nlist, iterations)
+
+    def _live_rows(self, ids: np.ndarray, vectors: np.ndarray, first_row: int, assignments: Optional[np.ndarray] = None):
+        """A segment's rows (and list assignments) without the tombstoned ones"""
+        if self.deleted is None:
+            return ids, vectors, assignments
+        live = ~np.isin(np.arange(first_row, first_row + len(ids)), self.deleted)
+        if live.all():
+            return ids, vectors, assignments
+        rows = np.flatnonzero(live)
+        return _Rows(ids, rows), _Rows(vectors, rows), None if assignments is None else assignments[rows]
+
+    def _write_generation(
+        self,
+        sources: List[Tuple[np.ndarray, np.ndarray]],
+        centroids: Optional[np.ndarray],
+        nlist: int,
+        iterations: int,
+        assignments: Optional[np.ndarray] = None
+    ):
+        sources = [(ids, vectors) for ids, vectors in sources if len(ids)]
+        total = sum(len(ids) for ids, _ in sources)
+        generation = self.manifest["generation"] + 1
+        manifest = {
+            "generation": generation,
+            "count": total,
+            "delta_count": 0,
+            "deleted_count": 0,
+            "dimensions": int(sources[0][1].shape[1]) if sources else self.manifest["dimensions"],
+            "trained_on": self.manifest.get("trained_on", 0),
+            "quantization": self.quantization
+        }
+
+        if total:
+            if centroids is None:
+                nlist = min(nlist or max(1, int(2 * np.sqrt(total))), total)
+                training = sources[0][1] if len(sources) == 1 else np.concatenate([v for _, v in sources])
+                centroids = train_centroids(training, nlist, iterations, sample_size=max(nlist * 32, 10000))
+                manifest["trained_on"] = total
+            if assignments is None:
+                assignments = np.concatenate([assign_lists(vectors, centroids) for _, vectors in sources])
+
+            generation_dir = self._generation_dir(generation)
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            os.makedirs(generation_dir)
+
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+
+            out_vectors = np.lib.format.open_memmap(
+                os.path.join(generation_dir, "vectors.npy"), mode="w+",
+                dtype=np.float32, shape=(total, manifest["dimensions"])
+            )
+            out_ids = np.lib.format.open_memmap(
+                os.path.join(generation_dir, "ids.npy"), mode="w+", dtype=np.uint8, shape=(total, 16)
+            )
+            source_starts = np.cumsum([0] + [len(ids) for ids, _ in sources])
+            for start in range(0, total, _ASSIGN_BATCH):
+                rows = order[start:start + _ASSIGN_BATCH]
+                source_of = np.searchsorted(source_starts, rows, side="right") - 1
+                for s, (ids, vectors) in enumerate(sources):
+                    mask = source_of == s
+                    if mask.any():
+                        local = rows[mask] - source_starts[s]
+                        out_vectors[start:start + len(rows)][mask] = vectors[local]
+                        out_ids[start:start + len(rows)][mask] = ids[local]
+            out_vectors.flush()
+            out_ids.flush()
+
+            if self.quantization == "int8":
+                max_abs = np.zeros(manifest["dimensions"], dtype=np.float32)
+                for start in range(0, total, _ASSIGN_BATCH):
+                    max_abs = np.maximum(max_abs, np.max(np.abs(out_vectors[start:start + _ASSIGN_BATCH]), axis=0))
+                scales = int8_scales(max_abs[None, :])
+                codes = np.lib.format.open_memmap(
+                    os.path.join(generation_dir, "codes.npy"), mode="w+",
+                    dtype=np.int8, shape=(total, manifest["dimensions"])
+                )
+                for start in range(0, total, _ASSIGN_BATCH):
+                    codes[start:start + _ASSIGN_BATCH] = quantize_int8(out_vectors[start:start + _ASSIGN_BATCH], scales)
+                codes.flush()
+                del codes
+                np.save(os.path.join(generation_dir, "scales.npy"), scales)
+            del out_vectors, out_ids
+
+            np.save(os.path.join(generation_dir, "centroids.npy"), centroids.astype(np.float32))
+            np.save(os.path.join(generation_dir, "offsets.npy"), offsets)
+
+        self._publish(manifest)
+
+        # Readers in other processes keep their mappings of the old files valid
+        # after unlink, so earlier generations can be removed right away
+        current = {os.path.basename(self._generation_dir(generation))}
+        current.update(os.path.basename(path) for path in self._delta_paths(generation))
+        for name in os.listdir(self.path):
+            if name.startswith(("gen-", "delta-", "deleted-")) and name not in current:
+                target = os.path.join(self.path, name)
+                if os.path.isdir(target):
+                    shutil.rmtree(target, ignore_errors=True)
+                else:
+                    os.remove(target)
+
+class AnnIndexManager:
+    """Per-project IVF indexes stored under ``ann_index_dir/<project_id>``.
+
+    Indexes are opened lazily, rebuilt from ``document_chunks`` when a
+    project has none on disk, and kept current by ``add`` and ``remove`` as
+    ingest writes and deletes chunks. Builds and compactions run in a worker thread.
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.retrieval_backend == "ivf" or self.settings.ann_index_enabled
+        self.root = self.settings.ann_index_dir
+        self.db_pool = None
+        self._indexes: Dict[str, IVFIndex] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._quantization = None if self.settings.ann_index_quantization in ("", "none") else self.settings.ann_index_quantization
+
+    def bind_pool(self, db_pool):
+        self.db_pool = db_pool
+
+    def is_ready(self) -> bool:
+        return self.enabled
+
+    def _lock(self, project_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(project_id, asyncio.Lock())
+
+    def _path(self, project_id: str) -> str:
+        return os.path.join(self.root, os.path.basename(str(project_id)))
+
+    async def _get(self, project_id: str, build: bool = True) -> Optional[IVFIndex]:
+        """The project's loaded index, (re)loading or building it as needed"""
+        project_id = str(project_id)
+        index = self._indexes.get(project_id)
+        if index is not None and not index.is_stale():
+            return index
+
+        async with self._lock(project_id):
+            index = self._indexes.get(project_id)
+            if index is not None and not index.is_stale():
+                return index
+
+            path = self._path(project_id)
+            if IVFIndex.exists(path):
+                try:
+                    index = IVFIndex(path, self._quantization)
+                    index.load()
+                    self._indexes[project_id] = index
+                    return index
+                except Exception as e:
+                    logger.warning(f"ANN index for project {project_id} is unreadable, rebuilding: {str(e)}")
+
+            if not build:
+                return None
+            index = await self._build(project_id)
+            if index is not None:
+                self._indexes[project_id] = index
+            return index
+
+    async def _build(self, project_id: str) -> Optional[IVFIndex]:
+        if self.db_pool is None:
+            return None
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id, embedding FROM document_chunks WHERE project_id = $1 AND embedding IS NOT NULL",
+                project_id
+            )
+
+        ids = [row["id"] for row in rows]
+        embeddings = [
+            json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
+            for row in rows
+        ]
+        del rows
+
+        index = IVFIndex(self._path(project_id), self._quantization)
+
+        def build():
+            with index.write_lock(reload=False):
+                index.rebuild(ids, embeddings, self.settings.ann_nlist, self.settings.ann_train_iterations)
+
+        await asyncio.to_thread(build)
+        logger.info(f"Built ANN index for project {project_id} with {len(ids)} chunks")
+        return index
+
+    async def search(self, project_id: str, query_embedding: Any, top_k: int) -> Optional[List[Tuple[uuid.UUID, float]]]:
+        """Top-k (chunk id, similarity) pairs, or None when no index is available"""
+        if not self.enabled:
+            return None
+        index = await self._get(project_id)
+        if index is None:
+            return None
+        rescore = top_k * self.settings.retrieval_overfetch if self.settings.embedding_rescore else 0
+        return index.search(query_embedding, top_k, self.settings.ann_nprobe, rescore)
+
+    async def add(self, project_id: str, ids: Sequence[Any], embeddings: Any):
+        """Add freshly stored chunks; call after the rows are committed"""
+        if not self.enabled or not len(ids):
+            return
+
+        project_id = str(project_id)
+        index = await self._get(project_id, build=False)
+        if index is None:
+            # Building reads document_chunks, which already includes these rows
+            await self._get(project_id)
+            return
+
+        def append():
+            with index.write_lock():
+                index.append(ids, embeddings)
+                if index.needs_compaction(self.settings.ann_delta_max, self.settings.ann_delta_ratio):
+                    index.compact(self.settings.ann_nlist, self.settings.ann_train_iterations)
+
+        async with self._lock(project_id):
+            await asyncio.to_thread(append)
+
+    async def remove(self, project_id: str, ids: Sequence[Any]):
+        """Drop deleted chunks from the project's index; call after the delete is committed"""
+        if not self.enabled or not len(ids):
+            return
+
+        project_id = str(project_id)
+        index = await self._get(project_id, build=False)
+        if index is None:
+            return
+
+        def remove():
+            with index.write_lock():
+                index.remove(ids)
+                if index.needs_compaction(self.settings.ann_delta_max, self.settings.ann_delta_ratio):
+                    index.compact(self.settings.ann_nlist, self.settings.ann_train_iterations)
+
+        async with self._lock(project_id):
+            await asyncio.to_thread(remove)
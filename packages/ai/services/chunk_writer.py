@@ -0,0 +1,75 @@
+import asyncpg
+import json
+import uuid
+from typing import List, Dict, Any, Optional
+import logging
+from services.vector_codec import has_vector_codec, vector_literal
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLUMNS = ["id", "file_id", "project_id", "chunk_index", "content", "metadata", "content_hash", "embedding"]
+
+class ChunkBulkWriter:
+    """Buffers document_chunks rows for one file and writes them in a single round-trip.
+
+    Rows are flushed with a binary COPY, which relies on the ``vector`` codec
+    registered by ``services.vector_codec``. On a connection without that
+    codec (pgvector types missing when it was opened) the writer uses a
+    single prepared ``executemany`` that sends the embedding as text
+    instead. Call ``flush`` inside the caller's transaction so a failed file
+    leaves no partial rows behind.
+    """
+
+    def __init__(self, file_id: Any, project_id: str):
+        self.file_id = file_id
+        self.project_id = project_id
+        self.rows: List[tuple] = []
+
+    def add(
+        self,
+        chunk_index: int,
+        content: str,
+        metadata: Dict[str, Any],
+        embedding: List[float],
+        chunk_id: Optional[uuid.UUID] = None,
+        content_hash: Optional[str] = None
+    ) -> uuid.UUID:
+        """Buffer one chunk row and return its id"""
+        chunk_id = chunk_id or uuid.uuid4()
+        self.rows.append((
+            chunk_id, self.file_id, self.project_id, chunk_index,
+            content, json.dumps(metadata), content_hash, embedding
+        ))
+        return chunk_id
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    async def flush(self, conn) -> int:
+        """Write all buffered rows and clear the buffer"""
+        if not self.rows:
+            return 0
+
+        rows, self.rows = self.rows, []
+
+        if has_vector_codec(conn):
+            try:
+                # Savepoint so a rejected COPY doesn't abort the caller's transaction
+                async with conn.transaction():
+                    await conn.copy_records_to_table(
+                        "document_chunks",
+                        records=rows,
+                        columns=CHUNK_COLUMNS
+                    )
+                return len(rows)
+            except asyncpg.exceptions.InternalClientError as e:
+                logger.warning(f"COPY into document_chunks unavailable, using executemany: {str(e)}")
+
+        await conn.executemany(
+            f"""
+            INSERT INTO document_chunks ({", ".join(CHUNK_COLUMNS)})
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            """,
+            [row[:-1] + (vector_literal(row[-1]),) for row in rows]
+        )
+        return len(rows)
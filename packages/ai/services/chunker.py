@@ -0,0 +1,129 @@
+import re
+from collections import deque
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+import logging
+from services.tokenizer import get_encoding
+
+logger = logging.getLogger(__name__)
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+class _Unit:
+    """A sentence (or token window of an oversize sentence) waiting to be chunked"""
+    __slots__ = ("text", "tokens", "page", "starts_paragraph")
+
+    def __init__(self, text: str, tokens: int, page: Optional[int], starts_paragraph: bool):
+        self.text = text
+        self.tokens = tokens
+        self.page = page
+        self.starts_paragraph = starts_paragraph
+
+class TokenChunker:
+    """Streaming, token-aware chunker.
+
+    Text is fed incrementally (e.g. page by page) and split into sentence
+    units that are tokenized exactly once. Chunks are packed up to
+    ``chunk_tokens`` tokens, end on sentence boundaries, prefer to end on
+    paragraph boundaries once they are ``min_fill`` full, and start with up to
+    ``overlap_tokens`` tokens of trailing sentences from the previous chunk.
+    Every unit is appended and popped once, so chunking is linear in the
+    input size.
+    """
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, model: str, min_fill: float = 0.75):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+        self.encoding = get_encoding(model)
+
+        self._buffer: "deque[_Unit]" = deque()
+        self._buffer_tokens = 0
+        self._fresh_tokens = 0  # tokens added since the last emitted chunk
+        self._chunk_index = 0
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Add a piece of text and return the chunks it completed"""
+        chunks = []
+        for paragraph in _PARAGRAPH_SPLIT.split(text):
+            starts_paragraph = True
+            for sentence in _SENTENCE_SPLIT.split(paragraph.strip()):
+                if not sentence:
+                    continue
+                for unit in self._units(sentence, page, starts_paragraph):
+                    chunks.extend(self._add(unit))
+                starts_paragraph = False
+        return chunks
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush the final partial chunk"""
+        chunks = []
+        if self._fresh_tokens:
+            chunks.append(self._emit())
+        self._buffer.clear()
+        self._buffer_tokens = 0
+        self._fresh_tokens = 0
+        return chunks
+
+    def chunk_text(self, pages: Iterable[Tuple[Optional[int], str]]) -> Iterator[Dict[str, Any]]:
+        """Chunk an iterable of (page number, text) pairs"""
+        for page, text in pages:
+            yield from self.feed(text, page)
+        yield from self.finish()
+
+    def _units(self, sentence: str, page: Optional[int], starts_paragraph: bool) -> Iterator[_Unit]:
+        tokens = self.encoding.encode(sentence, disallowed_special=())
+        if len(tokens) <= self.chunk_tokens:
+            yield _Unit(sentence, len(tokens), page, starts_paragraph)
+            return
+
+        # A single sentence larger than a chunk is cut into token windows
+        step = self.chunk_tokens - self.overlap_tokens
+        for start in range(0, len(tokens), step):
+            window = tokens[start:start + self.chunk_tokens]
+            yield _Unit(self.encoding.decode(window).strip(), len(window), page, starts_paragraph and start == 0)
+
+    def _add(self, unit: _Unit) -> List[Dict[str, Any]]:
+        chunks = []
+        if self._fresh_tokens and (
+            self._buffer_tokens + unit.tokens > self.chunk_tokens
+            or (unit.starts_paragraph and self._buffer_tokens >= self.chunk_tokens * self.min_fill)
+        ):
+            chunks.append(self._emit())
+            self._trim_to_overlap(self.chunk_tokens - unit.tokens)
+
+        self._buffer.append(unit)
+        self._buffer_tokens += unit.tokens
+        self._fresh_tokens += unit.tokens
+        return chunks
+
+    def _trim_to_overlap(self, room: int):
+        """Keep only the trailing sentences that fit in the overlap (and leave room for the next unit)"""
+        limit = min(self.overlap_tokens, max(room, 0))
+        while self._buffer and self._buffer_tokens > limit:
+            self._buffer_tokens -= self._buffer.popleft().tokens
+        self._fresh_tokens = 0
+
+    def _emit(self) -> Dict[str, Any]:
+        parts = []
+        for i, unit in enumerate(self._buffer):
+            if i:
+                parts.append("\n\n" if unit.starts_paragraph else " ")
+            parts.append(unit.text)
+        content = "".join(parts)
+
+        pages = [unit.page for unit in self._buffer if unit.page is not None]
+        metadata = {
+            "chunk_index": self._chunk_index,
+            "token_count": self._buffer_tokens,
+            "char_count": len(content),
+            "word_count": len(content.split())
+        }
+        if pages:
+            metadata["page_start"] = pages[0]
+            metadata["page_end"] = pages[-1]
+
+        self._chunk_index += 1
+        return {"content": content, "metadata": metadata}
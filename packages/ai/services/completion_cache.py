@@ -0,0 +1,152 @@
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional
+import logging
+from config.settings import Settings
+from services.embedding_cache import CacheStats
+from services.lru_cache import TTLCache
+from services.metrics import observe_openai
+
+logger = logging.getLogger(__name__)
+
+class CompletionCache:
+    """Cache of chat completions keyed by (model, messages, temperature, max_tokens).
+
+    Only meant for the low-temperature structured calls (eligibility, KPIs,
+    document analysis) that are re-run on identical context whenever a
+    project is re-drafted. Like the embedding cache it has an in-process LRU
+    in front of a Postgres table (``llm_completion_cache``); each call site
+    passes its own TTL, and a TTL of 0 disables caching for it. Hit ratios
+    are tracked per call site. Cache failures are logged and treated as
+    misses; they never fail the completion.
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.completion_cache_enabled
+        self.memory = TTLCache(self.settings.completion_cache_max_entries, 0)
+        self.db_pool = None
+        self.stats: Dict[str, CacheStats] = {}
+        self.bypassed: Dict[str, int] = {}
+
+    def bind_pool(self, db_pool):
+        """Enable the persistent Postgres tier"""
+        if self.settings.completion_cache_persistent:
+            self.db_pool = db_pool
+
+    @staticmethod
+    def cache_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def complete(
+        self,
+        client,
+        call_site: str,
+        ttl_seconds: int,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        bypass: bool = False,
+        validate: Optional[Callable[[str], Any]] = None
+    ) -> str:
+        """Return the completion text, from the cache when possible.
+
+        ``bypass`` skips the lookup (e.g. for a user-requested regeneration)
+        but still stores the fresh result. ``validate`` is called on fresh
+        completions; if it raises, the text is returned without being cached
+        so a malformed answer is not replayed for the whole TTL.
+        """
+        caching = self.enabled and ttl_seconds > 0
+        key = self.cache_key(model, messages, temperature, max_tokens) if caching else None
+
+        if caching and bypass:
+            self.bypassed[call_site] = self.bypassed.get(call_site, 0) + 1
+        elif caching:
+            cached = await self._get(call_site, key)
+            if cached is not None:
+                return cached
+
+        with observe_openai(call_site, model) as call:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            call.record_usage(response.usage)
+        content = response.choices[0].message.content.strip()
+
+        if caching:
+            try:
+                if validate is not None:
+                    validate(content)
+            except Exception:
+                return content
+            await self._put(call_site, key, model, content, ttl_seconds)
+        return content
+
+    async def _get(self, call_site: str, key: str) -> Optional[str]:
+        stats = self.stats.setdefault(call_site, CacheStats())
+
+        cached = self.memory.get(key)
+        if cached is not None:
+            stats.record(memory_hits=1)
+            return cached
+
+        if self.db_pool is not None:
+            try:
+                async with self.db_pool.acquire() as conn:
+                    row = await conn.fetchrow(
+                        """
+                        SELECT completion, EXTRACT(EPOCH FROM expires_at - NOW()) AS remaining
+                        FROM llm_completion_cache
+                        WHERE cache_key = $1 AND expires_at > NOW()
+                        """,
+                        key
+                    )
+                if row is not None:
+                    self.memory.set(key, row["completion"], float(row["remaining"]))
+                    stats.record(db_hits=1)
+                    return row["completion"]
+            except Exception as e:
+                logger.warning(f"Completion cache lookup failed: {str(e)}")
+
+        stats.record(misses=1)
+        return None
+
+    async def _put(self, call_site: str, key: str, model: str, completion: str, ttl_seconds: int):
+        self.memory.set(key, completion, ttl_seconds)
+        if self.db_pool is None:
+            return
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO llm_completion_cache (cache_key, call_site, model, completion, expires_at)
+                    VALUES ($1, $2, $3, $4, NOW() + make_interval(secs => $5))
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET completion = EXCLUDED.completion,
+                        created_at = NOW(),
+                        expires_at = EXCLUDED.expires_at
+                    """,
+                    key, call_site, model, completion, float(ttl_seconds)
+                )
+        except Exception as e:
+            logger.warning(f"Completion cache write failed: {str(e)}")
+
+    def stats_by_call_site(self) -> Dict[str, Dict[str, Any]]:
+        call_sites = sorted(set(self.stats) | set(self.bypassed))
+        return {
+            call_site: {
+                **self.stats.get(call_site, CacheStats()).as_dict(),
+                "bypassed": self.bypassed.get(call_site, 0)
+            }
+            for call_site in call_sites
+        }
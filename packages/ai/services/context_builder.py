@@ -0,0 +1,138 @@
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Set
+import logging
+from config.settings import Settings
+from services.tokenizer import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens of retrieved context per prompt, by model prefix (longest match
+# wins). Leaves room in the model's window for instructions and the
+# completion: e.g. gpt-4's 8k window also carries up to 2k completion tokens.
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o": 4000,
+    "gpt-4-turbo": 4000,
+    "gpt-4-32k": 4000,
+    "gpt-4": 2000,
+    "gpt-3.5-turbo": 2000,
+}
+_DEFAULT_CONTEXT_TOKEN_BUDGET = 2000
+
+_SHINGLE_WORDS = 5
+# Shortest run of words shared with an already selected chunk that is cut
+# from a candidate (the chunker overlaps neighbours by a few sentences)
+_MIN_OVERLAP_WORDS = 8
+_SEPARATOR = "\n\n"
+_word_pattern = re.compile(r"\S+")
+
+class ContextBuilder:
+    """Packs retrieved chunks into a prompt context under a token budget.
+
+    Chunks are taken in order of relevance (``similarity`` when present,
+    otherwise as given). A chunk whose word shingles are mostly contained in
+    already selected chunks is dropped as a near-duplicate, and text it
+    shares with a neighbouring selected chunk (the chunker's overlap) is cut
+    off. The rest are added greedily while they fit the budget, counted in
+    the model's real tokens.
+    """
+
+    def __init__(self, model: str, max_tokens: Optional[int] = None):
+        self.settings = Settings()
+        self.model = model
+        self.max_tokens = max_tokens or self.settings.context_max_tokens or self.default_budget(model)
+        self.duplicate_threshold = self.settings.context_duplicate_threshold
+
+    @staticmethod
+    def default_budget(model: str) -> int:
+        matches = [prefix for prefix in CONTEXT_TOKEN_BUDGETS if model.startswith(prefix)]
+        if not matches:
+            return _DEFAULT_CONTEXT_TOKEN_BUDGET
+        return CONTEXT_TOKEN_BUDGETS[max(matches, key=len)]
+
+    def build(self, chunks: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> str:
+        """Context string for a prompt (at most ``max_tokens`` or the model budget)"""
+        return _SEPARATOR.join(self.select(chunks, max_tokens))
+
+    def select(self, chunks: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> List[str]:
+        """Chunk texts chosen for the context, most relevant first"""
+        budget = max_tokens or self.max_tokens
+        separator_tokens = count_tokens(_SEPARATOR, self.model)
+        ranked = sorted(chunks, key=lambda chunk: chunk.get("similarity", 0), reverse=True)
+
+        texts: List[str] = []
+        selected: List[List[str]] = []
+        seen: Set[int] = set()
+        used = 0
+        dropped = 0
+
+        for chunk in ranked:
+            content = (chunk.get("content") or "").strip()
+            spans = [match.span() for match in _word_pattern.finditer(content)]
+            if not spans:
+                continue
+            words = [content[start:end] for start, end in spans]
+
+            shingles = self._shingles(words)
+            if len(shingles & seen) >= self.duplicate_threshold * len(shingles):
+                dropped += 1
+                continue
+
+            start, end = self._trim_overlap(words, selected)
+            if start >= end:
+                dropped += 1
+                continue
+            text = content[spans[start][0]:spans[end - 1][1]]
+
+            cost = count_tokens(text, self.model) + (separator_tokens if texts else 0)
+            if used + cost > budget:
+                if texts:
+                    continue
+                # Never return an empty context because the best chunk is too long
+                text = truncate_to_tokens(text, budget, self.model)
+                cost = budget
+
+            texts.append(text)
+            selected.append(words)
+            seen |= shingles
+            used += cost
+            if budget - used <= separator_tokens:
+                break
+
+        logger.debug(f"Context: {len(texts)} of {len(chunks)} chunks, {used}/{budget} tokens, {dropped} duplicates dropped")
+        return texts
+
+    @staticmethod
+    def _shingles(words: List[str]) -> Set[int]:
+        normalized = [word.lower() for word in words]
+        if len(normalized) < _SHINGLE_WORDS:
+            return {zlib.crc32(" ".join(normalized).encode("utf-8"))}
+        return {
+            zlib.crc32(" ".join(normalized[i:i + _SHINGLE_WORDS]).encode("utf-8"))
+            for i in range(len(normalized) - _SHINGLE_WORDS + 1)
+        }
+
+    @staticmethod
+    def _trim_overlap(words: List[str], selected: List[List[str]]):
+        """Word range of a chunk left after cutting text shared with a neighbour.
+
+        Removes a prefix that repeats the end of a selected chunk (the chunk
+        follows it) and a suffix that repeats the start of one (it precedes it).
+        """
+        start, end = 0, len(words)
+        for chunk_words in selected:
+            start += _shared_run(chunk_words, words[start:end])
+            shared = _shared_run(words[start:end], chunk_words)
+            if shared:
+                end -= shared
+        return start, end
+
+def _shared_run(first: List[str], second: List[str]) -> int:
+    """Length of the longest run of words that ends ``first`` and starts ``second``"""
+    if not first or not second:
+        return 0
+    head = second[0]
+    for n in range(min(len(first), len(second)), _MIN_OVERLAP_WORDS - 1, -1):
+        if first[-n] == head and first[-n:] == second[:n]:
+            return n
+    return 0
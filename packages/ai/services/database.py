@@ -0,0 +1,118 @@
+import asyncio
+import asyncpg
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+import logging
+from config.settings import Settings
+from services.vector_codec import register_vector_codecs
+from services.metrics import observe_db_query
+
+logger = logging.getLogger(__name__)
+
+async def _init_connection(conn):
+    await register_vector_codecs(conn)
+    # Statement latency metrics, timed by asyncpg itself
+    conn.add_query_logger(observe_db_query)
+
+class DatabasePool:
+    """Process-wide asyncpg connection pool shared by handlers and background jobs"""
+
+    def __init__(self):
+        self.settings = Settings()
+        self.pool: Optional[asyncpg.Pool] = None
+        self._init_lock = asyncio.Lock()
+        self._waiting = 0
+        self._acquired_total = 0
+        self._wait_time_total = 0.0
+        self._max_wait_time = 0.0
+
+    async def initialize(self):
+        """Create the pool; called from the startup hook and, if that failed, on first use"""
+        async with self._init_lock:
+            if self.pool is None:
+                await self._create_pool()
+
+    async def _create_pool(self):
+        self.pool = await asyncpg.create_pool(
+            host=self.settings.db_host,
+            port=self.settings.db_port,
+            user=self.settings.db_user,
+            password=self.settings.db_password,
+            database=self.settings.db_name,
+            min_size=self.settings.db_pool_min_size,
+            max_size=self.settings.db_pool_max_size,
+            max_inactive_connection_lifetime=self.settings.db_pool_max_inactive_lifetime,
+            command_timeout=self.settings.db_command_timeout,
+            # Connecting also happens lazily on a request path (when the
+            # database was down at startup), so don't wait asyncpg's 60s default
+            timeout=self.settings.db_pool_acquire_timeout,
+            # asyncpg keeps a per-connection LRU of prepared statements keyed by
+            # query text, so the hot document_chunks / processing_jobs statements
+            # are parsed and planned once per pooled connection instead of per call.
+            statement_cache_size=self.settings.db_statement_cache_size,
+            max_cached_statement_lifetime=self.settings.db_statement_cache_lifetime,
+            # Send/receive embeddings as packed binary floats instead of JSON text
+            init=_init_connection
+        )
+        logger.info(
+            f"Database pool initialized (min={self.settings.db_pool_min_size}, "
+            f"max={self.settings.db_pool_max_size})"
+        )
+
+    async def close(self):
+        """Close all pooled connections; called from the shutdown hook"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Database pool closed")
+
+    def is_ready(self) -> bool:
+        return self.pool is not None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a connection from the pool for the duration of the block"""
+        if self.pool is None:
+            await self.initialize()
+
+        self._waiting += 1
+        start = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=self.settings.db_pool_acquire_timeout)
+        finally:
+            self._waiting -= 1
+
+        waited = time.perf_counter() - start
+        self._acquired_total += 1
+        self._wait_time_total += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool saturation stats for the detailed health check"""
+        if self.pool is None:
+            return {"initialized": False}
+
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        max_size = self.pool.get_max_size()
+        in_use = size - idle
+
+        return {
+            "initialized": True,
+            "min_size": self.pool.get_min_size(),
+            "max_size": max_size,
+            "size": size,
+            "idle": idle,
+            "in_use": in_use,
+            "waiting": self._waiting,
+            "saturation": round(in_use / max_size, 3) if max_size else 0.0,
+            "acquired_total": self._acquired_total,
+            "avg_wait_ms": round(self._wait_time_total / self._acquired_total * 1000, 3) if self._acquired_total else 0.0,
+            "max_wait_ms": round(self._max_wait_time * 1000, 3)
+        }
@@ -1,190 +1,286 @@
+import asyncio
 import io
+import multiprocessing
 import pandas as pd
 import PyPDF2
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, AsyncIterator, Callable, Optional, Tuple, Union
 import logging
 import re
+from config.settings import Settings
+from services.chunker import TokenChunker
 
 logger = logging.getLogger(__name__)
 
+@contextmanager
+def _open_source(source: Union[bytes, str]):
+    """Yield a binary stream over in-memory bytes or a file on disk.
+
+    File paths are read incrementally by the parsers rather than loaded
+    into memory up front.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as stream:
+            yield stream
+    else:
+        yield io.BytesIO(source)
+
+def clean_text(text: str) -> str:
+    """Clean and normalize text, keeping paragraph breaks (blank lines) intact"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    # Remove special characters but keep punctuation
+    text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\"\'\/]', '', text)
+
+    # Collapse horizontal whitespace and normalize paragraph breaks
+    text = re.sub(r'[^\S\n]+', ' ', text)
+    text = re.sub(r' ?\n ?', '\n', text)
+    text = re.sub(r'\n{2,}', '\n\n', text)
+
+    # Fix common PDF extraction issues: single line breaks are just wrapping
+    text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)
+
+    return text.strip()
+
+def extract_pdf_text(source: Union[bytes, str]) -> str:
+    """Extract text from PDF bytes or a file path"""
+    try:
+        with _open_source(source) as stream:
+            pdf_reader = PyPDF2.PdfReader(stream)
+            text = "\n".join(page.extract_text() for page in pdf_reader.pages)
+
+        return clean_text(text)
+    except Exception as e:
+        logger.error(f"Error processing PDF: {str(e)}")
+        raise
+
+def count_pdf_pages(source: Union[bytes, str]) -> int:
+    """Number of pages in a PDF"""
+    with _open_source(source) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+def extract_pdf_pages(source: Union[bytes, str], start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract cleaned text for pages [start, end) as (1-based page number, text) pairs"""
+    try:
+        with _open_source(source) as stream:
+            pdf_reader = PyPDF2.PdfReader(stream)
+            return [
+                (page_number + 1, clean_text(pdf_reader.pages[page_number].extract_text()))
+                for page_number in range(start, end)
+            ]
+    except Exception as e:
+        logger.error(f"Error processing PDF pages {start}-{end}: {str(e)}")
+        raise
+
+def extract_csv_text(source: Union[bytes, str]) -> str:
+    """Extract text from CSV bytes or a file path"""
+    try:
+        with _open_source(source) as stream:
+            df = pd.read_csv(stream)
+
+        # Convert DataFrame to readable text format
+        text = f"CSV Data Summary:\n"
+        text += f"Columns: {', '.join(df.columns.tolist())}\n"
+        text += f"Rows: {len(df)}\n\n"
+
+        # Add column descriptions if available
+        for col in df.columns:
+            text += f"{col}:\n"
+
+            # Show data types and sample values
+            dtype = str(df[col].dtype)
+            text += f"  Data type: {dtype}\n"
+
+            if df[col].dtype == 'object':
+                unique_values = df[col].dropna().unique()[:10]
+                text += f"  Sample values: {', '.join(map(str, unique_values))}\n"
+            else:
+                stats = df[col].describe()
+                text += f"  Range: {stats['min']} to {stats['max']}\n"
+                text += f"  Mean: {stats['mean']:.2f}\n"
+
+            text += "\n"
+
+        # Add first few rows as context
+        text += "Sample data:\n"
+        text += df.head(5).to_string(index=False)
+
+        return text
+    except Exception as e:
+        logger.error(f"Error processing CSV: {str(e)}")
+        raise
+
+def extract_xlsx_text(source: Union[bytes, str]) -> str:
+    """Extract text from Excel bytes or a file path"""
+    try:
+        # Read all sheets
+        excel_file = pd.ExcelFile(source if isinstance(source, str) else io.BytesIO(source))
+        text = f"Excel File with {len(excel_file.sheet_names)} sheets:\n\n"
+
+        for sheet_name in excel_file.sheet_names:
+            df = pd.read_excel(excel_file, sheet_name=sheet_name)
+
+            text += f"Sheet: {sheet_name}\n"
+            text += f"Columns: {', '.join(df.columns.tolist())}\n"
+            text += f"Rows: {len(df)}\n\n"
+
+            # Add column descriptions
+            for col in df.columns:
+                if df[col].dtype == 'object':
+                    unique_values = df[col].dropna().unique()[:5]
+                    text += f"  {col}: {', '.join(map(str, unique_values))}\n"
+                else:
+                    try:
+                        stats = df[col].describe()
+                        text += f"  {col}: {stats['min']:.2f} to {stats['max']:.2f}\n"
+                    except:
+                        pass
+
+            # Add sample data
+            text += f"\nSample data from {sheet_name}:\n"
+            text += df.head(3).to_string(index=False)
+            text += "\n\n"
+
+        return text
+    except Exception as e:
+        logger.error(f"Error processing Excel: {str(e)}")
+        raise
+
 class DocumentProcessor:
     def __init__(self):
+        self.settings = Settings()
+        self._executor: Optional[ProcessPoolExecutor] = None
         self._ready = True
     
     def is_ready(self) -> bool:
         return self._ready
     
-    async def process_pdf(self, content: bytes) -> str:
-        """Extract text from PDF"""
-        try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text = ""
-            
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return self._clean_text(text)
-        except Exception as e:
-            logger.error(f"Error processing PDF: {str(e)}")
-            raise
+    async def process_pdf(self, source: Union[bytes, str]) -> str:
+        """Extract text from PDF bytes or a staged file path"""
+        return await self._run_parser(extract_pdf_text, source)
+    
+    async def process_csv(self, source: Union[bytes, str]) -> str:
+        """Extract text from CSV bytes or a staged file path"""
+        return await self._run_parser(extract_csv_text, source)
     
-    async def process_csv(self, content: bytes) -> str:
-        """Extract text from CSV"""
+    async def process_xlsx(self, source: Union[bytes, str]) -> str:
+        """Extract text from Excel bytes or a staged file path"""
+        return await self._run_parser(extract_xlsx_text, source)
+    
+    async def iter_pdf_pages(self, source: Union[bytes, str]) -> AsyncIterator[Tuple[int, str]]:
+        """Yield (page number, text) in page order while later pages are still being extracted.
+
+        Pages are split into batches that are all submitted to the parser pool
+        up front, so workers extract ahead of the consumer. The parsing
+        timeout covers the whole file, not each batch.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.settings.parser_timeout_seconds
+        executor = self._get_executor()
+        page_count = await self._await_parser(
+            loop.run_in_executor(executor, count_pdf_pages, source), "count_pdf_pages", deadline
+        )
+        batch_size = max(1, self.settings.pdf_page_batch_size)
+        
+        futures = [
+            loop.run_in_executor(executor, extract_pdf_pages, source, start, min(start + batch_size, page_count))
+            for start in range(0, page_count, batch_size)
+        ]
+        
         try:
-            df = pd.read_csv(io.BytesIO(content))
-            
-            # Convert DataFrame to readable text format
-            text = f"CSV Data Summary:\n"
-            text += f"Columns: {', '.join(df.columns.tolist())}\n"
-            text += f"Rows: {len(df)}\n\n"
-            
-            # Add column descriptions if available
-            for col in df.columns:
-                text += f"{col}:\n"
-                
-                # Show data types and sample values
-                dtype = str(df[col].dtype)
-                text += f"  Data type: {dtype}\n"
-                
-                if df[col].dtype == 'object':
-                    unique_values = df[col].dropna().unique()[:10]
-                    text += f"  Sample values: {', '.join(map(str, unique_values))}\n"
-                else:
-                    stats = df[col].describe()
-                    text += f"  Range: {stats['min']} to {stats['max']}\n"
-                    text += f"  Mean: {stats['mean']:.2f}\n"
-                
-                text += "\n"
-            
-            # Add first few rows as context
-            text += "Sample data:\n"
-            text += df.head(5).to_string(index=False)
-            
-            return text
-        except Exception as e:
-            logger.error(f"Error processing CSV: {str(e)}")
-            raise
+            for future in futures:
+                for page in await self._await_parser(future, "extract_pdf_pages", deadline):
+                    yield page
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    async def iter_document_pages(self, source: Union[bytes, str], content_type: str) -> AsyncIterator[Tuple[Optional[int], str]]:
+        """Yield a document's cleaned text as (page number, text) pairs; tabular files are a single page"""
+        if content_type == "application/pdf":
+            async for page in self.iter_pdf_pages(source):
+                yield page
+        elif content_type == "text/csv":
+            yield None, self._clean_text(await self.process_csv(source))
+        elif content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
+            yield None, self._clean_text(await self.process_xlsx(source))
+        else:
+            raise ValueError(f"Unsupported file type: {content_type}")
+    
+    async def _run_parser(self, parser: Callable[..., Any], *args) -> Any:
+        """Run a CPU-bound parser off the event loop, bounded by the per-file timeout.
+
+        Only the source (ideally a staged file path) and the extracted text
+        cross the process boundary.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), parser, *args)
+        return await self._await_parser(future, parser.__name__)
     
-    async def process_xlsx(self, content: bytes) -> str:
-        """Extract text from Excel file"""
+    async def _await_parser(self, future: asyncio.Future, name: str, deadline: Optional[float] = None) -> Any:
+        """Wait for a parser, up to the per-file timeout or what is left of it at ``deadline`` (loop time)"""
+        timeout = self.settings.parser_timeout_seconds
+        if deadline is not None:
+            timeout = max(0.0, deadline - asyncio.get_running_loop().time())
         try:
-            # Read all sheets
-            excel_file = pd.ExcelFile(io.BytesIO(content))
-            text = f"Excel File with {len(excel_file.sheet_names)} sheets:\n\n"
-            
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
-                
-                text += f"Sheet: {sheet_name}\n"
-                text += f"Columns: {', '.join(df.columns.tolist())}\n"
-                text += f"Rows: {len(df)}\n\n"
-                
-                # Add column descriptions
-                for col in df.columns:
-                    if df[col].dtype == 'object':
-                        unique_values = df[col].dropna().unique()[:5]
-                        text += f"  {col}: {', '.join(map(str, unique_values))}\n"
-                    else:
-                        try:
-                            stats = df[col].describe()
-                            text += f"  {col}: {stats['min']:.2f} to {stats['max']:.2f}\n"
-                        except:
-                            pass
-                
-                # Add sample data
-                text += f"\nSample data from {sheet_name}:\n"
-                text += df.head(3).to_string(index=False)
-                text += "\n\n"
-            
-            return text
-        except Exception as e:
-            logger.error(f"Error processing Excel: {str(e)}")
-            raise
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"{name} exceeded the {self.settings.parser_timeout_seconds}s parsing timeout"
+            )
+    
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """Lazily create the parser process pool (None runs parsers in the default thread pool)"""
+        if self._executor is None and self.settings.parser_workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.settings.parser_workers,
+                # Recycling workers needs a non-fork start method
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.settings.parser_max_tasks_per_child or None
+            )
+            logger.info(f"Parser process pool started with {self.settings.parser_workers} workers")
+        return self._executor
+    
+    def shutdown(self):
+        """Stop the parser process pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
     
-    async def chunk_document(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
-        """Split document into chunks with overlap"""
+    async def chunk_document(self, text: str, chunk_size: Optional[int] = None, overlap: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Split document into token-sized chunks with overlap"""
         try:
-            # Clean and prepare text
-            text = self._clean_text(text)
-            
-            # Split by paragraphs first
-            paragraphs = re.split(r'\n\s*\n', text)
-            
-            chunks = []
-            current_chunk = ""
-            chunk_index = 0
-            
-            for paragraph in paragraphs:
-                # If adding this paragraph would exceed chunk size
-                if len(current_chunk) + len(paragraph) > chunk_size and current_chunk:
-                    # Create chunk
-                    chunks.append({
-                        "content": current_chunk.strip(),
-                        "metadata": {
-                            "chunk_index": chunk_index,
-                            "char_count": len(current_chunk),
-                            "word_count": len(current_chunk.split())
-                        }
-                    })
-                    
-                    # Start new chunk with overlap
-                    overlap_text = self._get_overlap_text(current_chunk, overlap)
-                    current_chunk = overlap_text + "\n" + paragraph
-                    chunk_index += 1
-                else:
-                    # Add paragraph to current chunk
-                    if current_chunk:
-                        current_chunk += "\n\n" + paragraph
-                    else:
-                        current_chunk = paragraph
-            
-            # Add final chunk if it has content
-            if current_chunk.strip():
-                chunks.append({
-                    "content": current_chunk.strip(),
-                    "metadata": {
-                        "chunk_index": chunk_index,
-                        "char_count": len(current_chunk),
-                        "word_count": len(current_chunk.split())
-                    }
-                })
-            
-            return chunks
+            chunker = self._make_chunker(chunk_size, overlap)
+            return list(chunker.chunk_text([(None, self._clean_text(text))]))
         except Exception as e:
             logger.error(f"Error chunking document: {str(e)}")
             raise
     
+    async def chunk_pages(
+        self,
+        pages: AsyncIterator[Tuple[Optional[int], str]],
+        chunk_size: Optional[int] = None,
+        overlap: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Chunk a stream of cleaned (page number, text) pairs, yielding chunks as soon as they fill.
+
+        Chunk metadata records the first and last page each chunk draws from.
+        """
+        chunker = self._make_chunker(chunk_size, overlap)
+        async for page_number, page_text in pages:
+            for chunk in chunker.feed(page_text, page_number):
+                yield chunk
+        for chunk in chunker.finish():
+            yield chunk
+    
+    def _make_chunker(self, chunk_size: Optional[int], overlap: Optional[int]) -> TokenChunker:
+        return TokenChunker(
+            chunk_tokens=chunk_size or self.settings.chunk_size,
+            overlap_tokens=self.settings.chunk_overlap if overlap is None else overlap,
+            model=self.settings.embedding_model
+        )
+    
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove special characters but keep punctuation
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\"\'\/]', '', text)
-        
-        # Fix common PDF extraction issues
-        text = text.replace('\n', ' ')
-        text = re.sub(r'\s+', ' ', text)
-        
-        return text.strip()
-    
-    def _get_overlap_text(self, text: str, max_chars: int) -> str:
-        """Get overlap text from the end of current chunk"""
-        if len(text) <= max_chars:
-            return text
-        
-        # Try to break at sentence boundary
-        sentences = re.split(r'[.!?]+', text)
-        if len(sentences) > 1:
-            # Start from the end and work backwards
-            overlap = ""
-            for sentence in reversed(sentences[:-1]):  # Exclude last (empty) split
-                if len(overlap) + len(sentence) + 1 <= max_chars:
-                    overlap = sentence + ". " + overlap
-                else:
-                    break
-            if overlap:
-                return overlap.strip()
-        
-        # Fallback to character limit
-        return text[-max_chars:].strip()
\ No newline at end of file
+        return clean_text(text)
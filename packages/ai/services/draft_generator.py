@@ -1,18 +1,32 @@
 import openai
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 import json
 from datetime import datetime, timedelta
 from config.settings import Settings
+from services.completion_cache import CompletionCache
+from services.context_builder import ContextBuilder
+from services.metrics import observe_openai
+from services.task_graph import TaskGraph
 
 logger = logging.getLogger(__name__)
 
+# Section prompts for the initial draft, in proposal order
+INITIAL_SECTION_PROMPTS = {
+    "need": "Generate a compelling 'Statement of Need' section that explains the problem this grant will address.",
+    "projectPlan": "Generate a detailed 'Project Plan' section outlining objectives, activities, timeline, and methodology.",
+    "budgetNarrative": "Generate a comprehensive 'Budget Narrative' section explaining how funds will be used.",
+    "outcomes": "Generate an 'Expected Outcomes' section detailing measurable results and impact."
+}
+
 class DraftGenerator:
     def __init__(self):
         self.settings = Settings()
         self.client = openai.AsyncOpenAI(api_key=self.settings.openai_api_key)
         self.model = self.settings.openai_model
         self._ready = bool(self.settings.openai_api_key)
+        self.completions = CompletionCache()
+        self.context_builder = ContextBuilder(self.model)
     
     def is_ready(self) -> bool:
         return self._ready
@@ -21,67 +35,78 @@ class DraftGenerator:
         self, 
         project_id: str, 
         chunks: List[Dict[str, Any]], 
-        db_conn
+        db_conn,
+        bypass_cache: bool = False
     ) -> Dict[str, Any]:
-        """Generate initial grant proposal draft"""
+        """Generate initial grant proposal draft.
+
+        The four sections and eligibility are independent and run
+        concurrently; the summary starts once every section has finished and
+        the KPIs once the project plan and outcomes have. A section that fails
+        or times out is left out (and listed in ``generationErrors``) instead
+        of failing the draft. ``bypass_cache`` forces fresh eligibility and
+        KPI completions (for user-triggered re-drafts).
+        """
         try:
             # Combine relevant chunks into context
             context = self._build_context(chunks)
+            graph = self._build_draft_graph(context, bypass_cache)
+            results, errors = await graph.run()
             
-            # Generate each section
-            sections = {}
-            
-            # Generate Need section
-            sections["need"] = await self._generate_section(
-                "need", 
-                context, 
-                "Generate a compelling 'Statement of Need' section that explains the problem this grant will address."
-            )
-            
-            # Generate Project Plan section
-            sections["projectPlan"] = await self._generate_section(
-                "projectPlan", 
-                context, 
-                "Generate a detailed 'Project Plan' section outlining objectives, activities, timeline, and methodology."
-            )
-            
-            # Generate Budget Narrative section
-            sections["budgetNarrative"] = await self._generate_section(
-                "budgetNarrative", 
-                context, 
-                "Generate a comprehensive 'Budget Narrative' section explaining how funds will be used."
-            )
-            
-            # Generate Outcomes section
-            sections["outcomes"] = await self._generate_section(
-                "outcomes", 
-                context, 
-                "Generate an 'Expected Outcomes' section detailing measurable results and impact."
-            )
-            
-            # Generate summary
-            summary = await self._generate_summary(sections, context)
-            
-            # Generate deadlines and eligibility
-            deadlines = self._generate_deadlines()
-            eligibility = await self._generate_eligibility(context)
+            sections = {name: results[name] for name in INITIAL_SECTION_PROMPTS if name in results}
+            if not sections:
+                raise RuntimeError(f"No draft sections could be generated: {errors}")
             
-            # Generate KPI suggestions
-            kpi_suggestions = await self._generate_kpi_suggestions(sections, context)
-            
-            return {
-                "summary": summary,
-                "deadlines": deadlines,
-                "eligibility": eligibility,
+            draft = {
+                "summary": results["summary"],
+                "deadlines": self._generate_deadlines(),
+                "eligibility": results["eligibility"],
                 "sections": sections,
-                "kpiSuggestions": kpi_suggestions,
+                "kpiSuggestions": results["kpiSuggestions"],
                 "generatedAt": datetime.utcnow().isoformat()
             }
+            if errors:
+                draft["generationErrors"] = errors
+            return draft
             
         except Exception as e:
             logger.error(f"Error generating initial draft: {str(e)}")
             raise
     
+    def _build_draft_graph(self, context: str, bypass_cache: bool = False) -> TaskGraph:
+        """Dependency graph of the initial draft's generation steps"""
+        graph = TaskGraph(self.settings.draft_max_concurrency, self.settings.draft_node_timeout_seconds)
+        
+        def section_node(name: str, prompt: str):
+            return lambda results: self._generate_section(name, context, prompt)
+        
+        def completed_sections(results: Dict[str, Any], names) -> Dict[str, str]:
+            return {name: results[name] for name in names if name in results}
+        
+        for name, prompt in INITIAL_SECTION_PROMPTS.items():
+            graph.add(name, section_node(name, prompt))
+        
+        graph.add(
+            "eligibility",
+            lambda results: self._generate_eligibility(context, bypass_cache),
+            fallback=self._default_eligibility
+        )
+        graph.add(
+            "summary",
+            lambda results: self._generate_summary(completed_sections(results, INITIAL_SECTION_PROMPTS), context),
+            deps=INITIAL_SECTION_PROMPTS.keys(),
+            fallback=lambda: "Executive summary will be generated based on your proposal sections."
+        )
+        graph.add(
+            "kpiSuggestions",
+            lambda results: self._generate_kpi_suggestions(
+                completed_sections(results, ("projectPlan", "outcomes")), context, bypass_cache
+            ),
+            deps=("projectPlan", "outcomes"),
+            fallback=self._default_kpis
+        )
+        return graph
+    
     async def regenerate_section(
         self, 
         section: str, 
@@ -141,15 +166,17 @@ class DraftGenerator:
             
             Please generate a high-quality {section_type} section that would be suitable for a professional grant proposal."""
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
+            with observe_openai("draft_section", self.model) as call:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=2000
+                )
+                call.record_usage(response.usage)
             
             return response.choices[0].message.content.strip()
             
@@ -173,15 +200,17 @@ class DraftGenerator:
             
             The summary should be compelling, concise, and highlight the key points that would interest funders."""
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert grant writer creating executive summaries."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=400
-            )
+            with observe_openai("draft_summary", self.model) as call:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "You are an expert grant writer creating executive summaries."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=400
+                )
+                call.record_usage(response.usage)
             
             return response.choices[0].message.content.strip()
             
@@ -189,7 +218,7 @@ class DraftGenerator:
             logger.error(f"Error generating summary: {str(e)}")
             return "Executive summary will be generated based on your proposal sections."
     
-    async def _generate_eligibility(self, context: str) -> List[Dict[str, Any]]:
+    async def _generate_eligibility(self, context: str, bypass_cache: bool = False) -> List[Dict[str, Any]]:
         """Generate eligibility requirements analysis"""
         try:
             prompt = f"""Based on the following organizational context, identify potential eligibility requirements 
@@ -209,18 +238,23 @@ class DraftGenerator:
             - Experience in relevant areas
             """
             
-            response = await self.client.chat.completions.create(
+            content = await self.completions.complete(
+                self.client,
+                "eligibility",
+                self.settings.completion_cache_eligibility_ttl_seconds,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a grant compliance expert. Return only valid JSON."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.3,
-                max_tokens=800
+                max_tokens=800,
+                bypass=bypass_cache,
+                validate=json.loads
             )
             
             try:
-                return json.loads(response.choices[0].message.content.strip())
+                return json.loads(content)
             except json.JSONDecodeError:
                 return self._default_eligibility()
                 
@@ -228,7 +262,12 @@ class DraftGenerator:
             logger.error(f"Error generating eligibility: {str(e)}")
             return self._default_eligibility()
     
-    async def _generate_kpi_suggestions(self, sections: Dict[str, str], context: str) -> List[Dict[str, str]]:
+    async def _generate_kpi_suggestions(
+        self,
+        sections: Dict[str, str],
+        context: str,
+        bypass_cache: bool = False
+    ) -> List[Dict[str, str]]:
         """Generate KPI suggestions based on the proposal"""
         try:
             outcomes_section = sections.get("outcomes", "")
@@ -248,18 +287,23 @@ class DraftGenerator:
             Focus on SMART goals that are Specific, Measurable, Achievable, Relevant, and Time-bound.
             """
             
-            response = await self.client.chat.completions.create(
+            content = await self.completions.complete(
+                self.client,
+                "kpi_suggestions",
+                self.settings.completion_cache_kpi_ttl_seconds,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a program evaluation expert. Return only valid JSON."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.3,
-                max_tokens=1000
+                max_tokens=1000,
+                bypass=bypass_cache,
+                validate=json.loads
             )
             
             try:
-                return json.loads(response.choices[0].message.content.strip())
+                return json.loads(content)
             except json.JSONDecodeError:
                 return self._default_kpis()
                 
@@ -267,14 +311,9 @@ class DraftGenerator:
             logger.error(f"Error generating KPIs: {str(e)}")
             return self._default_kpis()
     
-    def _build_context(self, chunks: List[Dict[str, Any]], max_chars: int = 8000) -> str:
-        """Build context from document chunks"""
-        context = ""
-        for chunk in chunks[:10]:  # Limit to first 10 chunks
-            if len(context) + len(chunk["content"]) > max_chars:
-                break
-            context += chunk["content"] + "\n\n"
-        return context.strip()
+    def _build_context(self, chunks: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> str:
+        """Build context from document chunks (most relevant first, within the model's token budget)"""
+        return self.context_builder.build(chunks, max_tokens)
     
     def _generate_deadlines(self) -> List[Dict[str, Any]]:
         """Generate sample deadlines"""
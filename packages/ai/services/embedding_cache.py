@@ -0,0 +1,146 @@
+import hashlib
+import json
+import re
+import unicodedata
+import numpy as np
+from typing import List, Dict, Optional
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+from services.vector_codec import has_vector_codec, vector_literal
+
+logger = logging.getLogger(__name__)
+
+class CacheStats:
+    """Hit/miss counters for the embedding cache"""
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def record(self, memory_hits: int = 0, db_hits: int = 0, misses: int = 0):
+        self.memory_hits += memory_hits
+        self.db_hits += db_hits
+        self.misses += misses
+
+    def as_dict(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0
+        }
+
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (model, normalized text hash).
+
+    Lookups go to an in-process LRU first, then to the ``embedding_cache``
+    table when a database pool has been bound. Cache failures are logged and
+    treated as misses; they never fail the embedding call.
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.embedding_cache_enabled
+        self.memory = TTLCache(
+            self.settings.embedding_cache_max_entries,
+            self.settings.embedding_cache_ttl_seconds
+        )
+        self.db_pool = None
+        self.stats = CacheStats()
+
+    def bind_pool(self, db_pool):
+        """Enable the persistent Postgres tier"""
+        if self.settings.embedding_cache_persistent:
+            self.db_pool = db_pool
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    async def get_many(
+        self,
+        model: str,
+        texts: List[str],
+        stats: Optional[CacheStats] = None
+    ) -> List[Optional[List[float]]]:
+        """Return cached embeddings aligned with texts (None for misses)"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not self.enabled or not texts:
+            return results
+
+        hashes = [self.text_hash(text) for text in texts]
+        missing: Dict[str, List[int]] = {}
+        memory_hits = 0
+
+        for i, text_hash in enumerate(hashes):
+            cached = self.memory.get((model, text_hash))
+            if cached is not None:
+                results[i] = cached.tolist()
+                memory_hits += 1
+            else:
+                missing.setdefault(text_hash, []).append(i)
+
+        db_hits = 0
+        if missing and self.db_pool is not None:
+            try:
+                async with self.db_pool.acquire() as conn:
+                    rows = await conn.fetch(
+                        """
+                        SELECT text_hash, embedding FROM embedding_cache
+                        WHERE model = $1 AND text_hash = ANY($2::text[])
+                        """,
+                        model, list(missing.keys())
+                    )
+                for row in rows:
+                    embedding = row["embedding"]
+                    if isinstance(embedding, str):
+                        # No binary codec registered; pgvector text form is a JSON array
+                        embedding = json.loads(embedding)
+                    embedding = np.asarray(embedding, dtype=np.float32)
+                    self.memory.set((model, row["text_hash"]), embedding)
+                    for i in missing.pop(row["text_hash"]):
+                        results[i] = embedding.tolist()
+                        db_hits += 1
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {str(e)}")
+
+        misses = sum(len(indices) for indices in missing.values())
+        self.stats.record(memory_hits, db_hits, misses)
+        if stats is not None:
+            stats.record(memory_hits, db_hits, misses)
+
+        return results
+
+    async def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store freshly generated embeddings in both tiers"""
+        if not self.enabled or not texts:
+            return
+
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            text_hash = self.text_hash(text)
+            vector = np.asarray(embedding, dtype=np.float32)
+            self.memory.set((model, text_hash), vector)
+            rows[text_hash] = vector
+
+        if self.db_pool is None:
+            return
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                # Without the binary codec the embedding has to go as text
+                encode = (lambda vector: vector) if has_vector_codec(conn) else vector_literal
+                await conn.executemany(
+                    """
+                    INSERT INTO embedding_cache (model, text_hash, embedding)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (model, text_hash) DO NOTHING
+                    """,
+                    [(model, text_hash, encode(vector)) for text_hash, vector in rows.items()]
+                )
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
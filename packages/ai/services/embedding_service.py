@@ -1,8 +1,13 @@
+import asyncio
 import openai
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 from config.settings import Settings
+from services.embedding_cache import EmbeddingCache, CacheStats
+from services.metrics import observe_openai
+from services.tokenizer import count_tokens, truncate_to_tokens
+from services.vector_search import SimilarityMatrix
 
 logger = logging.getLogger(__name__)
 
@@ -12,36 +17,154 @@ class EmbeddingService:
         self.client = openai.AsyncOpenAI(api_key=self.settings.openai_api_key)
         self.model = self.settings.embedding_model
         self._ready = bool(self.settings.openai_api_key)
+        # Shared across jobs so concurrent ingests don't multiply in-flight requests
+        self._batch_semaphore = asyncio.Semaphore(self.settings.embedding_max_concurrency)
+        self.cache = EmbeddingCache()
+        
+        # Optional shortened embeddings (text-embedding-3 only)
+        self.dimensions = None
+        if self.settings.embedding_dimensions:
+            if self.settings.supports_embedding_dimensions:
+                self.dimensions = self.settings.embedding_dimensions
+            else:
+                logger.warning(f"{self.model} does not support the dimensions parameter; using full-size embeddings")
+        self._request_options = {"dimensions": self.dimensions} if self.dimensions else {}
+        # Cache entries are only interchangeable within one model and output size
+        self.cache_model = f"{self.model}:{self.dimensions}" if self.dimensions else self.model
     
     def is_ready(self) -> bool:
         return self._ready
     
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str, cache_stats: Optional[CacheStats] = None) -> List[float]:
         """Generate embedding for a single text"""
+        cached = await self.cache.get_many(self.cache_model, [text], cache_stats)
+        if cached[0] is not None:
+            return cached[0]
+        
         try:
-            response = await self.client.embeddings.create(
-                model=self.model,
-                input=text,
-                encoding_format="float"
-            )
-            return response.data[0].embedding
+            with observe_openai("embedding_query", self.model) as call:
+                response = await self.client.embeddings.create(
+                    model=self.model,
+                    input=text,
+                    encoding_format="float",
+                    **self._request_options
+                )
+                call.record_usage(response.usage)
+            embedding = response.data[0].embedding
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
+        
+        await self.cache.put_many(self.cache_model, [text], [embedding])
+        return embedding
     
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    async def generate_embeddings_batch(
+        self,
+        texts: List[str],
+        cache_stats: Optional[CacheStats] = None
+    ) -> List[List[float]]:
         """Generate embeddings for multiple texts"""
+        return await self._embed_with_cache(texts, self._create_embeddings, cache_stats)
+    
+    async def generate_embeddings_batched(
+        self,
+        texts: List[str],
+        cache_stats: Optional[CacheStats] = None
+    ) -> List[List[float]]:
+        """Embed any number of texts using token-bounded batches sent concurrently.
+
+        Results are returned in the same order as ``texts``.
+        """
+        return await self._embed_with_cache(texts, self._create_embeddings_batched, cache_stats)
+    
+    async def _embed_with_cache(self, texts: List[str], embed_misses, cache_stats: Optional[CacheStats]) -> List[List[float]]:
+        """Serve texts from the cache and embed only the (deduplicated) misses"""
+        if not texts:
+            return []
+        
+        embeddings = await self.cache.get_many(self.cache_model, texts, cache_stats)
+        
+        # Texts that normalize to the same cache key are embedded once
+        missing: Dict[str, List[int]] = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(self.cache.text_hash(texts[i]), []).append(i)
+        
+        if missing:
+            miss_indices = list(missing.values())
+            miss_texts = [texts[indices[0]] for indices in miss_indices]
+            miss_embeddings = await embed_misses(miss_texts)
+            for indices, embedding in zip(miss_indices, miss_embeddings):
+                for i in indices:
+                    embeddings[i] = embedding
+            await self.cache.put_many(self.cache_model, miss_texts, miss_embeddings)
+        
+        return embeddings
+    
+    async def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Single embeddings API request for a list of texts"""
         try:
-            response = await self.client.embeddings.create(
-                model=self.model,
-                input=texts,
-                encoding_format="float"
-            )
+            with observe_openai("embedding_batch", self.model) as call:
+                response = await self.client.embeddings.create(
+                    model=self.model,
+                    input=texts,
+                    encoding_format="float",
+                    **self._request_options
+                )
+                call.record_usage(response.usage)
             return [data.embedding for data in response.data]
         except Exception as e:
             logger.error(f"Error generating batch embeddings: {str(e)}")
             raise
     
+    async def _create_embeddings_batched(self, texts: List[str]) -> List[List[float]]:
+        """Pack texts into request-sized batches and send them concurrently"""
+        batches = self._pack_batches(texts)
+        
+        async def embed_batch(batch: List[tuple]) -> List[List[float]]:
+            async with self._batch_semaphore:
+                return await self._create_embeddings([text for _, text in batch])
+        
+        batch_results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        
+        embeddings: List[List[float]] = [None] * len(texts)
+        for batch, batch_embeddings in zip(batches, batch_results):
+            for (index, _), embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding
+        
+        logger.info(f"Embedded {len(texts)} texts in {len(batches)} batches")
+        return embeddings
+    
+    def _pack_batches(self, texts: List[str]) -> List[List[tuple]]:
+        """Group (index, text) pairs into contiguous batches within the API request limits"""
+        max_input_tokens = self.settings.embedding_max_input_tokens
+        max_batch_tokens = self.settings.embedding_batch_max_tokens
+        max_batch_inputs = self.settings.embedding_batch_max_inputs
+        
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text, self.model)
+            if tokens > max_input_tokens:
+                logger.warning(f"Truncating embedding input {index} from {tokens} to {max_input_tokens} tokens")
+                text = truncate_to_tokens(text, max_input_tokens, self.model)
+                tokens = max_input_tokens
+            
+            if current and (current_tokens + tokens > max_batch_tokens or len(current) >= max_batch_inputs):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            
+            current.append((index, text))
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
     def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings"""
         try:
@@ -68,11 +191,19 @@ class EmbeddingService:
         top_k: int = 5
     ) -> List[int]:
         """Find indices of most similar embeddings"""
-        similarities = []
-        for i, candidate in enumerate(candidate_embeddings):
-            similarity = self.calculate_similarity(query_embedding, candidate)
-            similarities.append((similarity, i))
-        
-        # Sort by similarity (descending) and return top_k indices
-        similarities.sort(reverse=True)
-        return [idx for _, idx in similarities[:top_k]]
\ No newline at end of file
+        if not candidate_embeddings:
+            return []
+        indices, _ = SimilarityMatrix(candidate_embeddings).search(query_embedding, top_k)
+        return indices.tolist()
+    
+    def find_most_similar_batch(
+        self,
+        query_embeddings: List[List[float]],
+        candidate_embeddings: List[List[float]],
+        top_k: int = 5
+    ) -> List[List[int]]:
+        """Find indices of the most similar candidates for each of several queries"""
+        if not candidate_embeddings:
+            return [[] for _ in query_embeddings]
+        indices, _ = SimilarityMatrix(candidate_embeddings).search_batch(query_embeddings, top_k)
+        return indices.tolist()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Set
+import logging
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+class JobProgressBroker:
+    """Pushes job progress to subscribers instead of having clients poll processing_jobs.
+
+    Every update is published on a Postgres NOTIFY channel (so updates from
+    worker processes reach the API) and delivered directly to subscribers in
+    the publishing process. ``processing_jobs.progress`` only gets throttled
+    checkpoints: at most one write per ``job_progress_write_interval_seconds``
+    per job, always of the latest state. Final states are written by the job
+    itself and announced with ``finish``.
+
+    The API process subscribes through one shared LISTEN connection, opened
+    on the first subscription and re-opened (with backoff) if it drops.
+    """
+
+    def __init__(self, db_pool):
+        self.settings = Settings()
+        self.db_pool = db_pool
+        self.channel = self.settings.job_progress_channel
+        self.write_interval = self.settings.job_progress_write_interval_seconds
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._last_write: Dict[str, float] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flushes: Dict[str, asyncio.Task] = {}
+        self._listen_conn = None
+        self._listen_lock = asyncio.Lock()
+        self._relisten: Optional[asyncio.Task] = None
+        self.notifications = 0
+        self.writes = 0
+        self.coalesced = 0
+
+    async def publish(self, job_id: str, stage: str, percentage: int, **extra):
+        """Announce a running job's progress and checkpoint it (throttled)"""
+        job_id = str(job_id)
+        progress = {"stage": stage, "percentage": percentage, **extra}
+        await self.notify(job_id, "processing", progress)
+
+        elapsed = time.monotonic() - self._last_write.get(job_id, float("-inf"))
+        if elapsed >= self.write_interval:
+            self._pending.pop(job_id, None)
+            await self._write(job_id, progress)
+            return
+
+        self.coalesced += 1
+        self._pending[job_id] = progress
+        if job_id not in self._flushes:
+            self._flushes[job_id] = asyncio.create_task(self._flush_later(job_id, self.write_interval - elapsed))
+
+    async def finish(self, job_id: str, status: str, progress: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """Announce a final state the caller has already stored; drops pending checkpoints"""
+        job_id = str(job_id)
+        flush = self._flushes.pop(job_id, None)
+        if flush is not None:
+            flush.cancel()
+        self._pending.pop(job_id, None)
+        self._last_write.pop(job_id, None)
+        await self.notify(job_id, status, progress, error)
+
+    async def notify(self, job_id: str, status: str, progress: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """Send an event without touching the table; never raises"""
+        event = {"job_id": str(job_id), "status": status, "progress": progress}
+        if error:
+            # NOTIFY payloads are limited to 8000 bytes
+            event["error"] = error[:1000]
+        self._deliver(event)
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)",
+                    self.channel, json.dumps({**event, "origin": self.origin})
+                )
+            self.notifications += 1
+        except Exception as e:
+            logger.warning(f"Progress notification for job {job_id} failed: {str(e)}")
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str):
+        """Queue receiving the job's events for the duration of the block"""
+        await self._ensure_listening()
+        job_id = str(job_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.settings.job_progress_queue_size)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def close(self):
+        for flush in self._flushes.values():
+            flush.cancel()
+        self._flushes.clear()
+        if self._relisten is not None:
+            self._relisten.cancel()
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            try:
+                await conn.remove_listener(self.channel, self._on_notification)
+                await self.db_pool.pool.release(conn)
+            except Exception as e:
+                logger.warning(f"Error closing progress listener: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "listening": self._listen_conn is not None,
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "notifications": self.notifications,
+            "checkpoint_writes": self.writes,
+            "coalesced_updates": self.coalesced
+        }
+
+    async def _write(self, job_id: str, progress: Dict[str, Any]):
+        self._last_write[job_id] = time.monotonic()
+        try:
+            async with self.db_pool.acquire() as conn:
+                # Never overwrite the final state with a late checkpoint
+                await conn.execute(
+                    "UPDATE processing_jobs SET progress = $1 WHERE id = $2 AND status = 'processing'",
+                    json.dumps(progress), job_id
+                )
+            self.writes += 1
+        except Exception as e:
+            logger.warning(f"Progress checkpoint for job {job_id} failed: {str(e)}")
+
+    async def _flush_later(self, job_id: str, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            progress = self._pending.pop(job_id, None)
+            if progress is not None:
+                await self._write(job_id, progress)
+        finally:
+            if self._flushes.get(job_id) is asyncio.current_task():
+                del self._flushes[job_id]
+
+    def _deliver(self, event: Dict[str, Any]):
+        for queue in self._subscribers.get(event["job_id"], ()):
+            if queue.full():
+                # A slow client only needs the latest state; drop the oldest event
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _on_notification(self, conn, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if event.pop("origin", None) == self.origin:
+            return  # already delivered locally
+        self._deliver(event)
+
+    def _on_listener_lost(self, conn):
+        if self._listen_conn is conn:
+            logger.warning("Progress listener connection closed; reconnecting")
+            self._listen_conn = None
+            if self._relisten is None or self._relisten.done():
+                self._relisten = asyncio.get_running_loop().create_task(self._reconnect_listener(conn))
+
+    async def _reconnect_listener(self, lost):
+        try:
+            await self.db_pool.pool.release(lost)
+        except Exception as e:
+            logger.debug(f"Could not release lost progress listener: {str(e)}")
+        delay = 1.0
+        while self._listen_conn is None:
+            await self._ensure_listening()
+            if self._listen_conn is None:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _ensure_listening(self):
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            return
+        async with self._listen_lock:
+            if self._listen_conn is not None and not self._listen_conn.is_closed():
+                return
+            try:
+                if self.db_pool.pool is None:
+                    await self.db_pool.initialize()
+                # Held for the process lifetime: LISTEN is per-session
+                conn = await self.db_pool.pool.acquire()
+                await conn.add_listener(self.channel, self._on_notification)
+                conn.add_termination_listener(self._on_listener_lost)
+                self._listen_conn = conn
+                logger.info(f"Listening for job progress on {self.channel}")
+            except Exception as e:
+                # Local events still arrive; remote ones wait for the next subscription to retry
+                logger.warning(f"Could not listen for job progress: {str(e)}")
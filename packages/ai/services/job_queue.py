@@ -0,0 +1,551 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import logging
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+FailureHandler = Callable[[str, Dict[str, Any]], Any]
+
+class Job:
+    __slots__ = ("id", "job_type", "payload", "attempts", "max_attempts")
+
+    def __init__(self, job_id: str, job_type: str, payload: Dict[str, Any], attempts: int, max_attempts: int):
+        self.id = job_id
+        self.job_type = job_type
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+class _Registration:
+    __slots__ = ("handler", "on_failure")
+
+    def __init__(self, handler: JobHandler, on_failure: Optional[FailureHandler]):
+        self.handler = handler
+        self.on_failure = on_failure
+
+class JobQueue:
+    """Durable queue for background jobs, backed by ``processing_jobs``.
+
+    The job row is the source of truth: it carries the queue payload, the
+    attempt count and a lease (``locked_by`` / ``locked_until``) that the
+    running worker keeps extending. A job whose lease runs out (the worker
+    died or was redeployed) becomes claimable again; failed attempts are
+    retried with exponential backoff until ``max_attempts``, after which the
+    job is marked failed. Subclasses only decide how job ids reach a worker.
+
+    Handlers are registered per job type and must raise on failure; they
+    record their own result and 'completed' status.
+    """
+
+    backend = "inline"
+
+    def __init__(self, db_pool, progress=None):
+        self.settings = Settings()
+        self.db_pool = db_pool
+        self.progress = progress
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.visibility_timeout = self.settings.job_visibility_timeout_seconds
+        self._registrations: Dict[str, _Registration] = {}
+        self._running: Set[asyncio.Task] = set()
+        self._recovery: Optional[asyncio.Task] = None
+
+    def register(self, job_type: str, handler: JobHandler, on_failure: Optional[FailureHandler] = None):
+        """Set the coroutine that runs a job type; ``on_failure`` runs once it has failed for good"""
+        self._registrations[job_type] = _Registration(handler, on_failure)
+
+    async def enqueue(self, job_id: str, job_type: str, payload: Dict[str, Any]):
+        """Queue an existing processing_jobs row"""
+        async with self.db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE processing_jobs
+                SET status = 'queued',
+                    queue_payload = $2,
+                    attempts = 0,
+                    max_attempts = $3,
+                    run_after = NOW(),
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    progress = $4
+                WHERE id = $1
+                """,
+                job_id, json.dumps(payload), self.settings.job_max_attempts,
+                json.dumps({"stage": "queued", "percentage": 0})
+            )
+        await self._push(str(job_id), 0)
+        logger.info(f"Queued {job_type} job {job_id} ({self.backend})")
+
+    async def start(self):
+        """Called from the API process on startup"""
+        if self.backend == "inline":
+            # Nothing in this process is running yet, so every due job was lost
+            await self.recover_orphans(queued_grace=0)
+            self._recovery = asyncio.create_task(self._recover_periodically())
+
+    async def stop(self):
+        if self._recovery is not None:
+            self._recovery.cancel()
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _recover_periodically(self):
+        """Inline queue: pick up jobs abandoned by other API processes"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout)
+            await self.recover_orphans()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "running": len(self._running)}
+
+    async def run_worker(self, stop: asyncio.Event):
+        """Claim and run jobs until ``stop`` is set (worker processes only)"""
+        await self.recover_orphans()
+        slots = asyncio.Semaphore(self.settings.job_worker_concurrency)
+        logger.info(
+            f"Worker {self.worker_id} started ({self.backend}, "
+            f"concurrency {self.settings.job_worker_concurrency})"
+        )
+        last_recovery = time.monotonic()
+        while not stop.is_set():
+            if time.monotonic() - last_recovery > self.visibility_timeout:
+                # Also catches ids a transport dropped while their lease was still live
+                await self.recover_orphans()
+                last_recovery = time.monotonic()
+
+            await slots.acquire()
+            try:
+                job = await self._next()
+            except Exception as e:
+                slots.release()
+                logger.error(f"Error claiming job: {str(e)}")
+                await self._wait(stop, self.settings.job_poll_interval_seconds)
+                continue
+
+            if job is None:
+                slots.release()
+                await self._wait(stop, self.settings.job_poll_interval_seconds)
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(lambda done: (self._running.discard(done), slots.release()))
+
+        # Let running jobs finish; unfinished ones are picked up again once their lease expires
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def recover_orphans(self, queued_grace: Optional[float] = None):
+        """Requeue (or fail) jobs that no worker is going to pick up.
+
+        Covers 'processing' rows whose lease expired and rows that never had
+        one, i.e. jobs started by a process that predates the queue and died,
+        and 'queued' rows that have been due for more than ``queued_grace``
+        seconds (default: the visibility timeout) but whose id never reached
+        a worker: inline jobs lost on restart, a push that failed after the
+        row was queued, or an id a worker could not claim.
+        """
+        await self._requeue_due(self.visibility_timeout if queued_grace is None else queued_grace)
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT id, job_type, queue_payload, attempts, max_attempts
+                    FROM processing_jobs
+                    WHERE status = 'processing'
+                    AND COALESCE(locked_until, started_at, created_at) < NOW() - make_interval(secs => $1)
+                    """,
+                    float(self.visibility_timeout)
+                )
+        except Exception as e:
+            logger.error(f"Orphaned job recovery failed: {str(e)}")
+            return
+
+        for row in rows:
+            job = self._job_from_row(row)
+            if row["queue_payload"] is None or job.attempts >= job.max_attempts:
+                await self._fail(job, "Job was interrupted and cannot be resumed")
+                continue
+            try:
+                async with self.db_pool.acquire() as conn:
+                    await conn.execute(
+                        """
+                        UPDATE processing_jobs
+                        SET status = 'queued', locked_by = NULL, locked_until = NULL, run_after = NOW()
+                        WHERE id = $1 AND status = 'processing'
+                        """,
+                        job.id
+                    )
+                await self._requeue(job.id)
+            except Exception as e:
+                logger.error(f"Error requeueing orphaned job {job.id}: {str(e)}")
+        if rows:
+            logger.warning(f"Recovered {len(rows)} orphaned jobs")
+
+    async def _requeue_due(self, grace: float):
+        """Push the ids of 'queued' jobs that have been due for over ``grace`` seconds"""
+        try:
+            async with self.db_pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT id FROM processing_jobs
+                    WHERE status = 'queued'
+                    AND queue_payload IS NOT NULL
+                    AND run_after <= NOW() - make_interval(secs => $1)
+                    """,
+                    float(grace)
+                )
+            for row in rows:
+                await self._requeue(str(row["id"]))
+        except Exception as e:
+            logger.error(f"Requeueing due jobs failed: {str(e)}")
+            return
+        if rows:
+            logger.warning(f"Requeued {len(rows)} queued jobs that were never picked up")
+
+    async def _execute(self, job: Job):
+        registration = self._registrations.get(job.job_type)
+        if registration is None:
+            await self._fail(job, f"No handler registered for job type {job.job_type}")
+            return
+        if job.attempts > job.max_attempts:
+            # The lease kept expiring: the job keeps killing or outliving its workers
+            await self._fail(job, f"Job was interrupted {job.attempts - 1} times")
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        start = time.perf_counter()
+        try:
+            await registration.handler(job.id, job.payload)
+        except asyncio.CancelledError:
+            # Shutdown: leave the lease to expire so another worker resumes the job
+            raise
+        except Exception as e:
+            logger.error(f"{job.job_type} job {job.id} failed (attempt {job.attempts}/{job.max_attempts}): {str(e)}")
+            if job.attempts < job.max_attempts:
+                await self._retry(job, str(e))
+            else:
+                await self._fail(job, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        logger.info(f"{job.job_type} job {job.id} finished in {time.perf_counter() - start:.1f}s")
+        await self._release(job)
+
+    async def _heartbeat(self, job: Job):
+        """Extend the lease while the handler runs"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                async with self.db_pool.acquire() as conn:
+                    await conn.execute(
+                        """
+                        UPDATE processing_jobs
+                        SET locked_until = NOW() + make_interval(secs => $3)
+                        WHERE id = $1 AND locked_by = $2
+                        """,
+                        job.id, self.worker_id, float(self.visibility_timeout)
+                    )
+                await self._touch(job)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job.id} failed: {str(e)}")
+
+    async def _lock(self, job_id: str) -> Optional[Job]:
+        """Take the lease on a queued (or abandoned) job; None if it is not claimable"""
+        async with self.db_pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                UPDATE processing_jobs
+                SET status = 'processing',
+                    attempts = attempts + 1,
+                    locked_by = $2,
+                    locked_until = NOW() + make_interval(secs => $3),
+                    started_at = COALESCE(started_at, NOW())
+                WHERE id = $1
+                AND queue_payload IS NOT NULL
+                AND (
+                    (status = 'queued' AND run_after <= NOW())
+                    OR (status = 'processing' AND locked_until < NOW())
+                )
+                RETURNING id, job_type, queue_payload, attempts, max_attempts
+                """,
+                job_id, self.worker_id, float(self.visibility_timeout)
+            )
+        return self._job_from_row(row) if row else None
+
+    async def _retry(self, job: Job, error_message: str):
+        delay = min(
+            self.settings.job_retry_base_seconds * 2 ** (job.attempts - 1),
+            self.settings.job_retry_max_seconds
+        ) * random.uniform(0.8, 1.2)
+        progress = {"stage": "retrying", "percentage": 0, "attempt": job.attempts}
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE processing_jobs
+                    SET status = 'queued',
+                        run_after = NOW() + make_interval(secs => $2),
+                        locked_by = NULL,
+                        locked_until = NULL,
+                        error_message = $3,
+                        progress = $4
+                    WHERE id = $1
+                    """,
+                    job.id, delay, error_message, json.dumps(progress)
+                )
+            await self._ack(job)
+            if self.progress is not None:
+                await self.progress.finish(job.id, "queued", progress, error_message)
+            await self._push(job.id, delay)
+            logger.info(f"Retrying job {job.id} in {delay:.0f}s")
+        except Exception as e:
+            logger.error(f"Error scheduling retry for job {job.id}: {str(e)}")
+
+    async def _fail(self, job: Job, error_message: str):
+        """Mark a job failed for good; never raises"""
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    UPDATE processing_jobs
+                    SET status = 'failed',
+                        completed_at = NOW(),
+                        error_message = $2,
+                        locked_by = NULL,
+                        locked_until = NULL
+                    WHERE id = $1
+                    """,
+                    job.id, error_message
+                )
+            await self._ack(job)
+        except Exception as e:
+            logger.error(f"Error marking job {job.id} as failed: {str(e)}")
+        if self.progress is not None:
+            await self.progress.finish(job.id, "failed", error=error_message)
+
+        registration = self._registrations.get(job.job_type)
+        if registration is not None and registration.on_failure is not None:
+            try:
+                result = registration.on_failure(job.id, job.payload)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Failure handler for job {job.id} raised: {str(e)}")
+
+    async def _release(self, job: Job):
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE processing_jobs SET locked_by = NULL, locked_until = NULL WHERE id = $1",
+                    job.id
+                )
+            await self._ack(job)
+        except Exception as e:
+            logger.error(f"Error releasing job {job.id}: {str(e)}")
+
+    @staticmethod
+    def _job_from_row(row) -> Job:
+        payload = row["queue_payload"]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        return Job(str(row["id"]), row["job_type"], payload or {}, row["attempts"], row["max_attempts"])
+
+    @staticmethod
+    async def _wait(stop: asyncio.Event, seconds: float):
+        try:
+            await asyncio.wait_for(stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    # Transport hooks; the inline queue runs jobs as tasks in this process
+
+    async def _push(self, job_id: str, delay: float):
+        task = asyncio.create_task(self._run_inline(job_id, delay))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_inline(self, job_id: str, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            job = await self._lock(job_id)
+        except Exception as e:
+            logger.error(f"Error starting job {job_id}: {str(e)}")
+            return
+        if job is not None:
+            await self._execute(job)
+
+    async def _next(self) -> Optional[Job]:
+        raise RuntimeError("The inline job queue has no workers; set JOB_QUEUE_BACKEND to postgres or redis")
+
+    async def _requeue(self, job_id: str):
+        """Make a job's id runnable again without duplicating it in the transport"""
+        await self._push(job_id, 0)
+
+    async def _touch(self, job: Job):
+        pass
+
+    async def _ack(self, job: Job):
+        pass
+
+class PostgresJobQueue(JobQueue):
+    """Workers poll processing_jobs directly with ``FOR UPDATE SKIP LOCKED``"""
+
+    backend = "postgres"
+
+    async def _push(self, job_id: str, delay: float):
+        # The row itself is the queue entry
+        pass
+
+    async def _requeue_due(self, grace: float):
+        # Due rows are claimed by polling; there are no ids to lose
+        pass
+
+    async def _next(self) -> Optional[Job]:
+        async with self.db_pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                UPDATE processing_jobs j
+                SET status = 'processing',
+                    attempts = j.attempts + 1,
+                    locked_by = $1,
+                    locked_until = NOW() + make_interval(secs => $2),
+                    started_at = COALESCE(j.started_at, NOW())
+                FROM (
+                    SELECT id FROM processing_jobs
+                    WHERE queue_payload IS NOT NULL
+                    AND (
+                        (status = 'queued' AND run_after <= NOW())
+                        OR (status = 'processing' AND locked_until < NOW())
+                    )
+                    ORDER BY run_after
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ) next_job
+                WHERE j.id = next_job.id
+                RETURNING j.id, j.job_type, j.queue_payload, j.attempts, j.max_attempts
+                """,
+                self.worker_id, float(self.visibility_timeout)
+            )
+        return self._job_from_row(row) if row else None
+
+class RedisJobQueue(JobQueue):
+    """Job ids travel through Redis; the lease is still taken on the job row.
+
+    ``<prefix>:ready`` is a list of runnable ids, ``<prefix>:delayed`` a
+    sorted set of retries by due time and ``<prefix>:inflight`` a sorted set
+    of claimed ids by visibility deadline. Claiming (promoting due retries,
+    redelivering expired in-flight ids and popping the next id) is a single
+    Lua script, so an id is never lost between structures. Recovery puts an
+    id back on the ready list with a second script that first removes it
+    from all three, so it is never queued twice.
+    """
+
+    backend = "redis"
+
+    _CLAIM_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    for _, source in ipairs({KEYS[2], KEYS[3]}) do
+        local due = redis.call('ZRANGEBYSCORE', source, '-inf', now, 'LIMIT', 0, 100)
+        for _, id in ipairs(due) do
+            redis.call('ZREM', source, id)
+            redis.call('LPUSH', KEYS[1], id)
+        end
+    end
+    local id = redis.call('RPOP', KEYS[1])
+    if id then
+        redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), id)
+    end
+    return id
+    """
+
+    _REQUEUE_SCRIPT = """
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('LREM', KEYS[1], 0, ARGV[1])
+    redis.call('LPUSH', KEYS[1], ARGV[1])
+    """
+
+    def __init__(self, db_pool, progress=None):
+        super().__init__(db_pool, progress)
+        import redis.asyncio as redis
+
+        if not self.settings.redis_url:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis requires REDIS_URL")
+        self.redis = redis.from_url(self.settings.redis_url, decode_responses=True)
+        prefix = self.settings.job_queue_redis_prefix
+        self.ready_key = f"{prefix}:ready"
+        self.delayed_key = f"{prefix}:delayed"
+        self.inflight_key = f"{prefix}:inflight"
+        self._claim = self.redis.register_script(self._CLAIM_SCRIPT)
+        self._requeue_script = self.redis.register_script(self._REQUEUE_SCRIPT)
+
+    async def stop(self):
+        await super().stop()
+        await self.redis.aclose()
+
+    async def _push(self, job_id: str, delay: float):
+        if delay > 0:
+            await self.redis.zadd(self.delayed_key, {job_id: time.time() + delay})
+        else:
+            await self.redis.lpush(self.ready_key, job_id)
+
+    async def _next(self) -> Optional[Job]:
+        while True:
+            job_id = await self._claim(
+                keys=[self.ready_key, self.delayed_key, self.inflight_key],
+                args=[time.time(), self.visibility_timeout]
+            )
+            if job_id is None:
+                return None
+            job = await self._lock(job_id)
+            if job is not None:
+                return job
+            if await self._finished(job_id):
+                # Completed or failed: drop the stale id
+                await self.redis.zrem(self.inflight_key, job_id)
+            # Otherwise the job is running elsewhere or not due yet by the
+            # database's clock: the id stays in flight and is redelivered
+            # after the visibility timeout
+
+    async def _finished(self, job_id: str) -> bool:
+        """True when the job row is in a terminal state (or gone)"""
+        async with self.db_pool.acquire() as conn:
+            status = await conn.fetchval("SELECT status FROM processing_jobs WHERE id = $1", job_id)
+        return status is None or status in ("completed", "failed")
+
+    async def _requeue(self, job_id: str):
+        # Out of the delayed and in-flight sets and onto the ready list exactly once
+        await self._requeue_script(keys=[self.ready_key, self.delayed_key, self.inflight_key], args=[job_id])
+
+    async def _touch(self, job: Job):
+        await self.redis.zadd(self.inflight_key, {job.id: time.time() + self.visibility_timeout})
+
+    async def _ack(self, job: Job):
+        await self.redis.zrem(self.inflight_key, job.id)
+
+def create_job_queue(db_pool, progress=None) -> JobQueue:
+    """Queue for the configured JOB_QUEUE_BACKEND (inline, postgres or redis).
+
+    ``progress`` (a JobProgressBroker) is told about retries and failures.
+    """
+    backend = Settings().job_queue_backend
+    if backend == "postgres":
+        return PostgresJobQueue(db_pool, progress)
+    if backend == "redis":
+        return RedisJobQueue(db_pool, progress)
+    if backend != "inline":
+        logger.warning(f"Unknown JOB_QUEUE_BACKEND {backend}, running jobs inline")
+    return JobQueue(db_pool, progress)
@@ -0,0 +1,154 @@
+import asyncio
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Set
+import logging
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics for the service's hot paths. Every label takes values
+# from a fixed set (stage names, call sites in this codebase, configured
+# models, tables) - never project, user or job ids - so the number of series
+# does not grow with usage.
+
+INGEST_STAGE_SECONDS = Histogram(
+    "grant_ai_ingest_stage_seconds",
+    "Time spent in each ingest stage, from its progress update to the next",
+    ["stage"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+INGEST_CHUNKS_PER_FILE = Histogram(
+    "grant_ai_ingest_chunks_per_file",
+    "Chunks produced per ingested file",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+INGEST_CHUNKS = Counter(
+    "grant_ai_ingest_chunks_total",
+    "Chunks handled by ingest: embedded and added, kept unchanged, or removed",
+    ["result"]
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "grant_ai_openai_request_seconds",
+    "OpenAI request latency (whole response, including streams)",
+    ["call_site", "model", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 120)
+)
+OPENAI_TOKENS = Histogram(
+    "grant_ai_openai_tokens",
+    "Tokens per OpenAI request",
+    ["call_site", "model", "kind"],
+    buckets=(16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+)
+DB_QUERY_SECONDS = Histogram(
+    "grant_ai_db_query_seconds",
+    "Postgres statement latency by statement kind and table",
+    ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "grant_ai_job_queue_depth",
+    "Queued and running background jobs (sampled on scrape)",
+    ["job_type", "status"]
+)
+
+_MAX_STATEMENT_LABELS = 100
+_statement_labels: Set[str] = set()
+_verb_pattern = re.compile(r"^\s*(?:--[^\n]*\n\s*)*(\w+)", re.IGNORECASE)
+_relation_pattern = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+([a-z_][a-z0-9_.]*)", re.IGNORECASE)
+_function_pattern = re.compile(r"^\s*SELECT\s+([a-z_][a-z0-9_.]*)\s*\(", re.IGNORECASE)
+# EXTRACT(field FROM value) is not a FROM clause
+_extract_pattern = re.compile(r"\bEXTRACT\s*\([^)]*\)", re.IGNORECASE)
+
+def statement_label(query: str) -> str:
+    """Bounded label for a SQL statement: its verb and main table, e.g. "update processing_jobs" """
+    verb_match = _verb_pattern.match(query)
+    if not verb_match:
+        return "other"
+    verb = verb_match.group(1).lower()
+    target = _relation_pattern.search(_extract_pattern.sub("", query)) or _function_pattern.match(query)
+    label = f"{verb} {target.group(1).lower()}" if target else verb
+
+    if label not in _statement_labels:
+        # Statements come from code, so this only trips on something unexpected
+        if len(_statement_labels) >= _MAX_STATEMENT_LABELS:
+            return "other"
+        _statement_labels.add(label)
+    return label
+
+def observe_db_query(record):
+    """asyncpg query logger callback (``Connection.add_query_logger``)"""
+    DB_QUERY_SECONDS.labels(statement_label(record.query)).observe(record.elapsed)
+
+class _OpenAICall:
+    def __init__(self, call_site: str, model: str):
+        self.call_site = call_site
+        self.model = model
+
+    def record_usage(self, usage: Any):
+        """Record token counts from a response (or final stream chunk) usage object"""
+        if usage is None:
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            count = getattr(usage, kind, None)
+            if count:
+                OPENAI_TOKENS.labels(self.call_site, self.model, kind.split("_")[0]).observe(count)
+
+@contextmanager
+def observe_openai(call_site: str, model: str):
+    """Time an OpenAI request; the yielded object records its token usage"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield _OpenAICall(call_site, model)
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away mid-request or mid-stream
+        outcome = "cancelled"
+        raise
+    finally:
+        OPENAI_REQUEST_SECONDS.labels(call_site, model, outcome).observe(time.perf_counter() - start)
+
+class StageTimer:
+    """Observes how long each stage of a multi-stage job lasts"""
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.stage: Optional[str] = None
+        self.started_at = 0.0
+
+    def enter(self, stage: Optional[str]):
+        """End the current stage (if any) and start timing ``stage``"""
+        now = time.perf_counter()
+        if self.stage is not None:
+            self.histogram.labels(self.stage).observe(now - self.started_at)
+        self.stage, self.started_at = stage, now
+
+    def finish(self):
+        """End the current stage"""
+        self.enter(None)
+
+async def sample_job_queue_depth(db_pool):
+    """Refresh the queue depth gauge from processing_jobs"""
+    try:
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT job_type, status, COUNT(*) AS jobs
+                FROM processing_jobs
+                WHERE status IN ('queued', 'processing') AND queue_payload IS NOT NULL
+                GROUP BY job_type, status
+                """
+            )
+    except Exception as e:
+        logger.warning(f"Could not sample job queue depth: {str(e)}")
+        return
+
+    depths: Dict[tuple, int] = {(row["job_type"], row["status"]): row["jobs"] for row in rows}
+    JOB_QUEUE_DEPTH.clear()
+    for job_type in ("ingest", "regenerate"):
+        for status in ("queued", "processing"):
+            JOB_QUEUE_DEPTH.labels(job_type, status).set(depths.pop((job_type, status), 0))
+    for (job_type, status), jobs in depths.items():
+        JOB_QUEUE_DEPTH.labels("other", status).inc(jobs)
@@ -0,0 +1,112 @@
+import re
+import unicodedata
+from typing import Any, Dict, Hashable, Optional
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class QueryResultCache:
+    """Exact-match cache of /query responses.
+
+    Keys are (project, corpus version, normalized query, threshold,
+    max_results, search parameters), where ``projects.corpus_version`` is
+    bumped whenever ingest changes the project's chunks. A re-ingest by any
+    process (usually a separate worker) therefore makes every existing entry
+    for the project unreachable at once, and they age out of the LRU;
+    nothing has to be scanned or broadcast.
+
+    Versions are cached per project for ``query_cache_version_ttl_seconds``,
+    so a hit usually needs no database round-trip; an ingest in this process
+    updates its cached version right away, other processes see it once the
+    cached version expires.
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.query_cache_enabled
+        self.db_pool = None
+        self.entries = TTLCache(self.settings.query_cache_max_entries, self.settings.query_cache_ttl_seconds)
+        self.versions = TTLCache(self.settings.query_cache_max_entries, self.settings.query_cache_version_ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    def bind_pool(self, db_pool):
+        self.db_pool = db_pool
+
+    async def corpus_version(self, project_id: str) -> Optional[int]:
+        """The project's corpus version, from the short-lived cache or the database; None if unknown"""
+        if not self.enabled or self.db_pool is None:
+            return None
+        project_id = str(project_id)
+        version = self.versions.get(project_id)
+        if version is not None:
+            return version
+
+        try:
+            async with self.db_pool.acquire() as conn:
+                version = await conn.fetchval("SELECT corpus_version FROM projects WHERE id = $1", project_id)
+        except Exception as e:
+            logger.warning(f"Could not read corpus version for project {project_id}: {str(e)}")
+            return None
+        if version is not None:
+            self.set_corpus_version(project_id, version)
+        return version
+
+    def set_corpus_version(self, project_id: str, version: int):
+        """Record a version this process just wrote"""
+        # A TTL of 0 would cache forever; re-read on every lookup instead
+        if self.settings.query_cache_version_ttl_seconds > 0:
+            self.versions.set(str(project_id), version)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().lower()
+
+    def key(
+        self,
+        project_id: str,
+        corpus_version: int,
+        query: str,
+        similarity_threshold: float,
+        max_results: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> Hashable:
+        """Cache key for a request; take it (and read the corpus version) before
+        doing the work so a concurrent re-ingest makes the eventual ``set``
+        land on a dead version"""
+        return (
+            str(project_id),
+            corpus_version,
+            self.normalize_query(query),
+            float(similarity_threshold),
+            int(max_results),
+            ef_search,
+            probes
+        )
+
+    def get(self, key: Optional[Hashable]) -> Optional[Any]:
+        # A None key (corpus version unknown) is never cached
+        if not self.enabled or key is None:
+            return None
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: Optional[Hashable], value: Any):
+        if self.enabled and key is not None:
+            self.entries.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -1,7 +1,12 @@
+import asyncio
+import json
 import openai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 import logging
 from config.settings import Settings
+from services.completion_cache import CompletionCache
+from services.context_builder import ContextBuilder
+from services.metrics import observe_openai
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +15,8 @@ class RAGService:
         self.settings = Settings()
         self.client = openai.AsyncOpenAI(api_key=self.settings.openai_api_key)
         self.model = self.settings.openai_model
+        self.completions = CompletionCache()
+        self.context_builder = ContextBuilder(self.model)
         self._ready = False
     
     async def initialize(self):
@@ -33,50 +40,114 @@ class RAGService:
         self, 
         query: str, 
         context_chunks: List[Dict[str, Any]],
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
     ) -> str:
-        """Generate a response using RAG"""
+        """Generate a response using RAG.
+
+        If ``usage`` is given it is filled with the completion's token counts.
+        """
         try:
-            # Build context from chunks
-            context = self._build_context(context_chunks)
+            with observe_openai("query_answer", self.model) as call:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self._build_rag_messages(query, context_chunks, system_prompt),
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+                call.record_usage(response.usage)
+            
+            self._record_usage(response.usage, usage)
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            logger.error(f"Error generating RAG response: {str(e)}")
+            raise
+    
+    async def stream_response(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]],
+        system_prompt: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """Generate a response using RAG, yielding text deltas as the model produces them.
+
+        Closing the generator early (e.g. the client went away) closes the
+        upstream HTTP stream, which stops the generation.
+        """
+        with observe_openai("query_answer_stream", self.model) as call:
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self._build_rag_messages(query, context_chunks, system_prompt),
+                    temperature=0.7,
+                    max_tokens=1000,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+            except Exception as e:
+                logger.error(f"Error starting RAG response stream: {str(e)}")
+                raise
             
-            # Default system prompt for RAG
-            if not system_prompt:
-                system_prompt = """You are an expert grant writing assistant. Use the provided context from organizational documents 
+            try:
+                async for chunk in stream:
+                    self._record_usage(chunk.usage, usage)
+                    call.record_usage(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Shielded so the close still happens when the consumer was cancelled
+                await asyncio.shield(stream.close())
+    
+    def _build_rag_messages(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]],
+        system_prompt: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """System and user messages for a RAG question"""
+        # Build context from chunks
+        context = self._build_context(context_chunks)
+        
+        # Default system prompt for RAG
+        if not system_prompt:
+            system_prompt = """You are an expert grant writing assistant. Use the provided context from organizational documents 
                 to answer questions accurately and helpfully. If the context doesn't contain enough information to fully answer 
                 a question, say so and provide what information you can based on the available context.
                 
                 Always base your responses on the provided context and cite specific information when possible."""
-            
-            # Build user prompt with context
-            user_prompt = f"""Context from organizational documents:
+        
+        # Build user prompt with context
+        user_prompt = f"""Context from organizational documents:
             {context}
             
             Question: {query}
             
             Please provide a helpful response based on the context above."""
-            
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.error(f"Error generating RAG response: {str(e)}")
-            raise
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    @staticmethod
+    def _record_usage(completion_usage, usage: Optional[Dict[str, int]]):
+        if usage is not None and completion_usage is not None:
+            usage["prompt_tokens"] = completion_usage.prompt_tokens
+            usage["completion_tokens"] = completion_usage.completion_tokens
+            usage["total_tokens"] = completion_usage.total_tokens
     
     async def analyze_documents_for_grant(
         self, 
-        context_chunks: List[Dict[str, Any]]
+        context_chunks: List[Dict[str, Any]],
+        bypass_cache: bool = False
     ) -> Dict[str, Any]:
-        """Analyze documents to extract grant-relevant information"""
+        """Analyze documents to extract grant-relevant information.
+
+        The analysis is served from the completion cache for identical
+        context unless ``bypass_cache`` is set.
+        """
         try:
             context = self._build_context(context_chunks)
             
@@ -113,23 +184,27 @@ class RAGService:
             
             {analysis_prompt}"""
             
-            response = await self.client.chat.completions.create(
+            content = await self.completions.complete(
+                self.client,
+                "grant_analysis",
+                self.settings.completion_cache_analysis_ttl_seconds,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a grant writing expert analyzing organizational documents. Return structured JSON analysis."},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.3,
-                max_tokens=2000
+                max_tokens=2000,
+                bypass=bypass_cache,
+                validate=json.loads
             )
             
             try:
-                import json
-                return json.loads(response.choices[0].message.content.strip())
+                return json.loads(content)
             except json.JSONDecodeError:
                 # Return structured fallback if JSON parsing fails
                 return {
-                    "organizationOverview": {"analysis": response.choices[0].message.content},
+                    "organizationOverview": {"analysis": content},
                     "organizationalCapacity": {},
                     "communityNeed": {},
                     "potentialGrantFocus": {}
@@ -147,7 +222,7 @@ class RAGService:
     ) -> List[str]:
         """Suggest improvements for a grant proposal section"""
         try:
-            context = self._build_context(context_chunks, max_chars=2000)
+            context = self._build_context(context_chunks, max_tokens=500)
             
             improvement_prompt = f"""Review the following {section_type} section of a grant proposal and suggest specific improvements:
 
@@ -166,15 +241,17 @@ class RAGService:
             
             Return suggestions as a JSON array of strings."""
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a senior grant writer providing expert feedback. Return suggestions as JSON array."},
-                    {"role": "user", "content": improvement_prompt}
-                ],
-                temperature=0.4,
-                max_tokens=800
-            )
+            with observe_openai("suggest_improvements", self.model) as call:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "You are a senior grant writer providing expert feedback. Return suggestions as JSON array."},
+                        {"role": "user", "content": improvement_prompt}
+                    ],
+                    temperature=0.4,
+                    max_tokens=800
+                )
+                call.record_usage(response.usage)
             
             try:
                 import json
@@ -196,28 +273,7 @@ class RAGService:
     def _build_context(
         self, 
         chunks: List[Dict[str, Any]], 
-        max_chars: int = 6000
+        max_tokens: Optional[int] = None
     ) -> str:
-        """Build context string from chunks"""
-        if not chunks:
-            return ""
-        
-        # Sort by similarity if available, otherwise use as provided
-        sorted_chunks = sorted(
-            chunks, 
-            key=lambda x: x.get('similarity', 0), 
-            reverse=True
-        )
-        
-        context_parts = []
-        current_length = 0
-        
-        for chunk in sorted_chunks:
-            content = chunk.get('content', '')
-            if current_length + len(content) > max_chars:
-                break
-            
-            context_parts.append(content)
-            current_length += len(content)
-        
-        return "\n\n".join(context_parts)
\ No newline at end of file
+        """Build context string from chunks (most relevant first, within the model's token budget)"""
+        return self.context_builder.build(chunks, max_tokens)
\ No newline at end of file
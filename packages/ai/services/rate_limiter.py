@@ -0,0 +1,125 @@
+import time
+from typing import Any, Dict
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+class RateLimiter:
+    """Token bucket per (caller, endpoint) in front of the OpenAI-backed endpoints.
+
+    Each bucket holds up to ``rate_limit_burst`` requests and refills at
+    ``requests_per_minute``. With the "memory" backend buckets live in this
+    process (a bucket left idle long enough to refill completely is
+    equivalent to a new one, so idle buckets simply expire); with "redis"
+    every worker shares them through an atomic Lua script. If Redis is
+    unreachable the process falls back to its own buckets rather than
+    rejecting or waving through every request.
+    """
+
+    _TAKE_SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return tostring(retry_after)
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.rate_limit_enabled and self.settings.requests_per_minute > 0
+        self.backend = self.settings.rate_limit_backend
+        self.rate = self.settings.requests_per_minute / 60.0
+        self.capacity = max(1, self.settings.rate_limit_burst)
+        # Time for an empty bucket to refill; after that it is as good as new
+        self.buckets = TTLCache(self.settings.rate_limit_max_buckets, self.capacity / self.rate if self.rate else 0)
+        self.redis = None
+        self.allowed = 0
+        self.rejected = 0
+
+        if self.enabled and self.backend == "redis":
+            import redis.asyncio as redis
+
+            if not self.settings.redis_url:
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires REDIS_URL")
+            self.redis = redis.from_url(self.settings.redis_url, decode_responses=True)
+            self._take_script = self.redis.register_script(self._TAKE_SCRIPT)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    async def check(self, caller: str, endpoint: str):
+        """Take one request from the caller's bucket; raises RateLimitExceeded when empty"""
+        if not self.enabled:
+            return
+
+        key = f"{endpoint}:{caller}"
+        retry_after = None
+        if self.redis is not None:
+            try:
+                retry_after = float(await self._take_script(
+                    keys=[f"{self.settings.rate_limit_redis_prefix}:{key}"],
+                    args=[self.rate, self.capacity]
+                ))
+            except Exception as e:
+                logger.warning(f"Redis rate limit check failed, using local buckets: {str(e)}")
+        if retry_after is None:
+            retry_after = self._take(key)
+
+        if retry_after > 0:
+            self.rejected += 1
+            raise RateLimitExceeded(retry_after)
+        self.allowed += 1
+
+    def _take(self, key: str) -> float:
+        """Take a token from a local bucket; 0 when allowed, else seconds until one is available"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(self.capacity, now)
+        else:
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+
+        if bucket.tokens < 1:
+            self.buckets.set(key, bucket)
+            return (1 - bucket.tokens) / self.rate
+
+        bucket.tokens -= 1
+        self.buckets.set(key, bucket)
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "buckets": len(self.buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,132 @@
+from datetime import date, datetime, timezone
+from typing import Any, Dict
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class QuotaExceeded(Exception):
+    def __init__(self, used: int, limit: int, resets_at: datetime):
+        super().__init__(f"Regeneration quota of {limit} per month used up")
+        self.used = used
+        self.limit = limit
+        self.resets_at = resets_at
+
+class RegenerationQuota:
+    """Monthly regeneration allowance per user, counted incrementally.
+
+    The authoritative count is ``regeneration_quota_usage``, which a trigger
+    on ``regeneration_log`` increments, so nothing recounts the log. This
+    class keeps each active user's count for the current (UTC) month, seeded
+    from that row once, and reserves a regeneration by incrementing it; a
+    user who is out of regenerations is rejected without a query. With the
+    "memory" backend counts are per process and re-read from Postgres every
+    ``regeneration_quota_sync_seconds``; with "redis" all workers share one
+    counter per user and month.
+    """
+
+    def __init__(self, db_pool):
+        self.settings = Settings()
+        self.db_pool = db_pool
+        self.limit = self.settings.regeneration_monthly_limit
+        self.counts = TTLCache(self.settings.rate_limit_max_buckets, self.settings.regeneration_quota_sync_seconds)
+        self.redis = None
+        self.rejected = 0
+
+        if self.settings.rate_limit_backend == "redis":
+            import redis.asyncio as redis
+
+            if not self.settings.redis_url:
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires REDIS_URL")
+            self.redis = redis.from_url(self.settings.redis_url, decode_responses=True)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    @staticmethod
+    def period(now: datetime) -> date:
+        return date(now.year, now.month, 1)
+
+    @staticmethod
+    def resets_at(period: date) -> datetime:
+        year, month = (period.year + 1, 1) if period.month == 12 else (period.year, period.month + 1)
+        return datetime(year, month, 1, tzinfo=timezone.utc)
+
+    async def acquire(self, user_id: str) -> int:
+        """Reserve one regeneration and return the month's usage including it.
+
+        Raises QuotaExceeded when the user has none left. Call ``release`` if
+        the regeneration is not logged after all.
+        """
+        period = self.period(datetime.now(timezone.utc))
+        if self.redis is not None:
+            try:
+                return await self._acquire_redis(str(user_id), period)
+            except QuotaExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"Redis quota counter failed, counting in process: {str(e)}")
+
+        key = (str(user_id), period)
+        count = self.counts.get(key)
+        if count is None:
+            used = await self._load(user_id, period)
+            # Mutated in place so the entry keeps the expiry of its last sync
+            count = self.counts.get(key) or [used]
+            self.counts.set(key, count)
+
+        if count[0] >= self.limit:
+            self.rejected += 1
+            raise QuotaExceeded(count[0], self.limit, self.resets_at(period))
+        count[0] += 1
+        return count[0]
+
+    async def release(self, user_id: str):
+        """Give back a reservation whose regeneration was not logged"""
+        period = self.period(datetime.now(timezone.utc))
+        if self.redis is not None:
+            try:
+                await self.redis.decr(self._redis_key(str(user_id), period))
+                return
+            except Exception as e:
+                logger.warning(f"Redis quota counter failed, counting in process: {str(e)}")
+
+        count = self.counts.get((str(user_id), period))
+        if count is not None and count[0] > 0:
+            count[0] -= 1
+
+    def _redis_key(self, user_id: str, period: date) -> str:
+        return f"{self.settings.rate_limit_redis_prefix}:quota:{user_id}:{period:%Y-%m}"
+
+    async def _acquire_redis(self, user_id: str, period: date) -> int:
+        key = self._redis_key(user_id, period)
+        if not await self.redis.exists(key):
+            used = await self._load(user_id, period)
+            expires_in = int((self.resets_at(period) - datetime.now(timezone.utc)).total_seconds()) + 86400
+            # Only the first worker's seed sticks
+            await self.redis.set(key, used, nx=True, ex=expires_in)
+
+        used = await self.redis.incr(key)
+        if used > self.limit:
+            await self.redis.decr(key)
+            self.rejected += 1
+            raise QuotaExceeded(used - 1, self.limit, self.resets_at(period))
+        return used
+
+    async def _load(self, user_id: str, period: date) -> int:
+        async with self.db_pool.acquire() as conn:
+            used = await conn.fetchval(
+                "SELECT used FROM regeneration_quota_usage WHERE user_id = $1 AND period = $2",
+                user_id, period
+            )
+        return used or 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self.redis is not None else "memory",
+            "limit": self.limit,
+            "tracked_users": len(self.counts),
+            "rejected": self.rejected
+        }
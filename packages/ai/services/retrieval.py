@@ -0,0 +1,210 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+from config.settings import Settings
+from services.ann_index import AnnIndexManager
+
+logger = logging.getLogger(__name__)
+
+# pgvector rejects hnsw.ef_search above this
+PGVECTOR_MAX_EF_SEARCH = 1000
+
+class RetrievalService:
+    """Nearest-neighbour chunk retrieval over pgvector or the per-project IVF index.
+
+    ``retrieval_backend`` picks the primary engine. When the IVF index is
+    enabled, each engine is the other's fallback: a project without a usable
+    index is served by pgvector, and a pgvector failure is served from the
+    index (chunk content is then fetched by primary key).
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.ann_index = AnnIndexManager()
+        self.db_pool = None
+
+    def bind_pool(self, db_pool):
+        self.db_pool = db_pool
+        self.ann_index.bind_pool(db_pool)
+
+    def is_ready(self) -> bool:
+        return self.db_pool is not None and self.db_pool.is_ready()
+
+    async def search(
+        self,
+        project_id: str,
+        query_embedding: List[float],
+        similarity_threshold: float,
+        max_results: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Chunks most similar to the query, best first, as content/metadata/similarity dicts"""
+        if self.settings.retrieval_backend == "ivf":
+            try:
+                chunks = await self._search_index(project_id, query_embedding, similarity_threshold, max_results)
+                if chunks is not None:
+                    return chunks
+            except Exception as e:
+                logger.warning(f"ANN index search failed for project {project_id}, using pgvector: {str(e)}")
+            return await self._search_pgvector(
+                project_id, query_embedding, similarity_threshold, max_results, ef_search, probes
+            )
+
+        try:
+            return await self._search_pgvector(
+                project_id, query_embedding, similarity_threshold, max_results, ef_search, probes
+            )
+        except Exception as e:
+            if not self.ann_index.enabled:
+                raise
+            logger.warning(f"pgvector search failed for project {project_id}, using ANN index: {str(e)}")
+            chunks = await self._search_index(project_id, query_embedding, similarity_threshold, max_results)
+            if chunks is None:
+                raise
+            return chunks
+
+    async def index_chunks(self, project_id: str, chunk_ids: Sequence[Any], embeddings: List[List[float]]):
+        """Add committed chunks to the project's ANN index; failures are logged, not raised"""
+        try:
+            await self.ann_index.add(project_id, chunk_ids, embeddings)
+        except Exception as e:
+            logger.warning(f"Could not update ANN index for project {project_id}: {str(e)}")
+
+    async def remove_chunks(self, project_id: str, chunk_ids: Sequence[Any]):
+        """Drop deleted chunks from the project's ANN index; failures are logged, not raised"""
+        try:
+            await self.ann_index.remove(project_id, chunk_ids)
+        except Exception as e:
+            logger.warning(f"Could not remove chunks from ANN index for project {project_id}: {str(e)}")
+
+    async def _search_pgvector(
+        self,
+        project_id: str,
+        query_embedding: List[float],
+        similarity_threshold: float,
+        max_results: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        candidates = max_results * self.settings.retrieval_overfetch
+        search_settings = {
+            # ef_search below the LIMIT silently truncates HNSW results
+            "hnsw.ef_search": min(max(ef_search or self.settings.pgvector_ef_search, candidates), PGVECTOR_MAX_EF_SEARCH),
+            "ivfflat.probes": probes or self.settings.pgvector_probes,
+            # Plan with the actual project id so per-project partial indexes
+            # (create_project_vector_index) can be matched
+            "plan_cache_mode": "force_custom_plan"
+        }
+        if self.settings.pgvector_iterative_scan not in ("", "off"):
+            search_settings["hnsw.iterative_scan"] = self.settings.pgvector_iterative_scan
+
+        index_distance, similarity, columns = self._pgvector_expressions()
+
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                # Transaction-local, so pooled connections are never left tuned
+                await conn.execute(
+                    "SELECT set_config(name, value, true) FROM unnest($1::text[], $2::text[]) AS s(name, value)",
+                    list(search_settings.keys()),
+                    [str(value) for value in search_settings.values()]
+                )
+                order_by = index_distance
+                if await self._is_small_project(conn, project_id):
+                    # The global HNSW index returns its ef_search nearest rows
+                    # before the project filter, which for a small project may
+                    # be few or none of its own. "+ 0" keeps the planner from
+                    # matching the index, so the project's rows (found via the
+                    # project_id index) are ranked exactly.
+                    order_by = f"({index_distance}) + 0"
+                # The inner query is a bare ORDER BY distance LIMIT so the
+                # HNSW index drives it; the threshold filters the candidates
+                rows = await conn.fetch(
+                    f"""
+                    WITH nearest AS (
+                        SELECT {columns}, {index_distance} AS distance
+                        FROM document_chunks
+                        WHERE project_id = $2
+                        ORDER BY {order_by}
+                        LIMIT $4
+                    ), scored AS (
+                        SELECT id, content, metadata, {similarity} as similarity
+                        FROM nearest
+                    )
+                    SELECT id, content, metadata, similarity
+                    FROM scored
+                    WHERE similarity > $3
+                    ORDER BY similarity DESC
+                    LIMIT $5
+                    """,
+                    query_embedding,
+                    project_id,
+                    similarity_threshold,
+                    candidates,
+                    max_results
+                )
+
+        return [self._to_chunk(row, float(row["similarity"])) for row in rows]
+
+    async def _is_small_project(self, conn, project_id: str) -> bool:
+        """Whether the project has few enough chunks to search exactly (counts at most one past the limit)"""
+        limit = self.settings.pgvector_exact_search_max_chunks
+        if limit <= 0:
+            return False
+        chunks = await conn.fetchval(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM document_chunks WHERE project_id = $1 LIMIT $2) AS project_chunks",
+            project_id, limit + 1
+        )
+        return chunks <= limit
+
+    def _pgvector_expressions(self):
+        """Index distance, reported similarity and candidate columns for the embedding profile"""
+        if self.settings.embedding_index_type != "halfvec":
+            return "embedding <=> $1::vector", "1 - distance", "id, content, metadata"
+
+        # Must match the expression index in schema.sql exactly
+        dimensions = int(self.settings.embedding_vector_dimensions)
+        index_distance = f"embedding::halfvec({dimensions}) <=> $1::vector::halfvec({dimensions})"
+        if self.settings.embedding_rescore:
+            # Re-rank the float16 candidates with the stored float32 embeddings
+            return index_distance, "1 - (embedding <=> $1::vector)", "id, content, metadata, embedding"
+        return index_distance, "1 - distance", "id, content, metadata"
+
+    async def _search_index(
+        self,
+        project_id: str,
+        query_embedding: List[float],
+        similarity_threshold: float,
+        max_results: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        hits = await self.ann_index.search(project_id, query_embedding, max_results)
+        if hits is None:
+            return None
+
+        hits = [(chunk_id, score) for chunk_id, score in hits if score > similarity_threshold]
+        if not hits:
+            return []
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT id, content, metadata FROM document_chunks WHERE id = ANY($1::uuid[])",
+                [chunk_id for chunk_id, _ in hits]
+            )
+
+        # Chunks deleted since they were indexed are simply dropped
+        by_id = {str(row["id"]): row for row in rows}
+        return [
+            self._to_chunk(by_id[str(chunk_id)], score)
+            for chunk_id, score in hits
+            if str(chunk_id) in by_id
+        ]
+
+    @staticmethod
+    def _to_chunk(row, similarity: float) -> Dict[str, Any]:
+        metadata = row["metadata"]
+        return {
+            "id": str(row["id"]),
+            "content": row["content"],
+            "metadata": json.loads(metadata) if isinstance(metadata, str) else metadata,
+            "similarity": similarity
+        }
@@ -0,0 +1,117 @@
+import json
+import re
+from typing import Any, Dict, List
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Retrieval queries for the proposal sections, written to match the source
+# material each section draws on rather than the section's own wording
+SECTION_QUERIES = {
+    "need": "problem statement, community need, affected population, statistics and evidence, gaps in existing services",
+    "projectPlan": "project objectives, activities, methodology, timeline and milestones, staffing and partners",
+    "budgetNarrative": "budget, costs, personnel salaries, equipment, funding amounts, cost justification, matching funds",
+    "outcomes": "expected outcomes, measurable results, impact, evaluation methods, performance metrics and targets",
+    "summary": "organization mission, project overview, goals, requested funding and expected impact",
+}
+
+class SectionContextCache:
+    """Document context for section regeneration, retrieved per section and cached.
+
+    Each section type has a fixed retrieval query whose embedding is computed
+    once per process; its nearest chunks in the project form the section's
+    context. Bundles are cached by (project, section, corpus version), where
+    ``projects.corpus_version`` is bumped whenever ingest changes the
+    project's chunks, so a repeated regeneration of a section skips
+    retrieval entirely and a re-ingest makes stale bundles unreachable.
+    """
+
+    def __init__(self, embedding_service, retrieval_service):
+        self.settings = Settings()
+        self.enabled = self.settings.section_context_cache_enabled
+        self.embedding_service = embedding_service
+        self.retrieval_service = retrieval_service
+        self.db_pool = None
+        self.bundles = TTLCache(self.settings.section_context_cache_max_entries, self.settings.section_context_cache_ttl_seconds)
+        self.query_embeddings = TTLCache(64, 0)
+        self.hits = 0
+        self.misses = 0
+
+    def bind_pool(self, db_pool):
+        self.db_pool = db_pool
+
+    @staticmethod
+    def section_query(section: str) -> str:
+        if section in SECTION_QUERIES:
+            return SECTION_QUERIES[section]
+        # Custom sections: "evaluationPlan" -> "evaluation plan section of a grant proposal"
+        words = re.sub(r"(?<=[a-z0-9])(?=[A-Z])|[_-]+", " ", section).lower()
+        return f"{words} section of a grant proposal"
+
+    async def get(self, project_id: str, section: str, corpus_version: int) -> List[Dict[str, Any]]:
+        """Chunks to regenerate a section from, most relevant first"""
+        key = (str(project_id), section, corpus_version)
+        if self.enabled:
+            bundle = self.bundles.get(key)
+            if bundle is not None:
+                self.hits += 1
+                return list(bundle)
+            self.misses += 1
+
+        bundle = await self._retrieve(str(project_id), section)
+        if self.enabled:
+            self.bundles.set(key, bundle)
+        return list(bundle)
+
+    async def _query_embedding(self, section: str) -> List[float]:
+        embedding = self.query_embeddings.get(section)
+        if embedding is None:
+            embedding = await self.embedding_service.generate_embedding(self.section_query(section))
+            self.query_embeddings.set(section, embedding)
+        return embedding
+
+    async def _retrieve(self, project_id: str, section: str) -> List[Dict[str, Any]]:
+        max_chunks = self.settings.section_context_max_chunks
+        chunks = await self.retrieval_service.search(
+            project_id,
+            await self._query_embedding(section),
+            self.settings.section_context_similarity_threshold,
+            max_chunks
+        )
+        if chunks:
+            return [
+                {"content": chunk["content"], "metadata": chunk["metadata"], "similarity": chunk["similarity"]}
+                for chunk in chunks
+            ]
+
+        # Nothing close enough (e.g. very short documents): fall back to the
+        # opening chunks so the section still has some grounding
+        logger.info(f"No chunks matched section {section} of project {project_id}; using the first {max_chunks}")
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT content, metadata FROM document_chunks
+                WHERE project_id = $1
+                ORDER BY chunk_index
+                LIMIT $2
+                """,
+                project_id, max_chunks
+            )
+        return [
+            {
+                "content": row["content"],
+                "metadata": json.loads(row["metadata"]) if isinstance(row["metadata"], str) else row["metadata"]
+            }
+            for row in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.bundles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,126 @@
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+from config.settings import Settings
+from services.lru_cache import TTLCache
+from services.vector_search import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+class _CachedAnswer:
+    __slots__ = ("chunk_ids", "answer", "tokens", "created_at")
+
+    def __init__(self, chunk_ids: frozenset, answer: str, tokens: int):
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.tokens = tokens
+        self.created_at = time.monotonic()
+
+class _ProjectAnswers:
+    """One project's cached answers with their query embeddings as a matrix"""
+
+    def __init__(self):
+        self.answers: List[_CachedAnswer] = []
+        self.embeddings: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.vstack(self.embeddings)
+        return self._matrix
+
+    def add(self, embedding: np.ndarray, answer: _CachedAnswer, max_entries: int):
+        self.embeddings.append(embedding)
+        self.answers.append(answer)
+        if len(self.answers) > max_entries:
+            del self.embeddings[0], self.answers[0]
+        self._matrix = None
+
+    def expire(self, ttl_seconds: float):
+        cutoff = time.monotonic() - ttl_seconds
+        keep = [i for i, answer in enumerate(self.answers) if answer.created_at >= cutoff]
+        if len(keep) != len(self.answers):
+            self.answers = [self.answers[i] for i in keep]
+            self.embeddings = [self.embeddings[i] for i in keep]
+            self._matrix = None
+
+class SemanticAnswerCache:
+    """Reuses RAG answers for near-duplicate questions within a project.
+
+    Each entry stores the question's embedding, the ids of the chunks that
+    were retrieved for it and the generated answer. A new question is served
+    from the cache when its embedding is within ``semantic_cache_max_distance``
+    (cosine distance) of a cached question *and* retrieval returned the same
+    chunks, i.e. the model would have been given the same context. Because
+    of the chunk check, ingest needs no explicit invalidation: new or
+    deleted chunks change what is retrieved.
+    """
+
+    def __init__(self):
+        self.settings = Settings()
+        self.enabled = self.settings.semantic_cache_enabled
+        self.max_distance = self.settings.semantic_cache_max_distance
+        self.projects = TTLCache(self.settings.semantic_cache_max_projects, 0)
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def lookup(self, project_id: str, query_embedding: Any, chunk_ids: Sequence[Any]) -> Optional[str]:
+        """Cached answer for a near-duplicate question with the same retrieved chunks, or None"""
+        if not self.enabled:
+            return None
+
+        project = self.projects.get(str(project_id))
+        if project is not None:
+            project.expire(self.settings.semantic_cache_ttl_seconds)
+        if not project or not project.answers:
+            self.misses += 1
+            return None
+
+        similarities = project.matrix() @ normalize_rows(query_embedding)[0]
+        wanted = frozenset(str(chunk_id) for chunk_id in chunk_ids)
+        for i in np.argsort(-similarities):
+            if 1.0 - similarities[i] > self.max_distance:
+                break
+            answer = project.answers[i]
+            if answer.chunk_ids == wanted:
+                self.hits += 1
+                self.saved_tokens += answer.tokens
+                return answer.answer
+
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        project_id: str,
+        query_embedding: Any,
+        chunk_ids: Sequence[Any],
+        answer: str,
+        tokens: int = 0
+    ):
+        """Remember an answer; ``tokens`` is what generating it cost (for saved-token metrics)"""
+        if not self.enabled:
+            return
+
+        project = self.projects.get(str(project_id))
+        if project is None:
+            project = _ProjectAnswers()
+            self.projects.set(str(project_id), project)
+
+        project.add(
+            normalize_rows(query_embedding)[0],
+            _CachedAnswer(frozenset(str(chunk_id) for chunk_id in chunk_ids), answer, tokens),
+            self.settings.semantic_cache_max_entries
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "projects": len(self.projects)
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+NodeFunction = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+class _Node:
+    __slots__ = ("name", "run", "deps", "timeout", "fallback")
+
+    def __init__(
+        self,
+        name: str,
+        run: NodeFunction,
+        deps: Tuple[str, ...],
+        timeout: Optional[float],
+        fallback: Optional[Callable[[], Any]]
+    ):
+        self.name = name
+        self.run = run
+        self.deps = deps
+        self.timeout = timeout
+        self.fallback = fallback
+
+class TaskGraph:
+    """Runs async nodes as soon as their dependencies have finished.
+
+    Each node is called with the results gathered so far and runs under a
+    shared concurrency limit (a node only takes a slot once its inputs are
+    ready) and its own timeout. A node that fails or times out records the
+    error and, if it has one, its fallback value; dependents still run with
+    whatever results exist, so a failure degrades the output instead of
+    aborting the whole graph.
+    """
+
+    def __init__(self, max_concurrency: int, default_timeout: Optional[float] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self._nodes: Dict[str, _Node] = {}
+
+    def add(
+        self,
+        name: str,
+        run: NodeFunction,
+        deps: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        fallback: Optional[Callable[[], Any]] = None
+    ):
+        deps = tuple(deps)
+        missing = [dep for dep in deps if dep not in self._nodes]
+        if missing:
+            # Dependencies must be added first, which also rules out cycles
+            raise ValueError(f"node {name} depends on unknown nodes: {', '.join(missing)}")
+        self._nodes[name] = _Node(name, run, deps, timeout or self.default_timeout, fallback)
+
+    async def run(self) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Execute the graph; returns (results, errors) keyed by node name"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(node: _Node):
+            if node.deps:
+                await asyncio.gather(*(tasks[dep] for dep in node.deps))
+
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    results[node.name] = await asyncio.wait_for(node.run(dict(results)), node.timeout)
+                    logger.info(f"Node {node.name} finished in {time.perf_counter() - start:.1f}s")
+                    return
+                except asyncio.TimeoutError:
+                    errors[node.name] = f"timed out after {node.timeout}s"
+                except Exception as e:
+                    errors[node.name] = str(e)
+
+            logger.warning(f"Node {node.name} failed: {errors[node.name]}")
+            if node.fallback is not None:
+                results[node.name] = node.fallback()
+
+        # Nodes were added in dependency order, so every dependency task exists
+        for name, node in self._nodes.items():
+            tasks[name] = asyncio.create_task(execute(node))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return results, errors
@@ -0,0 +1,54 @@
+import re
+import tiktoken
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+_FALLBACK_ENCODING = "cl100k_base"
+_encodings: Dict[str, object] = {}
+
+class _ApproximateEncoding:
+    """Stand-in used when tiktoken's BPE files can't be loaded (e.g. offline hosts).
+
+    Splits text into pieces of at most four non-space characters, which tracks
+    the ~4 characters per token ratio of the OpenAI encodings closely enough for
+    budgeting. Joining the pieces reproduces the original text exactly.
+    """
+    _pattern = re.compile(r"\s*\S{1,4}|\s+")
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        return self._pattern.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+def get_encoding(model: str):
+    """Return (and memoize) the tiktoken encoding used by a model"""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding(_FALLBACK_ENCODING)
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding for {model}, using approximate token counts: {str(e)}")
+            encoding = _ApproximateEncoding()
+        _encodings[model] = encoding
+    return encoding
+
+def encode(text: str, model: str) -> List:
+    """Tokenize text for a model"""
+    return get_encoding(model).encode(text, disallowed_special=())
+
+def count_tokens(text: str, model: str) -> int:
+    """Count the tokens a model will see for text"""
+    return len(encode(text, model))
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    tokens = encode(text, model)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding(model).decode(tokens[:max_tokens])
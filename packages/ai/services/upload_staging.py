@@ -0,0 +1,84 @@
+import hashlib
+import os
+import shutil
+import aiofiles
+from fastapi import UploadFile
+from pydantic import BaseModel
+from typing import List
+import logging
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class UploadTooLargeError(ValueError):
+    pass
+
+class StagedUpload(BaseModel):
+    """An uploaded file spooled to the staging area, safe to use after the request ends"""
+    path: str
+    filename: str
+    content_type: str
+    size: int
+    content_hash: str = ""  # sha256 of the file bytes
+
+class UploadStaging:
+    """Spools request uploads to disk so background jobs read files, not request buffers"""
+
+    def __init__(self):
+        self.settings = Settings()
+        self.root = self.settings.upload_staging_dir
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, os.path.basename(str(job_id)))
+
+    async def stage(self, job_id: str, files: List[UploadFile]) -> List[StagedUpload]:
+        """Copy each upload to <staging>/<job_id>/ in fixed-size chunks, hashing it on the way"""
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        staged = []
+        try:
+            for index, file in enumerate(files):
+                filename = os.path.basename(file.filename or f"upload-{index}")
+                path = os.path.join(job_dir, f"{index:03d}-{filename}")
+                size = 0
+                digest = hashlib.sha256()
+
+                async with aiofiles.open(path, "wb") as out:
+                    while True:
+                        chunk = await file.read(self.settings.upload_read_chunk_size)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > self.settings.max_file_size:
+                            raise UploadTooLargeError(
+                                f"{filename} exceeds the {self.settings.max_file_size} byte upload limit"
+                            )
+                        digest.update(chunk)
+                        await out.write(chunk)
+
+                staged.append(StagedUpload(
+                    path=path,
+                    filename=filename,
+                    content_type=file.content_type or "",
+                    size=size,
+                    content_hash=digest.hexdigest()
+                ))
+        except Exception:
+            self.cleanup(job_id)
+            raise
+
+        return staged
+
+    def cleanup(self, job_id: str):
+        """Remove a job's staged files"""
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def release(self, staged: StagedUpload):
+        """Delete one staged file as soon as its chunks are stored"""
+        try:
+            os.remove(staged.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove staged upload {staged.path}: {str(e)}")
@@ -0,0 +1,88 @@
+import json
+import struct
+import weakref
+import numpy as np
+from typing import Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# pgvector's binary wire format: int16 dimensions, int16 reserved, then one
+# big-endian float32 (vector) or float16 (halfvec) per dimension.
+_HEADER = struct.Struct(">HH")
+_VECTOR_DTYPE = np.dtype(">f4")
+_HALFVEC_DTYPE = np.dtype(">f2")
+
+def _encode(value: Any, dtype: np.dtype) -> bytes:
+    array = np.asarray(value, dtype=dtype)
+    if array.ndim != 1:
+        raise ValueError(f"expected a 1-D embedding, got shape {array.shape}")
+    return _HEADER.pack(array.shape[0], 0) + array.tobytes()
+
+def _decode(data: bytes, dtype: np.dtype) -> np.ndarray:
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=dtype, count=dim, offset=_HEADER.size).astype(np.float32)
+
+def encode_vector(value: Any) -> bytes:
+    """Encode a list / NumPy array as a pgvector ``vector`` binary value"""
+    return _encode(value, _VECTOR_DTYPE)
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """Decode a pgvector ``vector`` binary value into a float32 array"""
+    return _decode(data, _VECTOR_DTYPE)
+
+def encode_halfvec(value: Any) -> bytes:
+    """Encode a list / NumPy array as a pgvector ``halfvec`` binary value"""
+    return _encode(value, _HALFVEC_DTYPE)
+
+def decode_halfvec(data: bytes) -> np.ndarray:
+    """Decode a pgvector ``halfvec`` binary value into a float32 array"""
+    return _decode(data, _HALFVEC_DTYPE)
+
+def vector_literal(value: Any) -> str:
+    """pgvector text form of an embedding, e.g. ``[0.1,0.2]``, for connections without the binary codec"""
+    return json.dumps(np.asarray(value, dtype=np.float32).tolist(), separators=(",", ":"))
+
+_CODECS = {
+    "vector": (encode_vector, decode_vector),
+    "halfvec": (encode_halfvec, decode_halfvec),
+}
+
+# Connections that got the binary ``vector`` codec in register_vector_codecs
+_binary_connections = weakref.WeakSet()
+
+def has_vector_codec(conn) -> bool:
+    """Whether ``conn`` sends ``vector`` values in binary (accepts lists / arrays as parameters)"""
+    # Pool connections are handed out wrapped in a proxy around the real connection
+    return getattr(conn, "_con", conn) in _binary_connections
+
+async def register_vector_codecs(conn) -> None:
+    """Register binary codecs for the pgvector types installed in the database.
+
+    Used as the pool's connection ``init`` hook. ``halfvec`` only exists on
+    pgvector >= 0.7 and is skipped when absent.
+    """
+    rows = await conn.fetch(
+        """
+        SELECT t.typname, n.nspname
+        FROM pg_type t
+        JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE t.typname = ANY($1::text[])
+        """,
+        list(_CODECS.keys())
+    )
+
+    for row in rows:
+        encoder, decoder = _CODECS[row["typname"]]
+        await conn.set_type_codec(
+            row["typname"],
+            schema=row["nspname"],
+            encoder=encoder,
+            decoder=decoder,
+            format="binary"
+        )
+        if row["typname"] == "vector":
+            _binary_connections.add(conn)
+
+    if not rows:
+        logger.warning("pgvector types not found; embeddings will use the text protocol")
@@ -0,0 +1,71 @@
+import numpy as np
+from typing import Any, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+def normalize_rows(vectors: Any) -> np.ndarray:
+    """Return a C-contiguous float32 copy of vectors with unit-length rows (zero rows stay zero)"""
+    matrix = np.array(vectors, dtype=np.float32, order="C", ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and scores of the top_k highest scores in each row, best first"""
+    n = scores.shape[1]
+    k = min(top_k, n)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    if k < n:
+        candidates = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def int8_scales(vectors: np.ndarray) -> np.ndarray:
+    """Per-dimension scale for symmetric int8 quantization (max |x| maps to 127)"""
+    scales = np.max(np.abs(vectors), axis=0).astype(np.float32) / 127.0
+    scales[scales == 0] = 1.0
+    return scales
+
+def quantize_int8(vectors: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Scalar-quantize float rows to int8 codes; ``codes * scales`` approximates the input"""
+    return np.clip(np.rint(np.asarray(vectors, dtype=np.float32) / scales), -127, 127).astype(np.int8)
+
+class SimilarityMatrix:
+    """Exact cosine-similarity search over an in-memory candidate set.
+
+    Candidates are stored once as a contiguous float32 matrix with
+    pre-normalized rows, so a search is a single matrix-vector (or
+    matrix-matrix for a batch of queries) product followed by an
+    ``argpartition`` top-k.
+    """
+
+    def __init__(self, embeddings: Any):
+        self.matrix = normalize_rows(embeddings)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    def search(self, query: Any, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k candidate indices and cosine similarities for one query"""
+        indices, scores = self.search_batch(query, top_k)
+        return indices[0], scores[0]
+
+    def search_batch(self, queries: Any, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k candidate indices and similarities for each row of a query matrix"""
+        if len(self) == 0:
+            return top_k_rows(np.empty((len(np.atleast_2d(queries)), 0), dtype=np.float32), top_k)
+        scores = normalize_rows(queries) @ self.matrix.T
+        return top_k_rows(scores, top_k)
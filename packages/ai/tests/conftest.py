@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the service modules the same way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
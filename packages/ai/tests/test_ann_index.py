@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+
+import numpy as np
+import pytest
+
+from services.ann_index import IVFIndex
+
+def random_rows(rng, count, dimensions=16):
+    return [uuid.uuid4() for _ in range(count)], rng.normal(size=(count, dimensions)).astype(np.float32)
+
+def build_index(tmp_path, rng, count=500):
+    index = IVFIndex(str(tmp_path))
+    ids, vectors = random_rows(rng, count)
+    with index.write_lock(reload=False):
+        index.rebuild(ids, vectors, nlist=8, iterations=3)
+    return index, ids, vectors
+
+def test_search_reads_one_snapshot_while_a_writer_publishes(tmp_path):
+    rng = np.random.default_rng(0)
+    index, ids, vectors = build_index(tmp_path, rng)
+    stop = threading.Event()
+    errors = []
+
+    def write():
+        writer_rng = np.random.default_rng(1)
+        try:
+            while not stop.is_set():
+                new_ids, new_vectors = random_rows(writer_rng, 20)
+                with index.write_lock():
+                    index.append(new_ids, new_vectors)
+                    index.remove(new_ids[:5])
+                    if index.needs_compaction(100, 0.1):
+                        index.compact(8, 2)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            hits = index.search(vectors[0], 10, nprobe=8)
+            assert len(hits) == 10
+            assert len({chunk_id for chunk_id, _ in hits}) == 10
+    finally:
+        stop.set()
+        writer.join()
+    assert not errors
+
+def test_search_with_every_list_probed_is_exact(tmp_path):
+    rng = np.random.default_rng(2)
+    index, ids, vectors = build_index(tmp_path, rng)
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = vectors[7]
+
+    hits = index.search(query, 5, nprobe=8)
+
+    expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+    assert [chunk_id for chunk_id, _ in hits] == [ids[row] for row in expected]
+    assert hits[0][0] == ids[7]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+def test_appended_rows_are_searchable_and_survive_a_reload(tmp_path):
+    rng = np.random.default_rng(3)
+    index, _, _ = build_index(tmp_path, rng)
+    new_ids, new_vectors = random_rows(rng, 3)
+    with index.write_lock():
+        index.append(new_ids, new_vectors)
+
+    reopened = IVFIndex(str(tmp_path))
+    reopened.load()
+    for loaded in (index, reopened):
+        assert loaded.delta_count == 3
+        assert loaded.search(new_vectors[1], 1, nprobe=1)[0][0] == new_ids[1]
+
+def test_removed_row_is_hidden_but_a_re_added_id_is_found(tmp_path):
+    rng = np.random.default_rng(4)
+    index, ids, vectors = build_index(tmp_path, rng)
+    with index.write_lock():
+        index.remove([ids[7]])
+    assert ids[7] not in [chunk_id for chunk_id, _ in index.search(vectors[7], 10, nprobe=8)]
+
+    # Re-ingesting the chunk re-adds its id with a new embedding
+    replacement = rng.normal(size=(1, vectors.shape[1])).astype(np.float32)
+    with index.write_lock():
+        index.append([ids[7]], replacement)
+    assert index.search(replacement[0], 1, nprobe=8)[0][0] == ids[7]
+    assert ids[7] not in [chunk_id for chunk_id, _ in index.search(vectors[7], 3, nprobe=8)]
+
+def test_compaction_folds_the_delta_and_drops_tombstones(tmp_path):
+    rng = np.random.default_rng(5)
+    index, ids, vectors = build_index(tmp_path, rng)
+    new_ids, new_vectors = random_rows(rng, 50)
+    with index.write_lock():
+        index.append(new_ids, new_vectors)
+        index.remove(ids[:20] + new_ids[:5])
+    assert index.needs_compaction(40, 0.1)
+    before = index.search(new_vectors[10], 10, nprobe=8)
+
+    with index.write_lock():
+        index.compact(8, 2)
+
+    assert (index.count, index.delta_count, index.deleted_count) == (525, 0, 0)
+    assert not index.needs_compaction(40, 0.1)
+    after = index.search(new_vectors[10], 10, nprobe=8)
+    assert [chunk_id for chunk_id, _ in after] == [chunk_id for chunk_id, _ in before]
+    assert [score for _, score in after] == pytest.approx([score for _, score in before], abs=1e-5)
+    assert not set(ids[:20] + new_ids[:5]) & {chunk_id for chunk_id, _ in index.search(vectors[0], 525, nprobe=8)}
@@ -0,0 +1,68 @@
+import pytest
+
+from services.chunker import TokenChunker
+
+MODEL = "text-embedding-3-small"
+
+def sentences(count, words=6):
+    return [f"Sentence {i} " + " ".join(["grant"] * words) + "." for i in range(count)]
+
+def test_chunks_fit_the_budget_and_cover_every_sentence_in_order():
+    chunker = TokenChunker(chunk_tokens=40, overlap_tokens=10, model=MODEL)
+    text = sentences(30)
+
+    chunks = list(chunker.chunk_text([(1, " ".join(text))]))
+
+    assert len(chunks) > 1
+    assert [chunk["metadata"]["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert 0 < chunk["metadata"]["token_count"] <= 40
+    covered = " ".join(chunk["content"] for chunk in chunks)
+    positions = [covered.find(sentence) for sentence in text]
+    assert -1 not in positions
+    assert positions == sorted(positions)
+
+def test_each_chunk_starts_with_the_previous_chunks_tail():
+    chunker = TokenChunker(chunk_tokens=40, overlap_tokens=15, model=MODEL)
+
+    chunks = list(chunker.chunk_text([(None, " ".join(sentences(20)))]))
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        first_sentence = chunk["content"].split(". ")[0]
+        assert first_sentence in previous["content"]
+        overlap = previous["content"][previous["content"].index(first_sentence):]
+        assert len(chunker.encoding.encode(overlap)) <= 15
+
+def test_chunks_prefer_to_end_at_a_paragraph_once_mostly_full():
+    # Both paragraphs would fit in one chunk; the first is already a quarter full
+    chunker = TokenChunker(chunk_tokens=100, overlap_tokens=0, model=MODEL, min_fill=0.25)
+    paragraphs = [" ".join(sentences(3)), " ".join(sentences(3))]
+    assert sum(len(chunker.encoding.encode(paragraph)) for paragraph in paragraphs) <= 100
+
+    chunks = list(chunker.chunk_text([(None, "\n\n".join(paragraphs))]))
+
+    assert [chunk["content"] for chunk in chunks] == paragraphs
+
+def test_an_oversize_sentence_is_cut_into_token_windows():
+    chunker = TokenChunker(chunk_tokens=20, overlap_tokens=5, model=MODEL)
+    sentence = " ".join(f"word{i}" for i in range(100)) + "."
+
+    chunks = list(chunker.chunk_text([(3, sentence)]))
+
+    assert len(chunks) > 1
+    assert all(chunk["metadata"]["token_count"] <= 20 for chunk in chunks)
+    assert "word0" in chunks[0]["content"] and "word99" in chunks[-1]["content"]
+
+def test_pages_are_recorded_and_chunks_span_page_breaks():
+    chunker = TokenChunker(chunk_tokens=40, overlap_tokens=0, model=MODEL)
+    pages = [(1, " ".join(sentences(3))), (2, " ".join(sentences(3)))]
+
+    chunks = list(chunker.chunk_text(pages))
+
+    assert chunks[0]["metadata"]["page_start"] == 1
+    assert chunks[-1]["metadata"]["page_end"] == 2
+    assert any(chunk["metadata"]["page_start"] == 1 and chunk["metadata"]["page_end"] == 2 for chunk in chunks)
+
+def test_overlap_must_be_smaller_than_a_chunk():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_tokens=20, overlap_tokens=20, model=MODEL)
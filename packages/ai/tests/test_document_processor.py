@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+import pytest
+
+from services import document_processor
+from services.document_processor import DocumentProcessor
+
+def make_processor(timeout):
+    processor = DocumentProcessor()
+    processor.settings.parser_workers = 0  # default thread pool
+    processor.settings.parser_timeout_seconds = timeout
+    processor.settings.pdf_page_batch_size = 1
+    return processor
+
+async def collect(pages):
+    return [page async for page in pages]
+
+def test_pdf_timeout_covers_the_whole_file(monkeypatch):
+    # Each batch finishes 0.2s after the previous one: every wait is short,
+    # but the file as a whole takes 0.6s
+    monkeypatch.setattr(document_processor, "count_pdf_pages", lambda source: 3)
+    monkeypatch.setattr(
+        document_processor, "extract_pdf_pages",
+        lambda source, start, end: time.sleep(0.2 * end) or [(start + 1, f"page {start + 1}")]
+    )
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(collect(make_processor(timeout=0.35).iter_pdf_pages("file.pdf")))
+
+    pages = asyncio.run(collect(make_processor(timeout=2).iter_pdf_pages("file.pdf")))
+    assert pages == [(1, "page 1"), (2, "page 2"), (3, "page 3")]
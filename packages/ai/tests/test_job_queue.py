@@ -0,0 +1,277 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from config.settings import Settings
+from services import job_queue
+from services.job_queue import PostgresJobQueue, RedisJobQueue
+
+class FakeJobsDB:
+    """processing_jobs in memory, answering the statements the queue issues.
+
+    ``now`` is the database clock; tests move it forward to expire leases
+    and backoff delays.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.jobs = {}
+
+    def add(self, job_id, job_type="ingest"):
+        self.jobs[job_id] = {
+            "id": job_id, "job_type": job_type, "status": "pending", "queue_payload": None,
+            "attempts": 0, "max_attempts": 0, "run_after": None, "locked_by": None,
+            "locked_until": None, "started_at": None, "created_at": self.now, "error_message": None
+        }
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    def _claimable(self, job):
+        return job["queue_payload"] is not None and (
+            (job["status"] == "queued" and job["run_after"] <= self.now)
+            or (job["status"] == "processing" and job["locked_until"] < self.now)
+        )
+
+    def _take(self, job, worker, lease):
+        job.update(status="processing", attempts=job["attempts"] + 1, locked_by=worker, locked_until=self.now + lease)
+        job["started_at"] = job["started_at"] or self.now
+        return dict(job)
+
+    async def fetchrow(self, query, *args):
+        if "FOR UPDATE SKIP LOCKED" in query:
+            worker, lease = args
+            due = sorted((job for job in self.jobs.values() if self._claimable(job)), key=lambda job: job["run_after"])
+            return self._take(due[0], worker, lease) if due else None
+        job_id, worker, lease = args
+        job = self.jobs.get(job_id)
+        return self._take(job, worker, lease) if job and self._claimable(job) else None
+
+    async def fetch(self, query, grace):
+        if "status = 'queued'" in query:
+            return [
+                {"id": job["id"]} for job in self.jobs.values()
+                if job["status"] == "queued" and job["queue_payload"] is not None and job["run_after"] <= self.now - grace
+            ]
+        return [
+            dict(job) for job in self.jobs.values()
+            if job["status"] == "processing"
+            and (job["locked_until"] or job["started_at"] or job["created_at"]) < self.now - grace
+        ]
+
+    async def fetchval(self, query, job_id):
+        job = self.jobs.get(job_id)
+        return job["status"] if job else None
+
+    async def execute(self, query, *args):
+        job = self.jobs[args[0]]
+        if "queue_payload = $2" in query:  # enqueue
+            job.update(
+                status="queued", queue_payload=args[1], attempts=0, max_attempts=args[2],
+                run_after=self.now, locked_by=None, locked_until=None
+            )
+        elif "run_after = NOW() + make_interval" in query:  # retry
+            job.update(status="queued", run_after=self.now + args[1], locked_by=None, locked_until=None, error_message=args[2])
+        elif "status = 'failed'" in query:
+            job.update(status="failed", error_message=args[1], locked_by=None, locked_until=None)
+        elif "SET locked_until" in query:  # heartbeat
+            if job["locked_by"] == args[1]:
+                job["locked_until"] = self.now + args[2]
+        elif "AND status = 'processing'" in query:  # orphan recovery
+            if job["status"] == "processing":
+                job.update(status="queued", locked_by=None, locked_until=None, run_after=self.now)
+        else:  # release
+            job.update(locked_by=None, locked_until=None)
+
+def make_postgres_queue(db, visibility_timeout=30):
+    queue = PostgresJobQueue(db)
+    queue.visibility_timeout = visibility_timeout
+    queue.settings.job_max_attempts = 3
+    queue.settings.job_retry_base_seconds = 10
+    queue.settings.job_retry_max_seconds = 15
+    return queue
+
+def make_redis_queue(monkeypatch, db=None):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lua scripting
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.asyncio, "from_url",
+        lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    )
+    monkeypatch.setattr(job_queue, "Settings", lambda: Settings(redis_url="redis://test"))
+    return RedisJobQueue(db_pool=db)
+
+def test_each_due_job_is_claimed_by_one_worker():
+    db = FakeJobsDB()
+    first, second = make_postgres_queue(db), make_postgres_queue(db)
+
+    async def scenario():
+        for job_id in ("job-1", "job-2"):
+            db.add(job_id)
+            await first.enqueue(job_id, "ingest", {"file": job_id})
+            db.now += 1
+        return [await first._next(), await second._next(), await first._next()]
+
+    claimed_first, claimed_second, nothing_left = asyncio.run(scenario())
+    assert (claimed_first.id, claimed_second.id) == ("job-1", "job-2")
+    assert claimed_first.payload == {"file": "job-1"}
+    assert db.jobs["job-1"]["locked_by"] == first.worker_id
+    assert db.jobs["job-2"]["locked_by"] == second.worker_id
+    assert claimed_first.attempts == claimed_second.attempts == 1
+    assert nothing_left is None
+
+def test_expired_lease_is_claimed_again_until_attempts_run_out():
+    db = FakeJobsDB()
+    db.add("job-1")
+    crashed, survivor = make_postgres_queue(db), make_postgres_queue(db)
+    ran = []
+
+    async def handler(job_id, payload):
+        ran.append(job_id)
+
+    survivor.register("ingest", handler)
+
+    async def scenario():
+        await crashed.enqueue("job-1", "ingest", {})
+        await crashed._next()
+        # The worker dies without releasing: the job is invisible until its lease runs out
+        db.now += 29
+        assert await survivor._next() is None
+        db.now += 2
+        retaken = await survivor._next()
+        assert (retaken.id, retaken.attempts) == ("job-1", 2)
+        # Two more expiries and the job has outlived max_attempts
+        for _ in range(2):
+            db.now += 31
+            retaken = await survivor._next()
+        await survivor._execute(retaken)
+
+    asyncio.run(scenario())
+    assert ran == []
+    assert db.jobs["job-1"]["status"] == "failed"
+    assert db.jobs["job-1"]["attempts"] == 4
+
+def test_failed_attempts_back_off_exponentially_then_fail(monkeypatch):
+    monkeypatch.setattr(job_queue.random, "uniform", lambda low, high: 1.0)
+    db = FakeJobsDB()
+    db.add("job-1")
+    queue = make_postgres_queue(db)
+    failures = []
+
+    async def handler(job_id, payload):
+        raise RuntimeError("embedding API down")
+
+    queue.register("ingest", handler, on_failure=lambda job_id, payload: failures.append(job_id))
+
+    async def scenario():
+        await queue.enqueue("job-1", "ingest", {})
+        delays = []
+        while True:
+            job = await queue._next()
+            await queue._execute(job)
+            if db.jobs["job-1"]["status"] == "failed":
+                return delays
+            delays.append(db.jobs["job-1"]["run_after"] - db.now)
+            # Not claimable before the backoff has passed
+            db.now += delays[-1] - 1
+            assert await queue._next() is None
+            db.now += 1
+
+    delays = asyncio.run(scenario())
+    assert delays == [10, 15]  # base * 2**(attempt - 1), capped at job_retry_max_seconds
+    assert db.jobs["job-1"]["attempts"] == 3
+    assert db.jobs["job-1"]["error_message"] == "embedding API down"
+    assert failures == ["job-1"]
+
+def test_retry_delay_is_jittered_around_the_backoff():
+    db = FakeJobsDB()
+    db.add("job-1")
+    queue = make_postgres_queue(db)
+
+    async def scenario():
+        await queue.enqueue("job-1", "ingest", {})
+        await queue._retry(await queue._next(), "boom")
+
+    asyncio.run(scenario())
+    assert 8 <= db.jobs["job-1"]["run_after"] - db.now <= 12
+
+def test_recovery_requeues_expired_leases_and_fails_exhausted_jobs():
+    db = FakeJobsDB()
+    queue = make_postgres_queue(db)
+
+    async def scenario():
+        for job_id in ("expired", "exhausted", "running"):
+            db.add(job_id)
+            await queue.enqueue(job_id, "ingest", {})
+            await queue._next()
+        db.jobs["exhausted"]["attempts"] = 3
+        db.jobs["running"]["locked_until"] = db.now + 120
+        db.now += 61
+        await queue.recover_orphans()
+
+    asyncio.run(scenario())
+    assert db.jobs["expired"]["status"] == "queued"
+    assert db.jobs["expired"]["locked_by"] is None
+    assert db.jobs["exhausted"]["status"] == "failed"
+    assert db.jobs["running"]["status"] == "processing"
+
+def test_redis_redelivers_an_expired_in_flight_id(monkeypatch):
+    db = FakeJobsDB()
+    db.add("job-1")
+    queue = make_redis_queue(monkeypatch, db)
+    queue.visibility_timeout = 30
+
+    async def scenario():
+        await queue.enqueue("job-1", "ingest", {})
+        first = await queue._next()
+        assert await queue._next() is None
+        # The worker dies: its in-flight deadline and its lease both pass
+        await queue.redis.zadd(queue.inflight_key, {"job-1": 0})
+        db.now += 31
+        second = await queue._next()
+        await queue._release(second)
+        return first, second, await queue.redis.zrange(queue.inflight_key, 0, -1)
+
+    first, second, inflight = asyncio.run(scenario())
+    assert (first.id, first.attempts) == ("job-1", 1)
+    assert (second.id, second.attempts) == ("job-1", 2)
+    assert inflight == []
+
+def test_redis_drops_ids_of_finished_jobs(monkeypatch):
+    db = FakeJobsDB()
+    db.add("job-1")
+    queue = make_redis_queue(monkeypatch, db)
+
+    async def scenario():
+        await queue.enqueue("job-1", "ingest", {})
+        db.jobs["job-1"]["status"] = "completed"
+        return await queue._next(), await queue.redis.zrange(queue.inflight_key, 0, -1)
+
+    job, inflight = asyncio.run(scenario())
+    assert job is None
+    assert inflight == []
+
+def test_redis_requeue_never_duplicates_an_id(monkeypatch):
+    queue = make_redis_queue(monkeypatch)
+
+    async def scenario():
+        await queue._push("job-1", 0)
+        await queue._push("job-2", 60)
+        # job-1 is claimed (now in flight), then two recovery passes race
+        assert await queue._claim(keys=[queue.ready_key, queue.delayed_key, queue.inflight_key], args=[0, 30]) == "job-1"
+        await asyncio.gather(queue._requeue("job-1"), queue._requeue("job-1"), queue._requeue("job-2"))
+        return (
+            await queue.redis.lrange(queue.ready_key, 0, -1),
+            await queue.redis.zrange(queue.inflight_key, 0, -1),
+            await queue.redis.zrange(queue.delayed_key, 0, -1)
+        )
+
+    ready, inflight, delayed = asyncio.run(scenario())
+    assert sorted(ready) == ["job-1", "job-2"]
+    assert inflight == []
+    assert delayed == []
@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from services.query_cache import QueryResultCache
+
+class FakeProjects:
+    """projects.corpus_version, counting the reads"""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.reads = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetchval(self, query, project_id):
+        self.reads += 1
+        return self.versions.get(project_id)
+
+def make_cache(db, version_ttl=5):
+    cache = QueryResultCache()
+    cache.enabled = True
+    cache.settings.query_cache_version_ttl_seconds = version_ttl
+    cache.versions.ttl_seconds = version_ttl
+    cache.bind_pool(db)
+    return cache
+
+async def lookup(cache, query="What is the budget?"):
+    version = await cache.corpus_version("project-1")
+    key = None if version is None else cache.key("project-1", version, query, 0.7, 5)
+    return key, cache.get(key)
+
+def test_hits_reuse_the_cached_version_without_a_database_read():
+    db = FakeProjects({"project-1": 1})
+    cache = make_cache(db)
+
+    async def scenario():
+        key, _ = await lookup(cache)
+        cache.set(key, {"answer": "cached"})
+        # Same question, differently spelled
+        return await lookup(cache, "  what is   THE budget?")
+
+    _, hit = asyncio.run(scenario())
+    assert hit == {"answer": "cached"}
+    assert db.reads == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_a_local_ingest_invalidates_immediately():
+    db = FakeProjects({"project-1": 1})
+    cache = make_cache(db)
+
+    async def scenario():
+        key, _ = await lookup(cache)
+        cache.set(key, {"answer": "stale"})
+        db.versions["project-1"] = 2
+        cache.set_corpus_version("project-1", 2)
+        return await lookup(cache)
+
+    key, hit = asyncio.run(scenario())
+    assert key[1] == 2
+    assert hit is None
+
+def test_another_process_ingesting_is_seen_once_the_version_expires(monkeypatch):
+    db = FakeProjects({"project-1": 1})
+    cache = make_cache(db)
+    now = [100.0]
+    monkeypatch.setattr("services.lru_cache.time.monotonic", lambda: now[0])
+
+    async def scenario():
+        key, _ = await lookup(cache)
+        cache.set(key, {"answer": "stale"})
+        db.versions["project-1"] = 2
+        still_cached = (await lookup(cache))[1]
+        now[0] += 6
+        return still_cached, await lookup(cache)
+
+    still_cached, (key, hit) = asyncio.run(scenario())
+    assert still_cached == {"answer": "stale"}
+    assert key[1] == 2
+    assert hit is None
+    assert db.reads == 2
+
+def test_a_zero_version_ttl_reads_the_version_every_time():
+    db = FakeProjects({"project-1": 1})
+    cache = make_cache(db, version_ttl=0)
+
+    async def scenario():
+        cache.set_corpus_version("project-1", 1)
+        for _ in range(3):
+            await lookup(cache)
+
+    asyncio.run(scenario())
+    assert db.reads == 3
+
+def test_nothing_is_cached_when_the_version_is_unknown():
+    cache = make_cache(FakeProjects({}))
+
+    async def scenario():
+        key, _ = await lookup(cache)
+        cache.set(key, {"answer": "orphan"})
+        return key
+
+    assert asyncio.run(scenario()) is None
+    assert len(cache.entries) == 0
@@ -0,0 +1,106 @@
+import asyncio
+import types
+
+import pytest
+
+from config.settings import Settings
+from services import rate_limiter
+from services.rate_limiter import RateLimiter, RateLimitExceeded
+
+def make_limiter(monkeypatch, **settings):
+    monkeypatch.setattr(rate_limiter, "Settings", lambda: Settings(
+        rate_limit_enabled=True, requests_per_minute=60, rate_limit_burst=3, **settings
+    ))
+    return RateLimiter()
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(rate_limiter, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def take(limiter, caller, endpoint="query"):
+    asyncio.run(limiter.check(caller, endpoint))
+
+def test_burst_is_allowed_then_rejected_until_a_token_refills(monkeypatch, clock):
+    limiter = make_limiter(monkeypatch, rate_limit_backend="memory")
+    for _ in range(3):
+        take(limiter, "project:a")
+
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        take(limiter, "project:a")
+    assert exceeded.value.retry_after == pytest.approx(1.0)
+
+    clock.now += 0.5
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        take(limiter, "project:a")
+    assert exceeded.value.retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    take(limiter, "project:a")
+    assert (limiter.allowed, limiter.rejected) == (4, 2)
+
+def test_refill_is_capped_at_the_burst(monkeypatch, clock):
+    limiter = make_limiter(monkeypatch, rate_limit_backend="memory")
+    take(limiter, "project:a")
+    clock.now += 3600
+    for _ in range(3):
+        take(limiter, "project:a")
+    with pytest.raises(RateLimitExceeded):
+        take(limiter, "project:a")
+
+def test_buckets_are_per_caller_and_endpoint(monkeypatch, clock):
+    limiter = make_limiter(monkeypatch, rate_limit_backend="memory")
+    for _ in range(3):
+        take(limiter, "project:a")
+
+    take(limiter, "project:b")
+    take(limiter, "project:a", endpoint="draft")
+    with pytest.raises(RateLimitExceeded):
+        take(limiter, "project:a")
+
+def test_disabled_limiter_allows_everything(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "Settings", lambda: Settings(rate_limit_enabled=False))
+    limiter = RateLimiter()
+    for _ in range(100):
+        take(limiter, "project:a")
+
+def make_redis_limiter(monkeypatch, server):
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis.asyncio
+
+    monkeypatch.setattr(
+        redis.asyncio, "from_url",
+        lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    )
+    return make_limiter(monkeypatch, rate_limit_backend="redis", redis_url="redis://test")
+
+def test_redis_buckets_are_shared_between_processes(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lua scripting
+    server = fakeredis.FakeServer()
+    first, second = make_redis_limiter(monkeypatch, server), make_redis_limiter(monkeypatch, server)
+
+    async def scenario():
+        for limiter in (first, second, first):
+            await limiter.check("project:a", "query")
+        with pytest.raises(RateLimitExceeded) as exceeded:
+            await second.check("project:a", "query")
+        return exceeded.value.retry_after
+
+    retry_after = asyncio.run(scenario())
+    assert 0 < retry_after <= 1.0
+    assert len(first.buckets) == len(second.buckets) == 0
+
+def test_redis_errors_fall_back_to_local_buckets(monkeypatch, clock):
+    fakeredis = pytest.importorskip("fakeredis")
+    limiter = make_redis_limiter(monkeypatch, fakeredis.FakeServer())
+
+    async def unreachable(**kwargs):
+        raise ConnectionError("redis is down")
+
+    limiter._take_script = unreachable
+    for _ in range(3):
+        take(limiter, "project:a")
+    with pytest.raises(RateLimitExceeded):
+        take(limiter, "project:a")
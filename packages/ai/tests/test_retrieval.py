@@ -0,0 +1,115 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+from services.retrieval import RetrievalService
+
+BIG_PROJECT = str(uuid.uuid4())
+SMALL_PROJECT = str(uuid.uuid4())
+
+class FakePgvector:
+    """document_chunks behind a single global HNSW index, as on pgvector 0.5.
+
+    An index-ordered query gets the ``hnsw.ef_search`` nearest rows of the
+    whole table, and the project filter is applied to those afterwards; a
+    query ordered by ``distance + 0`` can't use the index and is exact.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows  # (id, project_id, embedding)
+        self.settings = {}
+        self.exact_queries = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, names, values):
+        self.settings.update(zip(names, values))
+
+    async def fetchval(self, query, project_id, limit):
+        return min(sum(1 for _, project, _ in self.rows if project == project_id), limit)
+
+    async def fetch(self, query, embedding, project_id, threshold, candidates, max_results):
+        query_vector = np.asarray(embedding) / np.linalg.norm(embedding)
+        scored = sorted(
+            ((1 - float(vector @ query_vector), chunk_id, project) for chunk_id, project, vector in self.rows),
+            key=lambda row: row[0]
+        )
+        if ") + 0" in query:
+            self.exact_queries += 1
+        else:
+            scored = scored[:int(self.settings["hnsw.ef_search"])]
+        nearest = [row for row in scored if row[2] == project_id][:candidates]
+        return [
+            {"id": chunk_id, "content": f"chunk {chunk_id}", "metadata": "{}", "similarity": 1 - distance}
+            for distance, chunk_id, _ in nearest
+            if 1 - distance > threshold
+        ][:max_results]
+
+def make_rows(rng, project_id, count, center):
+    vectors = center + 0.1 * rng.normal(size=(count, len(center)))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [(uuid.uuid4(), project_id, vector) for vector in vectors]
+
+def make_service(rows, exact_max_chunks):
+    service = RetrievalService()
+    service.settings.pgvector_ef_search = 40
+    service.settings.pgvector_exact_search_max_chunks = exact_max_chunks
+    service.settings.embedding_index_type = "vector"
+    service.db_pool = FakePgvector(rows)
+    return service
+
+def corpus():
+    rng = np.random.default_rng(0)
+    query = np.zeros(16)
+    query[0] = 1.0
+    # The big project sits right next to the query, the small one further away,
+    # so every index candidate belongs to the big project
+    elsewhere = np.zeros(16)
+    elsewhere[1] = 1.0
+    rows = make_rows(rng, BIG_PROJECT, 2000, query) + make_rows(rng, SMALL_PROJECT, 25, 0.5 * query + elsewhere)
+    return rows, query.tolist()
+
+def test_small_project_gets_full_top_k():
+    rows, query = corpus()
+    service = make_service(rows, exact_max_chunks=100)
+
+    chunks = asyncio.run(service._search_pgvector(SMALL_PROJECT, query, -1.0, 10))
+
+    assert len(chunks) == 10
+    assert service.db_pool.exact_queries == 1
+    small_ids = {str(chunk_id) for chunk_id, project, _ in rows if project == SMALL_PROJECT}
+    assert {chunk["id"] for chunk in chunks} <= small_ids
+    similarities = [chunk["similarity"] for chunk in chunks]
+    assert similarities == sorted(similarities, reverse=True)
+
+def test_small_project_comes_back_short_through_the_global_index():
+    # What the exact path avoids
+    rows, query = corpus()
+    service = make_service(rows, exact_max_chunks=0)
+
+    assert asyncio.run(service._search_pgvector(SMALL_PROJECT, query, -1.0, 10)) == []
+
+def test_large_project_uses_the_index():
+    rows, query = corpus()
+    service = make_service(rows, exact_max_chunks=100)
+
+    chunks = asyncio.run(service._search_pgvector(BIG_PROJECT, query, -1.0, 10))
+
+    assert len(chunks) == 10
+    assert service.db_pool.exact_queries == 0
+
+def test_ef_search_is_capped_at_pgvector_limit():
+    rows, query = corpus()
+    service = make_service(rows, exact_max_chunks=0)
+
+    asyncio.run(service._search_pgvector(BIG_PROJECT, query, -1.0, 500, ef_search=5000))
+
+    assert service.db_pool.settings["hnsw.ef_search"] == "1000"
@@ -0,0 +1,43 @@
+"""Background job worker.
+
+Runs ingest and regeneration jobs off the queue in a separate process, so
+they survive API restarts and don't share the API's event loop. Needs
+JOB_QUEUE_BACKEND=postgres or redis (with the inline backend jobs run in the
+API process instead) and the same UPLOAD_STAGING_DIR as the API, since
+ingest jobs read the uploads the API staged there.
+
+    python worker.py
+
+Prometheus metrics for the jobs it runs are served on WORKER_METRICS_PORT.
+"""
+import asyncio
+import logging
+import signal
+
+from prometheus_client import start_http_server
+
+import main
+
+logger = logging.getLogger("worker")
+
+async def run():
+    if main.job_queue.backend == "inline":
+        raise SystemExit("JOB_QUEUE_BACKEND is inline; jobs run in the API process")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    if main.settings.worker_metrics_port:
+        start_http_server(main.settings.worker_metrics_port)
+
+    await main.startup_event()
+    try:
+        await main.job_queue.run_worker(stop)
+    finally:
+        logger.info("Worker stopping")
+        await main.shutdown_event()
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -48,6 +48,7 @@ CREATE TABLE projects (
     grant_data JSONB DEFAULT '{}',
     regenerations_used INTEGER DEFAULT 0,
     max_regenerations INTEGER DEFAULT 10,
+    corpus_version BIGINT NOT NULL DEFAULT 0, -- bumped whenever ingest changes the project's chunks
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -73,6 +74,7 @@ CREATE TABLE files (
     file_size BIGINT NOT NULL,
     s3_bucket VARCHAR(255) NOT NULL,
     s3_key VARCHAR(500) NOT NULL,
+    content_hash CHAR(64), -- sha256 of the uploaded bytes; re-ingest skips unchanged files
     uploaded_by UUID NOT NULL REFERENCES users(id),
     uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     processed_at TIMESTAMP WITH TIME ZONE,
@@ -88,10 +90,31 @@ CREATE TABLE document_chunks (
     chunk_index INTEGER NOT NULL,
     content TEXT NOT NULL,
     metadata JSONB DEFAULT '{}',
-    embedding vector(1536), -- OpenAI text-embedding-3-small dimension
+    content_hash CHAR(64), -- sha256 of the normalized chunk text; re-ingest keeps matching chunks
+    embedding vector(1536), -- OpenAI text-embedding-3-small dimension (set to EMBEDDING_DIMENSIONS when shortened)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed embedding cache shared by ingest and query
+-- (untyped vector so the cache works for any embedding model/dimension)
+CREATE TABLE embedding_cache (
+    model VARCHAR(100) NOT NULL,
+    text_hash CHAR(64) NOT NULL, -- sha256 of whitespace-normalized text
+    embedding vector NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, text_hash)
+);
+
+-- Completion cache for deterministic LLM calls (AI service, see services/completion_cache.py)
+CREATE TABLE llm_completion_cache (
+    cache_key CHAR(64) PRIMARY KEY, -- sha256 of (model, messages, temperature, max_tokens)
+    call_site VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    completion TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 -- Processing jobs
 CREATE TABLE processing_jobs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -103,6 +126,13 @@ CREATE TABLE processing_jobs (
     input_data JSONB DEFAULT '{}',
     result JSONB DEFAULT '{}',
     error_message TEXT,
+    -- Job queue state (AI service, see services/job_queue.py)
+    queue_payload JSONB,
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100),
+    locked_until TIMESTAMP WITH TIME ZONE,
     started_at TIMESTAMP WITH TIME ZONE,
     completed_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
@@ -118,6 +148,15 @@ CREATE TABLE regeneration_log (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Regenerations per user and (UTC) month, kept by a trigger on
+-- regeneration_log so quota checks never count the log
+CREATE TABLE regeneration_quota_usage (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period DATE NOT NULL, -- first day of the month
+    used INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period)
+);
+
 -- Compliance rules
 CREATE TABLE compliance_rules (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -174,19 +213,28 @@ CREATE INDEX idx_projects_organization ON projects(organization_id);
 CREATE INDEX idx_project_collaborators_project ON project_collaborators(project_id);
 CREATE INDEX idx_project_collaborators_user ON project_collaborators(user_id);
 CREATE INDEX idx_files_project ON files(project_id);
+CREATE INDEX idx_files_project_hash ON files(project_id, content_hash);
 CREATE INDEX idx_document_chunks_file ON document_chunks(file_id);
 CREATE INDEX idx_document_chunks_project ON document_chunks(project_id);
 CREATE INDEX idx_processing_jobs_project ON processing_jobs(project_id);
 CREATE INDEX idx_processing_jobs_user ON processing_jobs(user_id);
 CREATE INDEX idx_processing_jobs_status ON processing_jobs(status);
+CREATE INDEX idx_processing_jobs_queue ON processing_jobs(run_after) WHERE status IN ('queued', 'processing') AND queue_payload IS NOT NULL;
+CREATE INDEX idx_llm_completion_cache_expires ON llm_completion_cache(expires_at);
 CREATE INDEX idx_regeneration_log_user_date ON regeneration_log(user_id, created_at);
 CREATE INDEX idx_project_compliance_project ON project_compliance(project_id);
 CREATE INDEX idx_user_sessions_token ON user_sessions(session_token);
 CREATE INDEX idx_audit_log_user ON audit_log(user_id);
 CREATE INDEX idx_audit_log_resource ON audit_log(resource_type, resource_id);
 
--- Vector similarity search index
-CREATE INDEX idx_document_chunks_embedding ON document_chunks USING ivfflat(embedding vector_cosine_ops) WITH (lists = 100);
+-- Vector similarity search index. HNSW needs no training data, so unlike
+-- ivfflat it can be created on the empty table and stays accurate as chunks
+-- arrive. Queries must ORDER BY the distance with a LIMIT to use it.
+CREATE INDEX idx_document_chunks_embedding ON document_chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+-- With EMBEDDING_INDEX_TYPE=halfvec use a float16 expression index instead,
+-- half the size of the float32 one (pgvector >= 0.7); the AI service
+-- re-ranks its candidates against the float32 column (EMBEDDING_RESCORE):
+-- CREATE INDEX idx_document_chunks_embedding ON document_chunks USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);
 
 -- Triggers for updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -201,27 +249,47 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users FOR EACH ROW EXECU
 CREATE TRIGGER update_organizations_updated_at BEFORE UPDATE ON organizations FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_projects_updated_at BEFORE UPDATE ON projects FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Keep the monthly regeneration counter in step with the log
+CREATE OR REPLACE FUNCTION count_regeneration()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO regeneration_quota_usage (user_id, period, used)
+    VALUES (NEW.user_id, DATE_TRUNC('month', NEW.created_at AT TIME ZONE 'UTC')::DATE, 1)
+    ON CONFLICT (user_id, period) DO UPDATE SET used = regeneration_quota_usage.used + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER count_regeneration_log AFTER INSERT ON regeneration_log FOR EACH ROW EXECUTE FUNCTION count_regeneration();
+
 -- Function to check regeneration quota
 CREATE OR REPLACE FUNCTION check_regeneration_quota(user_uuid UUID)
 RETURNS TABLE(used INTEGER, limit_val INTEGER, reset_date TIMESTAMP WITH TIME ZONE) AS $$
+DECLARE
+    current_period DATE := DATE_TRUNC('month', CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::DATE;
 BEGIN
     RETURN QUERY
     SELECT 
-        COUNT(*)::INTEGER as used,
-        10 as limit_val, -- Default limit, can be made configurable
-        (DATE_TRUNC('month', CURRENT_TIMESTAMP) + INTERVAL '1 month')::TIMESTAMP WITH TIME ZONE as reset_date
-    FROM regeneration_log 
-    WHERE user_id = user_uuid 
-    AND created_at >= DATE_TRUNC('month', CURRENT_TIMESTAMP);
+        COALESCE((
+            SELECT u.used FROM regeneration_quota_usage u
+            WHERE u.user_id = user_uuid AND u.period = current_period
+        ), 0) as used,
+        10 as limit_val, -- Default limit, can be made configurable (REGENERATION_MONTHLY_LIMIT in the AI service)
+        ((current_period + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC') as reset_date;
 END;
 $$ LANGUAGE plpgsql;
 
--- Function for vector similarity search
+-- Function for vector similarity search. The inner query is a plain
+-- ORDER BY distance LIMIT so the HNSW index drives it; the similarity
+-- threshold is applied to the over-fetched candidates afterwards (a
+-- threshold in the WHERE clause would force a distance on every row).
+-- Projects with at most 10000 chunks are ranked exactly instead.
 CREATE OR REPLACE FUNCTION search_similar_chunks(
     query_embedding vector(1536),
     project_uuid UUID,
     similarity_threshold FLOAT DEFAULT 0.7,
-    max_results INTEGER DEFAULT 10
+    max_results INTEGER DEFAULT 10,
+    ef_search INTEGER DEFAULT 100
 )
 RETURNS TABLE(
     chunk_id UUID,
@@ -229,17 +297,71 @@ RETURNS TABLE(
     similarity FLOAT,
     metadata JSONB
 ) AS $$
+DECLARE
+    -- Same default as PGVECTOR_EXACT_SEARCH_MAX_CHUNKS in the AI service
+    exact_search_max_chunks CONSTANT INTEGER := 10000;
+    small_project BOOLEAN;
 BEGIN
+    SELECT COUNT(*) <= exact_search_max_chunks INTO small_project
+    FROM (
+        SELECT 1 FROM document_chunks dc
+        WHERE dc.project_id = project_uuid
+        LIMIT exact_search_max_chunks + 1
+    ) project_chunks;
+
+    IF small_project THEN
+        -- The global HNSW index filters its ef_search candidates by project
+        -- afterwards, which leaves a small project short. "+ 0" keeps the
+        -- planner off that index so the project's rows are ranked exactly.
+        RETURN QUERY
+        SELECT
+            dc.id,
+            dc.content,
+            1 - (dc.embedding <=> query_embedding) as similarity,
+            dc.metadata
+        FROM document_chunks dc
+        WHERE dc.project_id = project_uuid
+        AND 1 - (dc.embedding <=> query_embedding) > similarity_threshold
+        ORDER BY (dc.embedding <=> query_embedding) + 0
+        LIMIT max_results;
+        RETURN;
+    END IF;
+
+    -- pgvector rejects ef_search above 1000 (PGVECTOR_MAX_EF_SEARCH in the AI service)
+    PERFORM set_config('hnsw.ef_search', LEAST(GREATEST(ef_search, max_results * 4), 1000)::TEXT, true);
     RETURN QUERY
+    WITH nearest AS (
+        SELECT dc.id, dc.content, dc.metadata, dc.embedding <=> query_embedding AS distance
+        FROM document_chunks dc
+        WHERE dc.project_id = project_uuid
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT max_results * 4
+    )
     SELECT 
-        dc.id,
-        dc.content,
-        1 - (dc.embedding <=> query_embedding) as similarity,
-        dc.metadata
-    FROM document_chunks dc
-    WHERE dc.project_id = project_uuid
-    AND 1 - (dc.embedding <=> query_embedding) > similarity_threshold
-    ORDER BY dc.embedding <=> query_embedding
+        n.id,
+        n.content,
+        1 - n.distance as similarity,
+        n.metadata
+    FROM nearest n
+    WHERE 1 - n.distance > similarity_threshold
+    ORDER BY n.distance
     LIMIT max_results;
 END;
+$$ LANGUAGE plpgsql;
+
+-- Optional per-project HNSW index for very large projects. The planner picks
+-- it when the project id is known at plan time (custom plans), and it only
+-- contains that project's chunks, so no rows are lost to the project filter.
+CREATE OR REPLACE FUNCTION create_project_vector_index(project_uuid UUID)
+RETURNS TEXT AS $$
+DECLARE
+    index_name TEXT := 'idx_document_chunks_embedding_' || replace(project_uuid::TEXT, '-', '');
+BEGIN
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS %I ON document_chunks USING hnsw (embedding vector_cosine_ops) '
+        'WITH (m = 16, ef_construction = 64) WHERE project_id = %L',
+        index_name, project_uuid
+    );
+    RETURN index_name;
+END;
 $$ LANGUAGE plpgsql;
\ No newline at end of file